@@ -0,0 +1,114 @@
+"""Offline recall / latency / memory benchmark for the FAISS index types.
+
+Usage:
+    python -m backend.benchmarks.ann_benchmark --n 200000 --dim 384
+    python -m backend.benchmarks.ann_benchmark --embeddings saved.npy --types flat hnsw --ef-search 32 64 128
+"""
+import argparse
+import faiss
+import json
+import numpy as np
+import time
+import logging
+from backend.modules.index_factory import INDEX_TYPES, build_index, index_config, search_parameters
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def synthetic_embeddings(n, dim, clusters=256, seed=0):
+    """Clustered unit vectors that behave more like sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, n)
+    vectors = centers[assignments] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(ground_truth, found):
+    """Average fraction of the true top-k that an index returned."""
+    hits = sum(len(set(gt) & set(row)) for gt, row in zip(ground_truth, found))
+    return hits / ground_truth.size
+
+
+def time_queries(index, queries, k, params):
+    """Search one query at a time, the way /process_query does, and return latencies in ms."""
+    latencies = []
+    for row in range(queries.shape[0]):
+        start = time.perf_counter()
+        index.search(queries[row:row + 1], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+    _, found = index.search(queries, k, params=params)
+    return np.array(latencies), found
+
+
+def run(vectors, queries, k, index_types, nprobes, ef_searches):
+    ids = np.arange(vectors.shape[0], dtype=np.int64)
+    flat, _ = build_index(vectors, ids, "flat")
+    _, ground_truth = flat.search(queries, k)
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index, params = build_index(vectors, ids, index_type, index_config(index_type))
+        build_seconds = time.perf_counter() - start
+        memory_mb = faiss.serialize_index(index).nbytes / 1e6
+        if params["type"] == "ivf_flat" or params["type"] == "ivf_pq":
+            knobs = [{"nprobe": nprobe} for nprobe in nprobes]
+        elif params["type"] == "hnsw":
+            knobs = [{"ef_search": ef} for ef in ef_searches]
+        else:
+            knobs = [{}]
+        for knob in knobs:
+            latencies, found = time_queries(index, queries, k, search_parameters(index, **knob))
+            result = {
+                "type": index_type,
+                "factory": params["factory"],
+                **knob,
+                f"recall@{k}": round(recall_at_k(ground_truth, found), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "memory_mb": round(memory_mb, 2),
+                "build_s": round(build_seconds, 2),
+            }
+            logger.info(json.dumps(result))
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help="Saved .npy embedding matrix; synthetic vectors are used if omitted")
+    parser.add_argument("--n", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic embedding dimension")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 64, 256])
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.ascontiguousarray(np.load(args.embeddings), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+    else:
+        vectors = synthetic_embeddings(args.n + args.queries, args.dim)
+    # Queries are held out of the corpus so flat search is not trivially exact
+    queries, vectors = vectors[:args.queries].copy(), vectors[args.queries:].copy()
+    logger.info(f"Benchmarking {args.types} on {vectors.shape[0]} x {vectors.shape[1]} vectors, {queries.shape[0]} queries")
+
+    results = run(vectors, queries, args.k, args.types, args.nprobe, args.ef_search)
+    print(f"{'type':<10}{'knob':<16}{'recall':>8}{'p50 ms':>10}{'p99 ms':>10}{'MB':>10}{'build s':>10}")
+    for r in results:
+        knob = f"nprobe={r['nprobe']}" if "nprobe" in r else f"ef={r['ef_search']}" if "ef_search" in r else "-"
+        print(f"{r['type']:<10}{knob:<16}{r[f'recall@{args.k}']:>8.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{r['memory_mb']:>10.2f}{r['build_s']:>10.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
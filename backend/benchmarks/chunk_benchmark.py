@@ -0,0 +1,142 @@
+"""Chunking throughput benchmark: the original full-pipeline chunker against each segmenter.
+
+Usage:
+    python -m backend.benchmarks.chunk_benchmark --pages 400
+    python -m backend.benchmarks.chunk_benchmark --pdf policy.pdf --segmenters sentencizer regex --output chunk.json
+"""
+import argparse
+import json
+import os
+import time
+import logging
+import numpy as np
+from backend.utils.chunker import SEGMENTERS, chunk_pages
+from backend.utils.models import get_nlp
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CLAUSE_TEMPLATES = [
+    "The insured person is covered for {procedure} after a waiting period of {months} months.",
+    "Claims for {procedure} require pre-approval from the insurer at least {days} days in advance.",
+    "Hospitalization expenses up to Rs. {amount} are payable under section {section}.",
+    "Treatment at a non-network hospital is reimbursed at {percent}% of the approved amount.",
+    "Any pre-existing condition declared at inception is excluded for the first {months} months of the policy.",
+]
+PROCEDURES = ["knee surgery", "cataract surgery", "appendectomy", "cardiac bypass", "dialysis", "maternity care"]
+
+
+def synthetic_pages(pages, sentences_per_page=40, seed=0):
+    """Policy-like pages of templated clauses with paragraph breaks."""
+    rng = np.random.default_rng(seed)
+    result = []
+    for page_no in range(1, pages + 1):
+        sentences = []
+        for i in range(sentences_per_page):
+            template = CLAUSE_TEMPLATES[rng.integers(len(CLAUSE_TEMPLATES))]
+            sentences.append(template.format(
+                procedure=PROCEDURES[rng.integers(len(PROCEDURES))], months=int(rng.integers(1, 48)),
+                days=int(rng.integers(1, 30)), amount=int(rng.integers(1, 50)) * 10000,
+                section=f"{rng.integers(1, 20)}.{rng.integers(1, 9)}", percent=int(rng.integers(50, 100)),
+            ))
+            if i % 8 == 7:
+                sentences.append("\n\n")
+        result.append((page_no, " ".join(sentences)))
+    return result
+
+
+def legacy_chunk_text(text, chunk_size):
+    """The chunker as it was: full en_core_web_lg pipeline and string concatenation."""
+    doc = get_nlp()(text)
+    chunks = []
+    current_chunk = ""
+    for sent in doc.sents:
+        sent_text = sent.text.strip()
+        if not sent_text:
+            continue
+        if len(sent_text) > chunk_size:
+            temp_chunk = ""
+            for word in sent_text.split():
+                if len(temp_chunk) + len(word) + 1 <= chunk_size:
+                    temp_chunk += word + " "
+                else:
+                    if temp_chunk:
+                        chunks.append(temp_chunk.strip())
+                    temp_chunk = word + " "
+            if temp_chunk:
+                chunks.append(temp_chunk.strip())
+        elif len(current_chunk) + len(sent_text) + 1 <= chunk_size:
+            current_chunk += sent_text + " "
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = sent_text + " "
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def run(pages, chunk_size, overlap, unit, segmenters, include_legacy=True):
+    results = []
+    chars = sum(len(text) for _, text in pages)
+    runs = ([("legacy", None)] if include_legacy else []) + [(s, s) for s in segmenters]
+    for name, segmenter in runs:
+        # Load models outside the timed region
+        if segmenter == "sentencizer":
+            list(chunk_pages(pages[:1], chunk_size, overlap, unit, segmenter))
+        elif segmenter != "regex":
+            get_nlp()
+        start = time.perf_counter()
+        if segmenter is None:
+            chunks = [chunk for _, text in pages if text.strip() for chunk in legacy_chunk_text(text, chunk_size)]
+        else:
+            chunks = [chunk for _, _, chunk in chunk_pages(pages, chunk_size, overlap, unit, segmenter)]
+        seconds = time.perf_counter() - start
+        result = {
+            "chunker": name,
+            "pages": len(pages),
+            "chunks": len(chunks),
+            "mean_chunk_chars": round(float(np.mean([len(c) for c in chunks])), 1) if chunks else 0,
+            "seconds": round(seconds, 3),
+            "pages_per_s": round(len(pages) / seconds, 1),
+            "mb_per_s": round(chars / seconds / 1e6, 2),
+        }
+        logger.info(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="Chunk this PDF; synthetic policy pages are used if omitted")
+    parser.add_argument("--pages", type=int, default=400, help="Synthetic page count")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE", 100)))
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--unit", default="chars", choices=("chars", "words"))
+    parser.add_argument("--segmenters", nargs="+", default=list(SEGMENTERS), choices=SEGMENTERS)
+    parser.add_argument("--no-legacy", action="store_true", help="Skip the original full-pipeline chunker")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.pdf:
+        from backend.utils.pdf_extractor import iter_pdf_pages
+        pages = list(iter_pdf_pages(args.pdf))
+    else:
+        pages = synthetic_pages(args.pages)
+    logger.info(f"Benchmarking chunkers on {len(pages)} pages, {sum(len(t) for _, t in pages)} characters")
+
+    results = run(pages, args.chunk_size, args.overlap, args.unit, args.segmenters, not args.no_legacy)
+    legacy = next((r for r in results if r["chunker"] == "legacy"), None)
+    print(f"{'chunker':<14}{'chunks':>8}{'mean chars':>12}{'seconds':>10}{'pages/s':>10}{'speedup':>10}")
+    for r in results:
+        speedup = f"{legacy['seconds'] / r['seconds']:.1f}x" if legacy else "-"
+        print(f"{r['chunker']:<14}{r['chunks']:>8}{r['mean_chunk_chars']:>12}{r['seconds']:>10.3f}"
+              f"{r['pages_per_s']:>10.1f}{speedup:>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
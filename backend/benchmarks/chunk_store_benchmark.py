@@ -0,0 +1,137 @@
+"""Chunk store benchmark: bytes per chunk and lookup latency, memory-mapped store against Redis keys.
+
+Needs a Redis server (REDIS_HOST/REDIS_PORT) for the Redis side; with --fake-redis an
+in-process fakeredis server is used instead, which times lookups without the network
+round trip and cannot report memory usage.
+
+Usage:
+    python -m backend.benchmarks.chunk_store_benchmark --chunks 100000
+    python -m backend.benchmarks.chunk_store_benchmark --chunks 20000 --fake-redis --output store.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import logging
+import numpy as np
+from backend.benchmarks.chunk_benchmark import synthetic_pages
+from backend.modules.chunk_store import MmapChunkStore, RedisChunkStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+# Keys sampled for MEMORY USAGE; the per-key figure is extrapolated to the whole store
+MEMORY_SAMPLE = 1000
+
+
+def synthetic_chunks(count, chunk_chars=200):
+    """Policy-like chunks of about chunk_chars characters, with page numbers."""
+    texts, pages = [], []
+    # Synthetic pages run to well over 2000 characters, so this many always suffices
+    page_count = count * chunk_chars // 2000 + 1
+    for page_no, text in synthetic_pages(page_count):
+        for start in range(0, len(text) - chunk_chars, chunk_chars):
+            texts.append(text[start:start + chunk_chars])
+            pages.append(page_no)
+    return texts[:count], pages[:count]
+
+
+def redis_bytes(redis_client, store, ids):
+    """Mean MEMORY USAGE of a sample of chunk keys, or None if the server cannot report it."""
+    sample = ids[:MEMORY_SAMPLE]
+    try:
+        sizes = [redis_client.memory_usage(store.key(idx)) for idx in sample]
+    except Exception as e:
+        logger.warning(f"Redis memory usage unavailable: {str(e)}")
+        return None
+    sizes = [size for size in sizes if size]
+    return float(np.mean(sizes)) if sizes else None
+
+
+def time_lookups(store, ids, k, rounds, seed=0):
+    """Latencies in ms of `rounds` random k-id lookups."""
+    rng = np.random.default_rng(seed)
+    store.get(ids[:k])
+    latencies = []
+    for _ in range(rounds):
+        batch = rng.choice(ids, size=k, replace=False)
+        start = time.perf_counter()
+        texts = store.get(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(text is None for text in texts):
+            raise RuntimeError(f"{type(store).__name__} lost a chunk")
+    return latencies
+
+
+def run(chunks, k, rounds, fake_redis=False):
+    texts, pages = synthetic_chunks(chunks)
+    ids = np.arange(len(texts), dtype=np.int64)
+    docs = np.array_split(np.arange(len(texts)), max(1, len(texts) // 500))
+    logger.info(f"Benchmarking {len(texts)} chunks of {np.mean([len(t) for t in texts]):.0f} characters")
+
+    if fake_redis:
+        import fakeredis
+        redis_client = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        import redis
+        redis_client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", 6379)), decode_responses=True
+        )
+    workdir = tempfile.mkdtemp(prefix="hackrx-chunk-store-")
+    stores = [("mmap", MmapChunkStore(workdir, refresh_interval=60)), ("redis", RedisChunkStore(redis_client))]
+
+    results = []
+    for name, store in stores:
+        start = time.perf_counter()
+        for n, rows in enumerate(docs):
+            store.put(f"bench_{n}", ids[rows], [texts[i] for i in rows], [pages[i] for i in rows])
+        write_seconds = time.perf_counter() - start
+        if name == "mmap":
+            stats = store.stats()
+            per_chunk = (stats["blob_bytes"] + stats["record_bytes"]) / len(texts)
+        else:
+            per_chunk = redis_bytes(redis_client, store, ids)
+        latencies = time_lookups(store, ids, k, rounds)
+        result = {
+            "store": name,
+            "chunks": len(texts),
+            "bytes_per_chunk": round(per_chunk, 1) if per_chunk is not None else None,
+            "write_chunks_per_s": round(len(texts) / write_seconds, 1),
+            "k": k,
+        }
+        for p in PERCENTILES:
+            result[f"lookup_p{p}_ms"] = round(float(np.percentile(latencies, p)), 4)
+        logger.info(json.dumps(result))
+        results.append(result)
+        if name == "redis":
+            for n in range(len(docs)):
+                store.delete_doc(f"bench_{n}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000, help="Synthetic chunk count")
+    parser.add_argument("--k", type=int, default=5, help="Ids fetched per lookup, as in one query")
+    parser.add_argument("--rounds", type=int, default=2000, help="Timed lookups per store")
+    parser.add_argument("--fake-redis", action="store_true", help="Use an in-process fakeredis server")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.chunks, args.k, args.rounds, args.fake_redis)
+    print(f"{'store':<8}{'chunks':>9}{'bytes/chunk':>13}{'writes/s':>12}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for r in results:
+        per_chunk = f"{r['bytes_per_chunk']:.1f}" if r["bytes_per_chunk"] is not None else "-"
+        print(f"{r['store']:<8}{r['chunks']:>9}{per_chunk:>13}{r['write_chunks_per_s']:>12.1f}"
+              + "".join(f"{r[f'lookup_p{p}_ms']:>10.4f}" for p in PERCENTILES))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
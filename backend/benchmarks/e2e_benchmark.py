@@ -0,0 +1,307 @@
+"""End-to-end benchmark: ingest a synthetic policy corpus, then load-test /process_query.
+
+Runs offline. Redis is replaced by an in-process fakeredis server, the LLM
+by the stub (LLM_PROVIDER=stub), and the index lives in a temporary
+directory. spaCy and the embedding model are the real, configured ones.
+
+Usage:
+    python -m backend.benchmarks.e2e_benchmark
+    python -m backend.benchmarks.e2e_benchmark --docs 5 --pages 10 --concurrency 1 8 --output e2e.json
+    python -m backend.benchmarks.e2e_benchmark --output e2e.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import time
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+AGES = ["25M", "32F", "46M", "58F", "63M"]
+CITIES = ["Pune", "Mumbai", "Delhi", "Chennai", "Bengaluru"]
+QUERY_PROCEDURES = ["knee surgery", "appendectomy", "cataract surgery", "joint replacement surgery", "dialysis"]
+PERCENTILES = (50, 95, 99)
+
+
+def use_fake_redis():
+    """Point every Redis client the backend creates at one shared in-process fakeredis server.
+
+    Must run before any backend module is imported: the modules build their Redis
+    clients at import time (they only connect on first use), and those clients
+    must already be fakeredis ones.
+    """
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("The end-to-end benchmark needs fakeredis: pip install -r backend/requirements-dev.txt")
+    import redis
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+
+    def sync_client(*args, decode_responses=False, **kwargs):
+        return fakeredis.FakeRedis(server=server, decode_responses=decode_responses)
+
+    def async_client(*args, connection_pool=None, decode_responses=False, **kwargs):
+        decode_responses = (connection_pool or {}).get("decode_responses", decode_responses)
+        return fakeredis.FakeAsyncRedis(server=server, decode_responses=decode_responses)
+
+    redis.Redis = sync_client
+    redis.asyncio.ConnectionPool = lambda *args, **kwargs: kwargs
+    redis.asyncio.Redis = async_client
+
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, line_chars=95, lines_per_page=60):
+    """Write a text-only PDF with one page per entry of `pages`; no PDF library needed."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for text in pages:
+        lines = []
+        for paragraph in text.split("\n"):
+            words, line = paragraph.split(), ""
+            for word in words:
+                if line and len(line) + len(word) + 1 > line_chars:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = f"{line} {word}" if line else word
+            lines.append(line)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+            f"({_pdf_string(line)}) Tj T*" for line in lines[:lines_per_page]
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {len(objects)} 0 R >>".encode()
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def synthetic_corpus(directory, docs, pages, seed=0):
+    """Write `docs` policy PDFs of `pages` pages each; returns their paths."""
+    from backend.benchmarks.chunk_benchmark import synthetic_pages
+    paths = []
+    for doc in range(docs):
+        path = os.path.join(directory, f"policy_{doc:03d}.pdf")
+        # A page of templated clauses fits on one PDF page at 9pt
+        write_pdf(path, [text for _, text in synthetic_pages(pages, sentences_per_page=20, seed=seed + doc)])
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        f"{AGES[rng.integers(len(AGES))]}, {QUERY_PROCEDURES[rng.integers(len(QUERY_PROCEDURES))]} in "
+        f"{CITIES[rng.integers(len(CITIES))]}, {int(rng.integers(1, 48))}-month policy"
+        for _ in range(n)
+    ]
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=np.float64) * 1000
+    if not values.size:
+        return {}
+    result = {"mean_ms": round(float(values.mean()), 2)}
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = round(float(np.percentile(values, p)), 2)
+    return result
+
+
+def _stage_summary(timings):
+    """Per-stage latency over requests that ran the stage."""
+    stages = {}
+    for request_timings in timings:
+        for stage, seconds in request_timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: {"requests": len(values), **_summary(values)} for stage, values in sorted(stages.items())}
+
+
+def ingest(paths):
+    from backend.modules.doc_processor import process_document
+    from backend.utils.metrics import start_request
+    from backend.utils.pdf_extractor import count_pages
+    pages = sum(count_pages(path) for path in paths)
+    chunks = 0
+    timings = []
+    start = time.perf_counter()
+    for path in paths:
+        _, doc_timings = start_request()
+        doc_start = time.perf_counter()
+        summary = process_document(path, os.path.basename(path).replace(".", "_"))
+        doc_timings["ingest_total"] = time.perf_counter() - doc_start
+        timings.append(doc_timings)
+        chunks += summary.get("chunks", 0)
+    seconds = time.perf_counter() - start
+    return {
+        "documents": len(paths),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(pages / seconds, 2),
+        "chunks_per_s": round(chunks / seconds, 2),
+        "stages": _stage_summary(timings),
+    }
+
+
+async def load_test(queries, concurrency):
+    """Send every query through the /process_query handler with `concurrency` in flight."""
+    from backend.main import QueryRequest, process_query
+    from backend.utils.metrics import start_request
+    pending = iter(queries)
+    latencies, timings = [], []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        for query in pending:
+            _, request_timings = start_request()
+            start = time.perf_counter()
+            try:
+                await process_query(QueryRequest(query=query))
+            except Exception as e:
+                errors += 1
+                logger.error(f"Query failed: {str(e)}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            timings.append(request_timings)
+
+    start = time.perf_counter()
+    # Each client runs in its own task, so its request timings stay separate
+    await asyncio.gather(*(asyncio.create_task(client()) for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_qps": round(len(latencies) / seconds, 2),
+        **_summary(latencies),
+        "stages": _stage_summary(timings),
+    }
+
+
+async def load_tests(levels, queries_per_level):
+    """Run the load test at each concurrency level on one event loop, which the async Redis pool is bound to."""
+    results = []
+    for concurrency in levels:
+        result = await load_test(synthetic_queries(queries_per_level, seed=concurrency), concurrency)
+        logger.info(json.dumps({k: v for k, v in result.items() if k != "stages"}))
+        results.append(result)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline):
+    """Print relative changes against a previous run's JSON."""
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'}:")
+    print(f"  ingest pages/s {results['ingest']['pages_per_s']:>10} ({change(results['ingest']['pages_per_s'], baseline['ingest']['pages_per_s'])})")
+    previous = {run["concurrency"]: run for run in baseline["queries"]}
+    for run in results["queries"]:
+        old = previous.get(run["concurrency"])
+        if old is None:
+            continue
+        print(
+            f"  c={run['concurrency']:<4} p95 {run['p95_ms']:>9}ms ({change(run['p95_ms'], old['p95_ms'])})"
+            f"  qps {run['throughput_qps']:>8} ({change(run['throughput_qps'], old['throughput_qps'])})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50, help="Synthetic policy documents to ingest")
+    parser.add_argument("--pages", type=int, default=30, help="Pages per document")
+    parser.add_argument("--queries", type=int, default=200, help="Queries sent at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--cache", action="store_true", help="Leave the query cache on (repeated queries become hits)")
+    parser.add_argument("--llm-latency", type=float, default=None, help="Stub LLM latency in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Earlier --output JSON to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hackrx-e2e-")
+    os.environ["FAISS_DIR"] = os.path.join(workdir, "faiss_index")
+    os.environ["CHUNK_STORE_DIR"] = os.path.join(workdir, "chunk_store")
+    os.environ["LLM_PROVIDER"] = "stub"
+    if args.llm_latency is not None:
+        os.environ["LLM_STUB_LATENCY"] = str(args.llm_latency)
+    if not args.cache:
+        os.environ["QUERY_CACHE"] = "false"
+    use_fake_redis()
+    from backend.utils.models import warm_up
+    from backend.utils.workers import shutdown_executor
+
+    logger.info(f"Writing {args.docs} synthetic documents of {args.pages} pages to {workdir}")
+    paths = synthetic_corpus(workdir, args.docs, args.pages)
+    warm_up()
+    ingest_results = ingest(paths)
+    logger.info(json.dumps({k: v for k, v in ingest_results.items() if k != "stages"}))
+
+    query_results = asyncio.run(load_tests(args.concurrency, args.queries))
+    shutdown_executor()
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "docs": args.docs,
+            "pages_per_doc": args.pages,
+            "queries_per_level": args.queries,
+            "query_cache": args.cache,
+            "llm_stub_latency": float(os.getenv("LLM_STUB_LATENCY", 0.05)),
+            "embedding_model": os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+            "spacy_model": os.getenv("SPACY_MODEL", "en_core_web_lg"),
+            "cpus": os.cpu_count(),
+        },
+        "ingest": ingest_results,
+        "queries": query_results,
+    }
+
+    print(f"\nIngest: {ingest_results['pages']} pages, {ingest_results['chunks']} chunks in {ingest_results['seconds']}s "
+          f"({ingest_results['pages_per_s']} pages/s)")
+    print(f"{'concurrency':<13}{'qps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for r in query_results:
+        print(f"{r['concurrency']:<13}{r['throughput_qps']:>9}{r.get('p50_ms', 0):>10}{r.get('p95_ms', 0):>10}"
+              f"{r.get('p99_ms', 0):>10}{r['errors']:>8}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Embedding benchmark: encoder backends and vector storage against the float32 PyTorch path.
+
+Encodes a synthetic policy corpus with each EMBEDDING_BACKEND, then indexes every
+backend's vectors with each FAISS_VECTOR_STORAGE and reports encode throughput,
+single-query latency, index memory, mean cosine to the PyTorch embeddings and
+recall@k against a float32 PyTorch flat index.
+
+Usage:
+    python -m backend.benchmarks.embedding_benchmark --chunks 5000
+    python -m backend.benchmarks.embedding_benchmark --backends torch int8 --storages float32 sq8 --threads 4 --output emb.json
+"""
+import argparse
+import faiss
+import json
+import os
+import time
+import logging
+import numpy as np
+from backend.benchmarks.ann_benchmark import recall_at_k
+from backend.benchmarks.chunk_store_benchmark import synthetic_chunks
+from backend.benchmarks.e2e_benchmark import synthetic_queries
+from backend.modules.index_factory import VECTOR_STORAGES, build_index, index_config
+from backend.utils.models import EMBEDDING_BACKENDS, load_embedding_model
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def encode(model, texts, batch_size):
+    return np.ascontiguousarray(
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32
+    )
+
+
+def run(texts, queries, backends, storages, k, threads, batch_size):
+    name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    ids = np.arange(len(texts), dtype=np.int64)
+    reference = None
+    results = []
+    # PyTorch goes first: its float32 flat index is the ground truth
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        model = load_embedding_model(name, backend, threads)
+        encode(model, texts[:batch_size], batch_size)
+        start = time.perf_counter()
+        vectors = encode(model, texts, batch_size)
+        encode_seconds = time.perf_counter() - start
+        latencies = []
+        for query in queries[:100]:
+            start = time.perf_counter()
+            encode(model, [query], 1)
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_vectors = encode(model, queries, batch_size)
+        if reference is None:
+            flat, _ = build_index(vectors, ids, "flat", {**index_config("flat"), "storage": "float32"})
+            _, ground_truth = flat.search(query_vectors, k)
+            reference = vectors
+        if backend not in backends:
+            continue
+        for storage in storages:
+            index, params = build_index(vectors, ids, "flat", {**index_config("flat"), "storage": storage})
+            _, found = index.search(query_vectors, k)
+            result = {
+                "backend": backend,
+                "storage": storage,
+                "chunks": len(texts),
+                "encode_chunks_per_s": round(len(texts) / encode_seconds, 1),
+                "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "index_bytes_per_vector": round(faiss.serialize_index(index).nbytes / len(texts), 1),
+                "cosine_to_torch": round(float(np.mean(np.sum(vectors * reference, axis=1))), 5),
+                f"recall@{k}": round(recall_at_k(ground_truth, found), 4),
+            }
+            logger.info(json.dumps(result))
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--storages", nargs="+", default=list(VECTOR_STORAGES), choices=VECTOR_STORAGES)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", 0)),
+                        help="Inference threads (0 keeps the library default)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBED_BATCH_SIZE", 64)))
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    texts, _ = synthetic_chunks(args.chunks)
+    queries = synthetic_queries(args.queries)
+    logger.info(f"Benchmarking {args.backends} x {args.storages} on {len(texts)} chunks, {len(queries)} queries")
+
+    results = run(texts, queries, args.backends, args.storages, args.k, args.threads, args.batch_size)
+    print(f"{'backend':<9}{'storage':<9}{'chunks/s':>10}{'query ms':>10}{'bytes/vec':>11}{'cosine':>9}{'recall':>8}")
+    for r in results:
+        print(f"{r['backend']:<9}{r['storage']:<9}{r['encode_chunks_per_s']:>10.1f}{r['query_p50_ms']:>10.2f}"
+              f"{r['index_bytes_per_vector']:>11.1f}{r['cosine_to_torch']:>9.4f}{r[f'recall@{args.k}']:>8.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
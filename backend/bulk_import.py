@@ -0,0 +1,50 @@
+"""Ingest every supported document in a directory concurrently, as one index commit.
+
+Files are prepared in the ingestion process pool (INGEST_WORKERS processes,
+at most BULK_MAX_IN_FLIGHT files at a time), then published together, so
+searches never see a half-loaded corpus.
+
+Usage:
+    python -m backend.bulk_import backend/data/uploads
+    python -m backend.bulk_import /srv/policies --recursive --max-in-flight 8 --output bulk.json
+"""
+import argparse
+import json
+import os
+import sys
+import logging
+from backend.modules.ingest_jobs import bulk_import, shutdown_ingest_pool
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Directory of PDF, DOCX, EML or image files")
+    parser.add_argument("--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Files prepared at once (default BULK_MAX_IN_FLIGHT or 2 * INGEST_WORKERS)")
+    parser.add_argument("--output", help="Write the per-file results as JSON to this path")
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    try:
+        summary = bulk_import(args.directory, args.recursive, max_in_flight=args.max_in_flight)
+    finally:
+        shutdown_ingest_pool()
+    print(f"{'doc_id':<48}{'status':<11}{'chunks':>8}{'embedded':>10}{'reused':>8}")
+    for d in summary["documents"]:
+        print(f"{d['doc_id']:<48}{d['status']:<11}{d.get('chunks', 0):>8}{d.get('embedded', 0):>10}{d.get('reused', 0):>8}")
+    for path, error in summary["failed"].items():
+        print(f"{path:<48}{'failed':<11}{error}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
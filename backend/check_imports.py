@@ -0,0 +1,61 @@
+"""Check that importing the API stays fast and leaves heavy libraries unloaded.
+
+Imports backend.main in a fresh interpreter, then fails if that took longer
+than the budget or pulled in a library only ingestion or the LLM needs.
+Models and those libraries load on first use or during background warm-up.
+
+Usage:
+    python -m backend.check_imports
+    python -m backend.check_imports --budget 1.5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Libraries importing backend.main must not load
+LAZY_MODULES = (
+    "torch", "sentence_transformers", "spacy", "pdfplumber", "google.generativeai", "onnxruntime", "flair",
+)
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import backend.main
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+
+def check_imports(budget=None):
+    """Import backend.main in a subprocess; returns a list of problems (empty if all is well)."""
+    budget = float(os.getenv("IMPORT_BUDGET_SECONDS", 2.0)) if budget is None else budget
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=root, capture_output=True, text=True, env={**os.environ, "MODEL_WARMUP": "false"}
+    )
+    if result.returncode != 0:
+        return [f"Importing backend.main failed:\n{result.stderr.strip()}"]
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    problems = []
+    if probe["seconds"] > budget:
+        problems.append(f"Importing backend.main took {probe['seconds']:.2f}s, over the {budget:.2f}s budget")
+    loaded = [name for name in LAZY_MODULES if name in probe["modules"]]
+    if loaded:
+        problems.append(f"Importing backend.main loaded {', '.join(loaded)}")
+    logger.info(f"Imported backend.main in {probe['seconds']:.2f}s with {len(probe['modules'])} modules")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=None, help="Seconds allowed (default IMPORT_BUDGET_SECONDS or 2.0)")
+    args = parser.parse_args()
+    problems = check_imports(args.budget)
+    for problem in problems:
+        logger.error(problem)
+    sys.exit(1 if problems else 0)
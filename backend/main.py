@@ -1,12 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from backend.modules.doc_processor import process_document
-from backend.modules.query_parser import parse_query
-from backend.modules.semantic_search import search_clauses
-from backend.modules.decision_engine import evaluate_clauses
+from typing import List, Optional
+from backend.modules.doc_processor import delete_document
+from backend.modules.query_parser import parse_query, parse_queries
+from backend.modules.semantic_search import (
+    search_clauses_async, search_clauses_batch_async, redis_client, get_async_redis,
+)
+from backend.modules.ingest_jobs import submit_ingest_job, submit_bulk_job, shutdown_ingest_pool, job_key
+from backend.utils.extractors import supported_extensions
+from backend.modules.index_manager import get_index_manager, start_compactor
+from backend.modules.decision_engine import evaluate_clauses_async, evaluate_clauses_stream
 from backend.modules.response_generator import generate_response
+from backend.modules.query_cache import get_query_cache, parse_key, response_key
+from backend.utils.workers import run_in_worker, get_executor, shutdown_executor
+from backend.utils.models import warm_up, model_stats, loaded_models
+from backend.utils.metrics import (
+    Gauge, start_request, render_metrics, install_log_context, request_id_var, REQUEST_SECONDS, REQUESTS, CACHE_LOOKUPS,
+)
+from backend.utils.profiler import get_profiler, stop_profiler
+import asyncio
+import json
+import numpy as np
 import os
+import time
 import logging
 from dotenv import load_dotenv
 
@@ -14,6 +32,7 @@ load_dotenv()
 app = FastAPI()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+install_log_context()
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,15 +44,105 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     query: str
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    stream: bool = False
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+class BulkImportRequest(BaseModel):
+    directory: str
+    recursive: bool = False
+
+INDEX_VECTORS = Gauge("index_vectors", "Live vectors in the FAISS index", function=lambda: get_index_manager().snapshot().ntotal)
+INDEX_SEGMENTS = Gauge(
+    "index_segments", "Per-document segments not yet compacted", function=lambda: len(get_index_manager().snapshot().segments)
+)
+INDEX_TOMBSTONES = Gauge(
+    "index_tombstones", "Deleted vectors still in the base index", function=lambda: get_index_manager().snapshot().tombstones.size
+)
+INDEX_GENERATION = Gauge(
+    "index_generation", "Index generation loaded by this worker", function=lambda: get_index_manager().snapshot().generation
+)
+
+@app.middleware("http")
+async def track_request(request: Request, call_next):
+    """Tag the request with an id, time it, and log the stage breakdown of slow requests."""
+    request_id, timings = start_request(request.headers.get("x-request-id"))
+    started = time.monotonic()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        seconds = time.monotonic() - started
+        endpoint = getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+        REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+    response.headers["X-Request-ID"] = request_id
+    slow_after = float(os.getenv("SLOW_REQUEST_SECONDS", 2.0))
+    if slow_after > 0 and seconds >= slow_after:
+        breakdown = ", ".join(f"{stage} {t:.3f}s" for stage, t in sorted(timings.items(), key=lambda item: -item[1]))
+        logger.warning(f"Slow request {request.method} {request.url.path} took {seconds:.3f}s: {breakdown or 'no stages timed'}")
+        profiler = get_profiler()
+        if profiler is not None:
+            path = await run_in_worker(profiler.dump, request_id, started, started + seconds)
+            if path:
+                logger.warning(f"Saved a profile of request {request_id} to {path}")
+    return response
+
+# Progress of the background warm-up, reported by /ready
+warm_up_state = {"status": "pending", "seconds": None, "error": None}
+_warm_up_task = None
+
+async def warm_up_worker():
+    """Load the FAISS index and the query models (spaCy query pipes and the encoder) off the startup path."""
+    started = time.monotonic()
+    warm_up_state["status"] = "running"
+    try:
+        snapshot = await run_in_worker(get_index_manager().refresh, True)
+        logger.info(f"FAISS index generation at startup: {snapshot.generation}")
+        if os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes"):
+            # Ingestion runs in its own processes, so this worker only needs the query models
+            await run_in_worker(warm_up, ("query",))
+        warm_up_state["status"] = "done"
+    except Exception as e:
+        warm_up_state.update(status="failed", error=str(e))
+        logger.error(f"Warm-up failed: {str(e)}", exc_info=True)
+    warm_up_state["seconds"] = round(time.monotonic() - started, 2)
+
+@app.on_event("startup")
+async def start_worker():
+    """Start background services and warm up in the background, so the worker accepts connections at once."""
+    global _warm_up_task
+    start_compactor()
+    get_executor()
+    get_profiler()
+    _warm_up_task = asyncio.create_task(warm_up_worker())
+
+@app.on_event("shutdown")
+async def stop_workers():
+    """Let running query stages and ingest jobs finish before the process exits."""
+    shutdown_executor()
+    shutdown_ingest_pool()
+    stop_profiler()
+
+# Caps how many queries are in flight at once; the rest wait instead of piling onto the worker pool
+query_slots = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_QUERIES", 64)))
 
 @app.post("/upload_document")
 async def upload_document(file: UploadFile = File(...)):
     """Upload and process a document."""
     try:
         logger.info(f"Received upload request for {file.filename}")
-        if not file.filename.endswith(('.pdf', '.docx', '.eml')):
+        if os.path.splitext(file.filename)[1].lower() not in supported_extensions():
             logger.error(f"Unsupported file format: {file.filename}")
-            raise HTTPException(status_code=400, detail="Unsupported file format. Only PDF, DOCX, and EML are allowed.")
+            raise HTTPException(
+                status_code=400, detail=f"Unsupported file format. Allowed: {', '.join(supported_extensions())}"
+            )
         
         upload_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "uploads"))
         os.makedirs(upload_dir, exist_ok=True)
@@ -44,47 +153,287 @@ async def upload_document(file: UploadFile = File(...)):
             logger.error(f"No write permission for upload directory {upload_dir}")
             raise HTTPException(status_code=500, detail=f"No write permission for upload directory {upload_dir}")
         
-        # Save the uploaded file
+        # Stream the upload to disk instead of holding it in memory
         logger.info(f"Saving file to {file_path}")
-        content = await file.read()
-        if not content:
+        chunk_size = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+        size = 0
+        with open(file_path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                size += len(chunk)
+        if not size:
+            os.remove(file_path)
             logger.error(f"Uploaded file {file.filename} is empty")
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
-        with open(file_path, "wb") as f:
-            f.write(content)
         
         # Verify file was saved
         if not os.path.exists(file_path):
             logger.error(f"Failed to save file {file_path}")
             raise HTTPException(status_code=500, detail=f"Failed to save file {file_path}")
         
-        # Process the document
+        # Queue the document for background processing
         doc_id = file.filename.replace(".", "_")
-        logger.info(f"Processing document {doc_id}")
-        process_document(file_path, doc_id)
-        logger.info(f"Successfully processed {file.filename}")
-        return {"status": "success", "filename": file.filename}
+        job_id = await run_in_worker(submit_ingest_job, redis_client, file_path, doc_id, file.filename, request_id_var.get())
+        logger.info(f"Queued {file.filename} ({size} bytes) as job {job_id}")
+        return {"status": "queued", "filename": file.filename, "doc_id": doc_id, "job_id": job_id}
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"Upload error for {file.filename if file else 'unknown file'}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.post("/bulk_import")
+async def bulk_import_directory(request: BulkImportRequest):
+    """Ingest every supported file in a server-side directory as one background job and one index commit."""
+    # Only directories under BULK_IMPORT_ROOT may be read, so the endpoint cannot index arbitrary server files
+    root = os.path.realpath(os.getenv("BULK_IMPORT_ROOT", os.path.join(os.path.dirname(__file__), "data", "uploads")))
+    directory = os.path.realpath(os.path.join(root, request.directory))
+    if os.path.commonpath([root, directory]) != root:
+        logger.error(f"Bulk import of {request.directory} is outside {root}")
+        raise HTTPException(status_code=400, detail="Directory must be inside BULK_IMPORT_ROOT")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"Directory {request.directory} not found")
+    job_id = await run_in_worker(submit_bulk_job, redis_client, directory, request.recursive, request_id_var.get())
+    return {"status": "queued", "directory": request.directory, "job_id": job_id}
+
+@app.get("/health")
+async def health():
+    """Report model load times and memory use of this worker."""
+    return {"status": "ok", **model_stats()}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once warm-up has loaded the index and query models, 503 before that.
+
+    The body says which models, indexes and services are loaded or
+    reachable; Redis is reported but does not gate readiness, since
+    queries still work without the shared cache.
+    """
+    snapshot = get_index_manager().current
+    try:
+        redis_ok = bool(await asyncio.wait_for(get_async_redis().ping(), timeout=1.0))
+    except Exception:
+        redis_ok = False
+    body = {
+        "ready": warm_up_state["status"] == "done",
+        "warm_up": dict(warm_up_state),
+        "models": loaded_models(),
+        "index": {
+            "generation": snapshot.generation,
+            "vectors": snapshot.ntotal,
+            "segments": len(snapshot.segments),
+            "bm25": snapshot.base_lexical is not None or bool(snapshot.segment_lexical),
+        },
+        "redis": redis_ok,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit, miss and eviction counters for the query cache in this worker."""
+    cache = get_query_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, request, cache and LLM counters and index size in the Prometheus text format."""
+    body = await run_in_worker(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Report the stage and progress of an ingestion job."""
+    job = await get_async_redis().hgetall(job_key(job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"job_id": job_id, **job}
+
+@app.delete("/documents/{doc_id}")
+async def remove_document(doc_id: str):
+    """Remove a document from the index."""
+    try:
+        removed = await run_in_worker(delete_document, doc_id)
+        if not removed:
+            raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+        return {"status": "success", "doc_id": doc_id, "chunks_removed": removed}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Delete error for {doc_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+async def answer_query(request):
+    """Yield (response, final) for one query: a cached answer, or the rule decision and then the LLM-refined one."""
+    started = time.monotonic()
+    top_k = int(os.getenv("TOP_K_RESULTS", 10))
+    cache = get_query_cache()
+    snapshot = await run_in_worker(get_index_manager().snapshot)
+    cache_key = response_key(
+        request.query, snapshot.version, top_k=top_k, nprobe=request.nprobe, ef_search=request.ef_search
+    )
+    cached = await cache.get(cache_key) if cache else None
+    if cache:
+        CACHE_LOOKUPS.inc(cache="response", result="miss" if cached is None else "hit")
+    if cached is not None:
+        logger.info(f"Served query from cache: {request.query}, Decision: {cached['decision']}")
+        yield {**cached, "index_generation": snapshot.generation}, True
+        return
+    async with query_slots:
+        parsed = await cache.get(parse_key(request.query)) if cache else None
+        if cache:
+            CACHE_LOOKUPS.inc(cache="parse", result="miss" if parsed is None else "hit")
+        if parsed is not None:
+            entities, embedding = parsed["entities"], parsed["embedding"]
+        else:
+            entities, embedding = await run_in_worker(parse_query, request.query)
+            if cache:
+                await cache.set(parse_key(request.query), {"entities": entities, "embedding": embedding})
+        clauses, index_generation = await search_clauses_async(
+            embedding, top_k, request.nprobe, request.ef_search, request.query
+        )
+        # Whatever is left of the request's latency budget caps the LLM call
+        budget = float(os.getenv("QUERY_BUDGET", 0))
+        llm_timeout = None
+        if budget > 0:
+            llm_timeout = min(float(os.getenv("LLM_TIMEOUT", 10)), budget - (time.monotonic() - started))
+        async for decision, final in evaluate_clauses_stream(entities, clauses, timeout=llm_timeout):
+            response = generate_response(decision)
+            if final:
+                if cache:
+                    await cache.set(cache_key, dict(response))
+                logger.info(
+                    f"Processed query: {request.query}, Decision: {decision['decision']}, Index generation: {index_generation}"
+                )
+            response["index_generation"] = index_generation
+            yield response, final
+
 @app.post("/process_query")
 async def process_query(request: QueryRequest):
-    """Process a user query and return a decision."""
+    """Process a user query and return a decision.
+
+    With "stream": true the response is NDJSON: the rule-based decision as
+    soon as it is known, then the LLM-refined one; the last line has
+    "final": true.
+    """
+    logger.info(f"Processing query: {request.query}")
+    if request.stream:
+        async def lines():
+            try:
+                async for response, final in answer_query(request):
+                    yield json.dumps({**response, "final": final}) + "\n"
+            except Exception as e:
+                logger.error(f"Query streaming error: {str(e)}", exc_info=True)
+                yield json.dumps({"error": f"Query processing failed: {str(e)}", "final": True}) + "\n"
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
     try:
-        logger.info(f"Processing query: {request.query}")
-        entities, embedding = parse_query(request.query)
-        clauses = search_clauses(embedding, int(os.getenv("TOP_K_RESULTS", 10)))
-        decision = evaluate_clauses(entities, clauses)
-        response = generate_response(decision)
-        logger.info(f"Processed query: {request.query}, Decision: {decision['decision']}")
+        # Run the generator to the end so the query slot is released before responding
+        async for response, _ in answer_query(request):
+            pass
         return response
     except Exception as e:
         logger.error(f"Query processing error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
 
+def _check_batch(request):
+    max_batch = int(os.getenv("MAX_BATCH_QUERIES", 256))
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    if len(request.queries) > max_batch:
+        raise HTTPException(status_code=400, detail=f"At most {max_batch} queries per batch")
+
+async def answer_queries(request):
+    """Yield (position, response) for a batch of queries as each decision completes.
+
+    Cached answers come back first. The rest are parsed with one nlp.pipe
+    pass and one encode call, searched with one multi-row FAISS search and one
+    MGET, and decided concurrently (BATCH_DECISION_CONCURRENCY at a time).
+    """
+    top_k = int(os.getenv("TOP_K_RESULTS", 10))
+    cache = get_query_cache()
+    snapshot = await run_in_worker(get_index_manager().snapshot)
+    pending = []
+    cache_keys = {}
+    for position, query in enumerate(request.queries):
+        if not query.strip():
+            yield position, {"query": query, "error": "Query cannot be empty"}
+            continue
+        cache_keys[position] = response_key(
+            query, snapshot.version, top_k=top_k, nprobe=request.nprobe, ef_search=request.ef_search
+        )
+        cached = await cache.get(cache_keys[position]) if cache else None
+        if cache:
+            CACHE_LOOKUPS.inc(cache="response", result="miss" if cached is None else "hit")
+        if cached is not None:
+            yield position, {"query": query, **cached, "index_generation": snapshot.generation}
+        else:
+            pending.append(position)
+    if not pending:
+        return
+    
+    queries = [request.queries[position] for position in pending]
+    async with query_slots:
+        entities, embeddings = await run_in_worker(parse_queries, queries)
+        clauses, index_generation = await search_clauses_batch_async(
+            np.asarray(embeddings), queries, top_k, request.nprobe, request.ef_search
+        )
+    
+    decision_slots = asyncio.Semaphore(int(os.getenv("BATCH_DECISION_CONCURRENCY", 16)))
+    async def decide(position, query, query_entities, query_clauses):
+        async with decision_slots:
+            decision = await evaluate_clauses_async(query_entities, query_clauses)
+        response = generate_response(decision)
+        if cache:
+            await cache.set(cache_keys[position], dict(response))
+        return position, {"query": query, **response, "index_generation": index_generation}
+    
+    tasks = [
+        asyncio.create_task(decide(position, query, query_entities, query_clauses))
+        for position, query, query_entities, query_clauses in zip(pending, queries, entities, clauses)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@app.post("/process_queries")
+async def process_queries(request: BatchQueryRequest):
+    """Process a batch of queries and return their decisions in request order."""
+    _check_batch(request)
+    try:
+        logger.info(f"Processing batch of {len(request.queries)} queries")
+        started = time.monotonic()
+        results = [None] * len(request.queries)
+        async for position, response in answer_queries(request):
+            results[position] = response
+        logger.info(f"Processed {len(results)} queries in {time.monotonic() - started:.2f}s")
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Batch query processing error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch query processing failed: {str(e)}")
+
+@app.post("/process_queries/stream")
+async def process_queries_stream(request: BatchQueryRequest):
+    """Stream decisions for a batch of queries as NDJSON, one line per query as soon as it is decided."""
+    _check_batch(request)
+    
+    async def lines():
+        try:
+            async for position, response in answer_queries(request):
+                yield json.dumps({"index": position, **response}) + "\n"
+        except Exception as e:
+            logger.error(f"Batch query streaming error: {str(e)}", exc_info=True)
+            yield json.dumps({"error": f"Batch query processing failed: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
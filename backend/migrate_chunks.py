@@ -0,0 +1,60 @@
+"""Copy chunk texts from the legacy doc_{doc_id}:{chunk_no} Redis keys into the chunk store.
+
+Run once after upgrading, before serving queries:
+    python -m backend.migrate_chunks
+    python -m backend.migrate_chunks --delete   # also drop the Redis keys once copied
+"""
+import argparse
+import logging
+import numpy as np
+from backend.modules.id_map import chunk_key
+from backend.modules.index_manager import get_index_manager
+from backend.modules.chunk_store import get_chunk_store
+from backend.modules.semantic_search import redis_client
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def migrate_chunks(delete=False):
+    """Copy every live chunk the store lacks; returns (copied, missing) counts."""
+    snapshot = get_index_manager().snapshot()
+    store = get_chunk_store()
+    docs = set(snapshot.base_id_map.docs) | set(snapshot.segments)
+    copied = missing = 0
+    for doc_id in sorted(docs):
+        ids = snapshot.ids_for_doc(doc_id)
+        for start in range(0, ids.size, BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            todo = [idx for idx, text in zip(batch, store.get(batch)) if text is None]
+            if not todo:
+                continue
+            entries = [snapshot.lookup(idx) for idx in todo]
+            keys = [chunk_key(entry[0], entry[1]) for entry in entries]
+            texts = redis_client.mget(keys)
+            found = [(idx, text, entry[3]) for idx, text, entry in zip(todo, texts, entries) if text is not None]
+            missing += len(todo) - len(found)
+            if found:
+                store.put(
+                    doc_id,
+                    np.array([idx for idx, _, _ in found], dtype=np.int64),
+                    [text for _, text, _ in found],
+                    [page for _, _, page in found],
+                )
+                copied += len(found)
+                if delete:
+                    redis_client.delete(*(key for key, text in zip(keys, texts) if text is not None))
+        logger.info(f"Migrated {doc_id}: {copied} chunks copied so far, {missing} missing")
+    if missing:
+        logger.warning(f"{missing} live chunks had no Redis text; re-upload their documents to restore them")
+    logger.info(f"Copied {copied} chunks into the chunk store")
+    return copied, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delete", action="store_true", help="Delete each Redis key after copying it")
+    args = parser.parse_args()
+    migrate_chunks(delete=args.delete)
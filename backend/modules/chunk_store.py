@@ -0,0 +1,507 @@
+import json
+import mmap
+import os
+import threading
+import time
+import logging
+import numpy as np
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_DIR = os.getenv(
+    "CHUNK_STORE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "chunk_store"))
+)
+CHUNK_STORE_CACHES = ("none", "redis")
+# One fixed-size record per stored or deleted chunk; length -1 marks a deletion
+RECORD_DTYPE = np.dtype([("id", "<i8"), ("offset", "<i8"), ("length", "<i4"), ("page", "<i4"), ("doc", "<i4")])
+CURRENT_FILENAME = "CURRENT"
+# Compaction is skipped until at least this much text is dead, however high the ratio
+COMPACT_MIN_BYTES = 1 << 20
+
+
+class ChunkStore:
+    """Chunk texts keyed by their global FAISS id.
+
+    put() must complete before the ids are published in the index, and
+    get() returns None for ids the store does not know.
+    """
+
+    def put(self, doc_id, ids, texts, pages=None):
+        raise NotImplementedError
+
+    def get(self, ids):
+        raise NotImplementedError
+
+    async def get_async(self, ids):
+        return self.get(ids)
+
+    def delete_doc(self, doc_id, keep_ids=()):
+        """Drop a document's chunks except `keep_ids`; returns how many were dropped."""
+        raise NotImplementedError
+
+    def maybe_compact(self):
+        """Reclaim space left by deleted chunks if it is worth it."""
+
+    def next_id(self):
+        """One past the highest id the store has a record for; 0 if unknown."""
+        return 0
+
+    def stats(self):
+        return {}
+
+
+class _StoreState:
+    """One reader's view of a store generation; replaced, never mutated, on refresh."""
+
+    def __init__(self, generation=None, records=None, count=0, rows=None, start=0, blob=None, docs=None):
+        self.generation = generation
+        self.records = records if records is not None else np.empty(0, dtype=RECORD_DTYPE)
+        self.count = count
+        self.rows = rows if rows is not None else np.empty(0, dtype=np.int32)  # id - start -> record row, -1 if none
+        self.start = start
+        self.blob = blob if blob is not None else memoryview(b"")
+        self.docs = docs or []
+
+
+class MmapChunkStore(ChunkStore):
+    """Append-only chunk store: a UTF-8 text blob plus fixed-size records, both memory-mapped.
+
+    A generation is three files: chunks-N.bin (concatenated texts),
+    chunks-N.rec (RECORD_DTYPE rows of id, blob offset, length, page and
+    document) and chunks-N.docs (one JSON document id per line). Writers
+    append the text before its record, so a record is only ever read after
+    its text is on disk. Deletions append records with length -1.
+    compact() writes the live chunks to generation N+1 and switches the
+    CURRENT file to it; readers keep the old files open until they notice.
+
+    Lookups map an id straight to a record row through a dense array (ids
+    come from one counter) and slice the text out of the mapped blob.
+    """
+
+    def __init__(self, directory=CHUNK_STORE_DIR, refresh_interval=None):
+        self.directory = directory
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("CHUNK_STORE_REFRESH_INTERVAL", 1.0))
+        self.refresh_interval = refresh_interval
+        self._state = _StoreState()
+        self._current_stat = None
+        self._last_check = None
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _path(self, generation, suffix):
+        return os.path.join(self.directory, f"chunks-{generation:06d}.{suffix}")
+
+    def _read_current(self):
+        """(generation, stat) from the CURRENT file, or (None, None) if the store is empty."""
+        path = os.path.join(self.directory, CURRENT_FILENAME)
+        try:
+            with open(path) as f:
+                return int(f.read().strip()), os.stat(path)
+        except FileNotFoundError:
+            return None, None
+
+    def _write_current(self, generation):
+        path = os.path.join(self.directory, CURRENT_FILENAME)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def write_lock(self):
+        """Serialise writers across threads and worker processes."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._write_lock:
+            with open(os.path.join(self.directory, ".write.lock"), "w") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_docs(self, generation):
+        try:
+            with open(self._path(generation, "docs")) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def refresh(self, force=False):
+        """Pick up records appended (or a generation published) by any process; returns the state."""
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.refresh_interval:
+            return self._state
+        with self._read_lock:
+            self._last_check = now
+            try:
+                return self._reload()
+            except FileNotFoundError as e:
+                # A compaction in another process removed the generation between two reads
+                logger.warning(f"Chunk store changed while reloading, keeping the previous view: {str(e)}")
+                return self._state
+
+    def _reload(self):
+        """Read whatever changed since the last reload into a new state."""
+        generation, current_stat = self._read_current()
+        state = self._state
+        if generation is None:
+            self._state = _StoreState()
+            return self._state
+        if generation != state.generation or (current_stat.st_ino, current_stat.st_mtime_ns) != self._current_stat:
+            state = _StoreState(generation)
+            self._current_stat = (current_stat.st_ino, current_stat.st_mtime_ns)
+        rec_path = self._path(generation, "rec")
+        count = os.path.getsize(rec_path) // RECORD_DTYPE.itemsize if os.path.exists(rec_path) else 0
+        if count == state.count:
+            self._state = state
+            return state
+        records = np.memmap(rec_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+        new = records[state.count:count]
+        # Later records for an id override earlier ones
+        reversed_ids = new["id"][::-1]
+        new_ids, last = np.unique(reversed_ids, return_index=True)
+        new_rows = (count - 1 - last).astype(np.int32)
+        new_rows[new["length"][count - 1 - last - state.count] < 0] = -1
+        rows, start = state.rows, state.start
+        low, high = int(new_ids[0]), int(new_ids[-1]) + 1
+        if not rows.size:
+            start = low
+        new_start, new_end = min(start, low), max(start + rows.size, high)
+        grown = np.full(new_end - new_start, -1, dtype=np.int32)
+        grown[start - new_start:start - new_start + rows.size] = rows
+        grown[new_ids - new_start] = new_rows
+        blob = state.blob
+        blob_path = self._path(generation, "bin")
+        blob_size = os.path.getsize(blob_path)
+        if blob_size > len(blob):
+            with open(blob_path, "rb") as f:
+                blob = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        docs = state.docs
+        if int(new["doc"].max()) >= len(docs):
+            docs = self._load_docs(generation)
+        self._state = _StoreState(generation, records, count, grown, new_start, blob, docs)
+        return self._state
+
+    def _lookup(self, state, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        slots = ids - state.start
+        valid = (slots >= 0) & (slots < state.rows.size)
+        rows = np.full(ids.shape[0], -1, dtype=np.int64)
+        rows[valid] = state.rows[slots[valid]]
+        return rows
+
+    def get(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        state = self.refresh()
+        rows = self._lookup(state, ids)
+        if (rows < 0).any():
+            # Possibly written by another process since the last refresh
+            state = self.refresh(force=True)
+            rows = self._lookup(state, ids)
+        texts = []
+        for row in rows:
+            if row < 0:
+                texts.append(None)
+                continue
+            record = state.records[row]
+            offset, length = int(record["offset"]), int(record["length"])
+            texts.append(str(state.blob[offset:offset + length], "utf-8"))
+        return texts
+
+    def _doc_index(self, generation, docs, doc_id):
+        if doc_id in docs:
+            return docs.index(doc_id)
+        with open(self._path(generation, "docs"), "a") as f:
+            f.write(json.dumps(doc_id) + "\n")
+        return len(docs)
+
+    def _append(self, generation, records, blob=b""):
+        if blob:
+            with open(self._path(generation, "bin"), "ab") as f:
+                f.write(blob)
+        with open(self._path(generation, "rec"), "ab") as f:
+            f.write(records.tobytes())
+
+    def put(self, doc_id, ids, texts, pages=None):
+        """Append chunk texts under their ids; an id that is already stored gets the new text."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not ids.size:
+            return
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+        with self.write_lock():
+            generation, _ = self._read_current()
+            if generation is None:
+                generation = 0
+                for suffix in ("bin", "rec", "docs"):
+                    open(self._path(generation, suffix), "ab").close()
+                self._write_current(generation)
+            state = self.refresh(force=True)
+            records = np.zeros(ids.size, dtype=RECORD_DTYPE)
+            records["id"] = ids
+            records["offset"] = os.path.getsize(self._path(generation, "bin")) + np.cumsum(lengths) - lengths
+            records["length"] = lengths
+            records["page"] = -1 if pages is None else np.asarray(pages, dtype=np.int32)
+            records["doc"] = self._doc_index(generation, state.docs, doc_id)
+            self._append(generation, records, b"".join(encoded))
+            self.refresh(force=True)
+        logger.info(f"Stored {ids.size} chunks ({int(lengths.sum())} bytes) for {doc_id}")
+
+    def next_id(self):
+        state = self.refresh(force=True)
+        return int(state.start + state.rows.size)
+
+    def _live_rows(self, state):
+        rows = state.rows[state.rows >= 0]
+        return np.sort(rows)
+
+    def ids_for_doc(self, doc_id):
+        state = self.refresh(force=True)
+        if doc_id not in state.docs:
+            return np.empty(0, dtype=np.int64)
+        rows = self._live_rows(state)
+        rows = rows[state.records["doc"][rows] == state.docs.index(doc_id)]
+        return np.asarray(state.records["id"][rows], dtype=np.int64)
+
+    def delete_doc(self, doc_id, keep_ids=()):
+        with self.write_lock():
+            ids = self.ids_for_doc(doc_id)
+            ids = ids[~np.isin(ids, np.asarray(list(keep_ids), dtype=np.int64))]
+            if not ids.size:
+                return 0
+            state = self.refresh(force=True)
+            records = np.zeros(ids.size, dtype=RECORD_DTYPE)
+            records["id"] = ids
+            records["length"] = -1
+            records["page"] = -1
+            records["doc"] = state.docs.index(doc_id)
+            self._append(state.generation, records)
+            self.refresh(force=True)
+        logger.info(f"Deleted {ids.size} chunks of {doc_id} from the chunk store")
+        return int(ids.size)
+
+    def stats(self):
+        state = self.refresh()
+        rows = self._live_rows(state)
+        live_bytes = int(state.records["length"][rows].sum()) if rows.size else 0
+        return {
+            "backend": "mmap",
+            "generation": state.generation,
+            "chunks": int(rows.size),
+            "records": int(state.count),
+            "live_bytes": live_bytes,
+            "blob_bytes": len(state.blob),
+            "record_bytes": int(state.count) * RECORD_DTYPE.itemsize,
+        }
+
+    def compact(self):
+        """Rewrite the live chunks into a new generation and drop the old files."""
+        with self.write_lock():
+            state = self.refresh(force=True)
+            if state.generation is None:
+                return
+            start = time.perf_counter()
+            generation = state.generation + 1
+            rows = self._live_rows(state)
+            old = np.asarray(state.records[rows])
+            records = old.copy()
+            records["offset"] = np.cumsum(old["length"]) - old["length"]
+            with open(self._path(generation, "bin"), "wb") as f:
+                for record in old:
+                    offset, length = int(record["offset"]), int(record["length"])
+                    f.write(state.blob[offset:offset + length])
+            with open(self._path(generation, "rec"), "wb") as f:
+                f.write(records.tobytes())
+            with open(self._path(generation, "docs"), "w") as f:
+                f.writelines(json.dumps(doc) + "\n" for doc in state.docs)
+            self._write_current(generation)
+            for suffix in ("bin", "rec", "docs"):
+                os.remove(self._path(state.generation, suffix))
+            self.refresh(force=True)
+        logger.info(
+            f"Compacted chunk store to generation {generation}: {rows.size} live of {state.count} records "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    def maybe_compact(self):
+        stats = self.stats()
+        dead_bytes = stats["blob_bytes"] - stats["live_bytes"]
+        ratio = float(os.getenv("CHUNK_STORE_COMPACT_RATIO", 0.5))
+        if dead_bytes >= COMPACT_MIN_BYTES and dead_bytes >= ratio * stats["blob_bytes"]:
+            self.compact()
+
+
+class RedisChunkStore(ChunkStore):
+    """Chunk texts as Redis strings keyed chunk:<id>, with a set of ids per document.
+
+    The per-key layout the mmap store replaced; kept as the baseline of
+    chunk_store_benchmark.
+    """
+
+    def __init__(self, redis_client, async_redis=None):
+        self.redis_client = redis_client
+        self.async_redis = async_redis
+
+    @staticmethod
+    def key(idx):
+        return f"chunk:{int(idx)}"
+
+    @staticmethod
+    def doc_key(doc_id):
+        return f"chunk_ids:{doc_id}"
+
+    def put(self, doc_id, ids, texts, pages=None):
+        ids = [int(idx) for idx in ids]
+        if not ids:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for idx, text in zip(ids, texts):
+            pipe.set(self.key(idx), text)
+        pipe.sadd(self.doc_key(doc_id), *ids)
+        pipe.execute()
+
+    def get(self, ids):
+        ids = list(ids)
+        return self.redis_client.mget([self.key(idx) for idx in ids]) if ids else []
+
+    async def get_async(self, ids):
+        ids = list(ids)
+        if not ids or self.async_redis is None:
+            return self.get(ids)
+        return await self.async_redis.mget([self.key(idx) for idx in ids])
+
+    def delete_doc(self, doc_id, keep_ids=()):
+        keep = {int(idx) for idx in keep_ids}
+        ids = [int(idx) for idx in self.redis_client.smembers(self.doc_key(doc_id)) if int(idx) not in keep]
+        if not ids:
+            return 0
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.delete(*(self.key(idx) for idx in ids))
+        pipe.srem(self.doc_key(doc_id), *ids)
+        pipe.execute()
+        return len(ids)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+class CachedChunkStore(ChunkStore):
+    """Read-through Redis cache (chunk:<id> keys with a TTL) in front of an mmap store.
+
+    Reads try Redis first and fill misses from the backing store, so API hosts
+    that see the chunk store files late, or over a slow network mount, still
+    answer hot chunks from memory. Writes go to the backing store and drop the
+    cached copies of the ids they touch; Redis being down only costs the cache.
+    """
+
+    def __init__(self, backing, redis_client, async_redis=None, ttl=3600):
+        self.backing = backing
+        self.redis_client = redis_client
+        self.async_redis = async_redis
+        self.ttl = ttl
+
+    def _fill(self, ids, cached):
+        """Texts for ids given their cached values, reading misses from the backing store."""
+        missing = [i for i, text in enumerate(cached) if text is None]
+        if not missing:
+            return list(cached)
+        texts = list(cached)
+        for i, text in zip(missing, self.backing.get([ids[i] for i in missing])):
+            texts[i] = text
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for i in missing:
+                if texts[i] is not None:
+                    pipe.set(RedisChunkStore.key(ids[i]), texts[i], ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not fill the chunk cache: {str(e)}")
+        return texts
+
+    def get(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        try:
+            cached = self.redis_client.mget([RedisChunkStore.key(idx) for idx in ids])
+        except Exception as e:
+            logger.warning(f"Chunk cache unavailable, reading the chunk store: {str(e)}")
+            return self.backing.get(ids)
+        return self._fill(ids, cached)
+
+    async def get_async(self, ids):
+        ids = list(ids)
+        if not ids or self.async_redis is None:
+            return self.get(ids)
+        try:
+            cached = await self.async_redis.mget([RedisChunkStore.key(idx) for idx in ids])
+        except Exception as e:
+            logger.warning(f"Chunk cache unavailable, reading the chunk store: {str(e)}")
+            return self.backing.get(ids)
+        return self._fill(ids, cached)
+
+    def _invalidate(self, ids):
+        ids = [int(idx) for idx in ids]
+        if not ids:
+            return
+        try:
+            self.redis_client.delete(*(RedisChunkStore.key(idx) for idx in ids))
+        except Exception as e:
+            logger.warning(f"Could not drop {len(ids)} cached chunks: {str(e)}")
+
+    def put(self, doc_id, ids, texts, pages=None):
+        self.backing.put(doc_id, ids, texts, pages)
+        self._invalidate(ids)
+
+    def delete_doc(self, doc_id, keep_ids=()):
+        keep = np.asarray(list(keep_ids), dtype=np.int64)
+        ids = self.backing.ids_for_doc(doc_id)
+        deleted = self.backing.delete_doc(doc_id, keep_ids)
+        self._invalidate(ids[~np.isin(ids, keep)])
+        return deleted
+
+    def maybe_compact(self):
+        self.backing.maybe_compact()
+
+    def next_id(self):
+        return self.backing.next_id()
+
+    def stats(self):
+        return {**self.backing.stats(), "cache": "redis", "cache_ttl": self.ttl}
+
+
+# One store per process, created on first use
+_store = None
+_store_lock = threading.Lock()
+
+def get_chunk_store():
+    """Return the mmap chunk store, behind a Redis cache if CHUNK_STORE_CACHE=redis."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                cache = os.getenv("CHUNK_STORE_CACHE", "none").lower()
+                if cache not in CHUNK_STORE_CACHES:
+                    raise ValueError(f"Unknown chunk store cache {cache}, expected one of {CHUNK_STORE_CACHES}")
+                store = MmapChunkStore()
+                if cache == "redis":
+                    from backend.modules.semantic_search import redis_client, get_async_redis
+                    ttl = int(os.getenv("CHUNK_STORE_CACHE_TTL", 3600))
+                    store = CachedChunkStore(store, redis_client, get_async_redis(), ttl)
+                _store = store
+                logger.info(f"Using the mmap chunk store (cache: {cache})")
+    return _store
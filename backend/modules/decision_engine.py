@@ -1,105 +1,326 @@
-import google.generativeai as genai
+import asyncio
+import hashlib
 import json
 import os
 import re
+import time
 import logging
+from types import SimpleNamespace
 from dotenv import load_dotenv
+from backend.utils.metrics import timed, CACHE_LOOKUPS, LLM_CALLS
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# IRDAI waiting periods in months
+WAITING_PERIODS = {
+    "appendectomy": 1,       # 30 days (1 month)
+    "knee surgery": 36,      # 36 months
+    "joint replacement surgery": 36,
+    "surgery": 1,            # General surgery: 30 days
+    "operation": 1,
+}
+LLM_POLICIES = ("always", "uncertain", "never")
+# Rough characters per token for English text, close enough to size a prompt budget
+CHARS_PER_TOKEN = 4
 
-def evaluate_clauses(entities, clauses):
-    """Evaluate clauses based on entities and return decision."""
-    try:
-        logger.info(f"Evaluating clauses with entities: {entities}")
-        if not clauses:
-            logger.warning("No clauses provided for evaluation")
-            return {"decision": "Rejected", "amount": 0, "justification": "No relevant clauses found", "clauses": []}
-        
-        # Prepare input
-        procedure = entities.get("procedure", "").lower()
-        policy_duration = entities.get("policy_duration", "")
-        pre_approval = entities.get("pre_approval", False)
-        
-        # Extract duration in months
-        duration_months = 0
-        if policy_duration:
-            match = re.search(r"(\d+)\s*(month|year)", policy_duration, re.IGNORECASE)
-            if match:
-                num, unit = match.groups()
-                duration_months = int(num) if unit.lower() == "month" else int(num) * 12
-        
-        # Define IRDAI rules
-        waiting_periods = {
-            "appendectomy": 1,       # 30 days (1 month)
-            "knee surgery": 36,      # 36 months
-            "joint replacement surgery": 36,
-            "surgery": 1,            # General surgery: 30 days
-            "operation": 1,
+
+class StubLLM:
+    """Offline stand-in for Gemini that answers with the waiting-period rules.
+
+    It reads the procedure and policy duration back out of the prompt, waits
+    LLM_STUB_LATENCY seconds and counts its calls, so caching, budgets and
+    skipping can be exercised without network access.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = float(os.getenv("LLM_STUB_LATENCY", 0.05)) if latency is None else latency
+        self.calls = 0
+
+    def _answer(self, prompt):
+        self.calls += 1
+        procedure = re.search(r"- Procedure: (.*)", prompt)
+        duration = re.search(r"- Policy duration: (.*)", prompt)
+        procedure = procedure.group(1).strip() if procedure else ""
+        months = duration_months(duration.group(1)) if duration else 0
+        approved = procedure in WAITING_PERIODS and months >= WAITING_PERIODS[procedure]
+        answer = {
+            "decision": "Approved" if approved else "Rejected",
+            "amount": 50000 if approved and procedure == "appendectomy" else 0,
+            "justification": f"Stub LLM: {procedure or 'procedure'} checked against IRDAI waiting periods.",
+            "clauses": [],
         }
-        
-        # Check clauses
-        relevant_clauses = []
-        for clause in clauses:
-            clause_lower = clause.lower()
-            if any(term in clause_lower for term in ["hospitalization", "treatment", "surgery", "insured", "waiting period"]):
-                relevant_clauses.append(clause)
-        
-        if not relevant_clauses:
-            logger.warning("No relevant clauses found")
-            return {"decision": "Rejected", "amount": 0, "justification": "No relevant clauses found", "clauses": []}
-        
-        # Validate waiting period
-        decision = {"decision": "Rejected", "amount": 0, "justification": "", "clauses": relevant_clauses}
-        if procedure in waiting_periods:
-            required_months = waiting_periods[procedure]
-            if duration_months >= required_months:
-                decision["decision"] = "Approved"
-                decision["amount"] = 50000 if procedure == "appendectomy" else 0
-                decision["justification"] = f"Policy duration ({policy_duration}) meets {required_months} month waiting period for {procedure}."
-                if pre_approval:
-                    decision["justification"] += " Pre-approval obtained."
-            else:
-                decision["justification"] = f"{procedure} requires {required_months} month waiting period."
+        return SimpleNamespace(text=f"```json\n{json.dumps(answer)}\n```")
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+
+# One client for every request
+_llm = None
+def get_llm():
+    """Create the LLM client (LLM_PROVIDER: gemini or stub) lazily and reuse it."""
+    global _llm
+    if _llm is None:
+        if os.getenv("LLM_PROVIDER", "gemini").lower() == "stub":
+            logger.info("Using the offline stub LLM")
+            _llm = StubLLM()
         else:
-            decision["justification"] = f"No waiting period defined for {procedure}."
-        
-        # Query Gemini for confirmation
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        prompt = f"""
-        Given:
-        - Procedure: {procedure}
-        - Policy duration: {policy_duration}
-        - Pre-approval: {pre_approval}
-        - Clauses: {relevant_clauses}
-        - IRDAI waiting periods: {waiting_periods}
-        Confirm if the claim is approved or rejected. If approved, suggest an amount (e.g., 50000 for appendectomy). Provide a justification. Return JSON:
-        ```json
-        {{
-            "decision": "Approved or Rejected",
-            "amount": number,
-            "justification": "string",
-            "clauses": [list of clauses]
-        }}
-        ```
-        """
-        try:
-            response = model.generate_content(prompt)
-            gemini_decision = json.loads(response.text.strip("```json\n```"))
-            # Merge Gemini decision with local validation
-            if gemini_decision["decision"] == decision["decision"]:
-                decision["justification"] = gemini_decision["justification"] or decision["justification"]
-                decision["amount"] = gemini_decision["amount"] if gemini_decision["decision"] == "Approved" else 0
-            else:
-                logger.warning(f"Gemini decision {gemini_decision['decision']} conflicts with local decision {decision['decision']}")
-        except Exception as e:
-            logger.error(f"Gemini error: {str(e)}", exc_info=True)
+            # Imported here so workers that never call Gemini do not load its client library
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _llm = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+    return _llm
+
+# Memoised LLM answers, created on first use
+_llm_memo = None
+def get_llm_memo():
+    """Cache of raw LLM answers: in-process LRU, plus Redis on the async path."""
+    global _llm_memo
+    if _llm_memo is None:
+        from backend.modules.query_cache import QueryCache
+        from backend.modules.semantic_search import get_async_redis
+        _llm_memo = QueryCache(
+            get_async_redis(),
+            maxsize=int(os.getenv("LLM_MEMO_SIZE", 4096)),
+            ttl=float(os.getenv("LLM_MEMO_TTL", 3600)),
+            redis_ttl=int(os.getenv("LLM_MEMO_REDIS_TTL", 86400)),
+        )
+    return _llm_memo
+
+def duration_months(policy_duration):
+    """Policy duration such as "3 month" or "2 years" in months; 0 if unparseable."""
+    match = re.search(r"(\d+)\s*(month|year)", policy_duration or "", re.IGNORECASE)
+    if not match:
+        return 0
+    num, unit = match.groups()
+    return int(num) if unit.lower() == "month" else int(num) * 12
+
+def should_ask_llm(entities, policy=None):
+    """Decide whether a rule decision is worth confirming with the LLM.
+
+    LLM_POLICY "uncertain" (default) only asks when no waiting-period rule
+    covers the procedure; "always" and "never" do what they say.
+    """
+    policy = (policy or os.getenv("LLM_POLICY", "uncertain")).lower()
+    if policy not in LLM_POLICIES:
+        raise ValueError(f"Unknown LLM policy {policy}, expected one of {LLM_POLICIES}")
+    if policy == "never":
+        return False
+    if policy == "always":
+        return True
+    return entities.get("procedure", "").lower() not in WAITING_PERIODS
+
+def estimate_tokens(text):
+    """Approximate LLM token count of a text."""
+    return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+def budget_clauses(clauses, max_tokens=None):
+    """The best-ranked clauses that fit in CLAUSE_TOKEN_BUDGET tokens (0 means no limit).
+
+    Clauses arrive best first. One that does not fit is skipped so shorter,
+    lower-ranked ones can still use the room; the top clause is always kept,
+    cut to the budget if it is too long on its own.
+    """
+    max_tokens = int(os.getenv("CLAUSE_TOKEN_BUDGET", 1500)) if max_tokens is None else max_tokens
+    if max_tokens <= 0:
+        return list(clauses)
+    kept, used = [], 0
+    for clause in clauses:
+        tokens = estimate_tokens(clause)
+        if not kept and tokens > max_tokens:
+            clause, tokens = clause[:max_tokens * CHARS_PER_TOKEN], max_tokens
+        if used + tokens <= max_tokens:
+            kept.append(clause)
+            used += tokens
+    if len(kept) < len(clauses):
+        logger.info(f"Kept {len(kept)} of {len(clauses)} clauses within the {max_tokens} token budget")
+    return kept
+
+def llm_memo_key(entities, clauses):
+    """Key an LLM answer on the facts the prompt is built from, with clause order ignored."""
+    clause_hash = hashlib.sha1("\x1f".join(sorted(clauses)).encode()).hexdigest()
+    facts = [
+        os.getenv("LLM_PROVIDER", "gemini"), os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+        entities.get("procedure", "").lower(), entities.get("policy_duration", ""),
+        entities.get("pre_approval", False), clause_hash,
+    ]
+    return "llm_memo:" + hashlib.sha1("\x1f".join(str(f) for f in facts).encode()).hexdigest()
+
+def rule_decision(entities, clauses):
+    """Apply the IRDAI waiting-period rules; returns (decision, LLM prompt or None)."""
+    logger.info(f"Evaluating clauses with entities: {entities}")
+    if not clauses:
+        logger.warning("No clauses provided for evaluation")
+        return {"decision": "Rejected", "amount": 0, "justification": "No relevant clauses found", "clauses": []}, None
+    
+    # Prepare input
+    procedure = entities.get("procedure", "").lower()
+    policy_duration = entities.get("policy_duration", "")
+    pre_approval = entities.get("pre_approval", False)
+    duration_in_months = duration_months(policy_duration)
+    
+    # Check clauses
+    relevant_clauses = []
+    for clause in clauses:
+        clause_lower = clause.lower()
+        if any(term in clause_lower for term in ["hospitalization", "treatment", "surgery", "insured", "waiting period"]):
+            relevant_clauses.append(clause)
+    
+    if not relevant_clauses:
+        logger.warning("No relevant clauses found")
+        return {"decision": "Rejected", "amount": 0, "justification": "No relevant clauses found", "clauses": []}, None
+    # The prompt and the response carry only what fits the token budget
+    relevant_clauses = budget_clauses(relevant_clauses)
+    
+    # Validate waiting period
+    decision = {"decision": "Rejected", "amount": 0, "justification": "", "clauses": relevant_clauses}
+    if procedure in WAITING_PERIODS:
+        required_months = WAITING_PERIODS[procedure]
+        if duration_in_months >= required_months:
+            decision["decision"] = "Approved"
+            decision["amount"] = 50000 if procedure == "appendectomy" else 0
+            decision["justification"] = f"Policy duration ({policy_duration}) meets {required_months} month waiting period for {procedure}."
+            if pre_approval:
+                decision["justification"] += " Pre-approval obtained."
+        else:
+            decision["justification"] = f"{procedure} requires {required_months} month waiting period."
+    else:
+        decision["justification"] = f"No waiting period defined for {procedure}."
+    
+    # Ask Gemini to confirm
+    prompt = f"""
+    Given:
+    - Procedure: {procedure}
+    - Policy duration: {policy_duration}
+    - Pre-approval: {pre_approval}
+    - Clauses: {relevant_clauses}
+    - IRDAI waiting periods: {WAITING_PERIODS}
+    Confirm if the claim is approved or rejected. If approved, suggest an amount (e.g., 50000 for appendectomy). Provide a justification. Return JSON:
+    ```json
+    {{
+        "decision": "Approved or Rejected",
+        "amount": number,
+        "justification": "string",
+        "clauses": [list of clauses]
+    }}
+    ```
+    """
+    return decision, prompt
+
+def merge_llm_decision(decision, response_text):
+    """Merge a Gemini JSON answer into the rule-based decision when they agree."""
+    gemini_decision = json.loads(response_text.strip("```json\n```"))
+    if gemini_decision["decision"] == decision["decision"]:
+        decision["justification"] = gemini_decision["justification"] or decision["justification"]
+        decision["amount"] = gemini_decision["amount"] if gemini_decision["decision"] == "Approved" else 0
+    else:
+        logger.warning(f"Gemini decision {gemini_decision['decision']} conflicts with local decision {decision['decision']}")
+    return decision
+
+def evaluate_clauses(entities, clauses, timeout=None):
+    """Evaluate clauses based on entities and return decision."""
+    timeout = float(os.getenv("LLM_TIMEOUT", 10)) if timeout is None else timeout
+    try:
+        with timed("rules"):
+            decision, prompt = rule_decision(entities, clauses)
+        if prompt is None or not should_ask_llm(entities):
+            LLM_CALLS.inc(outcome="skipped")
+            return decision
+        if timeout <= 0:
+            LLM_CALLS.inc(outcome="no_budget")
+            return decision
+        memo = get_llm_memo()
+        key = llm_memo_key(entities, decision["clauses"])
+        text = memo.local.get(key)
+        fresh = text is None
+        CACHE_LOOKUPS.inc(cache="llm_memo", result="miss" if fresh else "hit")
+        if fresh:
+            try:
+                with timed("llm"):
+                    text = get_llm().generate_content(prompt, request_options={"timeout": timeout}).text
+            except Exception as e:
+                LLM_CALLS.inc(outcome="error")
+                logger.error(f"Gemini error: {str(e)}", exc_info=True)
+        if text is not None:
+            try:
+                merge_llm_decision(decision, text)
+                LLM_CALLS.inc(outcome="answered" if fresh else "memo_hit")
+                if fresh:
+                    memo.local.set(key, text)
+            except Exception as e:
+                LLM_CALLS.inc(outcome="unusable")
+                logger.error(f"Unusable Gemini answer: {str(e)}", exc_info=True)
         
         logger.info(f"Decision: {decision}")
         return decision
     except Exception as e:
         logger.error(f"Decision engine error: {str(e)}", exc_info=True)
-        return {"decision": "Rejected", "amount": 0, "justification": f"Error evaluating clauses: {str(e)}", "clauses": []}
\ No newline at end of file
+        return {"decision": "Rejected", "amount": 0, "justification": f"Error evaluating clauses: {str(e)}", "clauses": []}
+
+async def evaluate_clauses_stream(entities, clauses, timeout=None):
+    """Yield (decision, final) pairs: the rule-based decision first, then the LLM-refined one.
+
+    When the LLM is not consulted the rule decision is the only, final one.
+    The LLM is only consulted when should_ask_llm() allows it, answers are
+    memoised, and if Gemini does not answer within `timeout` seconds
+    (default LLM_TIMEOUT; callers pass what is left of the request's
+    budget) the rule-based decision is repeated as the final one.
+    """
+    timeout = float(os.getenv("LLM_TIMEOUT", 10)) if timeout is None else timeout
+    try:
+        with timed("rules"):
+            decision, prompt = rule_decision(entities, clauses)
+        if prompt is None or not should_ask_llm(entities):
+            LLM_CALLS.inc(outcome="skipped")
+            yield decision, True
+            return
+        if timeout <= 0:
+            LLM_CALLS.inc(outcome="no_budget")
+            logger.warning("No latency budget left for Gemini, using rule-based decision")
+            yield decision, True
+            return
+        yield dict(decision), False
+        memo = get_llm_memo()
+        key = llm_memo_key(entities, decision["clauses"])
+        text = await memo.get(key)
+        fresh = text is None
+        CACHE_LOOKUPS.inc(cache="llm_memo", result="miss" if fresh else "hit")
+        if fresh:
+            try:
+                with timed("llm"):
+                    response = await asyncio.wait_for(get_llm().generate_content_async(prompt), timeout=timeout)
+                text = response.text
+            except asyncio.TimeoutError:
+                LLM_CALLS.inc(outcome="timeout")
+                logger.warning(f"Gemini did not answer within {timeout:.2f}s, using rule-based decision")
+            except Exception as e:
+                LLM_CALLS.inc(outcome="error")
+                logger.error(f"Gemini error: {str(e)}", exc_info=True)
+        if text is not None:
+            try:
+                merge_llm_decision(decision, text)
+                LLM_CALLS.inc(outcome="answered" if fresh else "memo_hit")
+                if fresh:
+                    await memo.set(key, text)
+            except Exception as e:
+                LLM_CALLS.inc(outcome="unusable")
+                logger.error(f"Unusable Gemini answer: {str(e)}", exc_info=True)
+        
+        logger.info(f"Decision: {decision}")
+        yield decision, True
+    except Exception as e:
+        logger.error(f"Decision engine error: {str(e)}", exc_info=True)
+        yield {"decision": "Rejected", "amount": 0, "justification": f"Error evaluating clauses: {str(e)}", "clauses": []}, True
+
+async def evaluate_clauses_async(entities, clauses, timeout=None):
+    """Evaluate clauses, awaiting Gemini without blocking the event loop; returns the final decision."""
+    async for decision, _ in evaluate_clauses_stream(entities, clauses, timeout):
+        pass
+    return decision
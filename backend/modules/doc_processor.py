@@ -1,44 +1,100 @@
-import pdfplumber
 import faiss
+import hashlib
 import numpy as np
 import redis
 import os
+import pickle
+import time
 import logging
 from dotenv import load_dotenv
-from backend.utils.chunker import chunk_text
-from backend.utils.anonymizer import anonymize_text
-from sentence_transformers import SentenceTransformer
+from backend.utils.chunker import chunk_pages
+from backend.utils.extractors import iter_document_pages
+from backend.utils.anonymizer import anonymize_texts
+from backend.modules.id_map import ChunkIdMap, allocate_ids
+from backend.modules.chunk_store import get_chunk_store
+from backend.modules.index_manager import get_index_manager
+from backend.modules.lexical_index import LexicalIndex
+from backend.utils.models import get_embedding_model
+from backend.utils.metrics import timed, record_stage
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Redis
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=int(os.getenv("REDIS_DB", 0)),
-        decode_responses=True
-    )
-    redis_client.ping()
-    logger.info("Connected to Redis")
-except Exception as e:
-    logger.error(f"Failed to connect to Redis: {str(e)}", exc_info=True)
-    raise
-
-# Initialize SentenceTransformer lazily
-_model = None
-def get_model():
-    """Load SentenceTransformer lazily."""
-    global _model
-    if _model is None:
-        logger.info("Loading SentenceTransformer model...")
-        _model = SentenceTransformer(os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
-    return _model
-
-def process_document(file_path, doc_id):
-    """Process a document, extract text, chunk, anonymize, and store embeddings."""
+# Redis connects on first command, so importing this module does not need a live server
+redis_client = redis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=int(os.getenv("REDIS_DB", 0)),
+    decode_responses=True
+)
+
+def embed_chunks(texts, batch_size=None, sort_by_length=None):
+    """Encode texts in batches and return L2-normalised float32 embeddings in input order."""
+    batch_size = int(os.getenv("EMBED_BATCH_SIZE", 64)) if batch_size is None else batch_size
+    if sort_by_length is None:
+        sort_by_length = os.getenv("EMBED_SORT_BY_LENGTH", "true").lower() in ("1", "true", "yes")
+    model = get_embedding_model()
+    if not sort_by_length:
+        return model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+    # Bucket similar lengths together so each batch pads to roughly the same size
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch_embeddings = model.encode(
+            [texts[i] for i in batch], batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+        embeddings[batch] = batch_embeddings
+    return embeddings
+
+def _report(progress, stage, done=0, total=0):
+    """Forward a stage update to the caller's progress callback, if any."""
+    if progress is not None:
+        try:
+            progress(stage, done, total)
+        except Exception as e:
+            logger.warning(f"Progress callback failed at stage {stage}: {str(e)}")
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """Content hash of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_sha1(chunk):
+    """Content hash of a raw (pre-anonymization) chunk."""
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+def doc_hash_key(doc_id):
+    return f"doc_hash:{doc_id}"
+
+def file_hash_key(file_hash):
+    return f"file_hash:{file_hash}"
+
+def chunk_hashes_key(doc_id):
+    return f"chunk_hashes:{doc_id}"
+
+def allocate_chunk_ids(snapshot, store, count):
+    """Fresh global ids for `count` new chunks, above every id the index or chunk store holds."""
+    return allocate_ids(redis_client, count, floor=max(snapshot.next_id, store.next_id()))
+
+def prepare_document(file_path, doc_id, progress=None):
+    """Extract, chunk, anonymize and embed a document without touching the index.
+
+    Returns a summary with a status of "unchanged" or "duplicate" when there
+    is nothing to index, otherwise one with status "prepared" that carries
+    the document's ids, chunk numbers, offsets, pages, embeddings, texts and
+    hashes for commit_document or commit_documents. New chunk texts are
+    already in the chunk store, under fresh ids no search returns until the
+    document is committed.
+    """
     try:
         logger.info(f"Starting document processing for {file_path} with doc_id {doc_id}")
         
@@ -47,78 +103,293 @@ def process_document(file_path, doc_id):
             logger.error(f"File {file_path} does not exist")
             raise FileNotFoundError(f"File {file_path} does not exist")
         
-        # Extract text from PDF
-        logger.info(f"Extracting text from {file_path}")
-        text = ""
+        # Skip files whose exact content is already indexed
+        manager = get_index_manager()
+        snapshot = manager.snapshot()
+        file_hash = file_sha256(file_path)
+        if redis_client.get(doc_hash_key(doc_id)) == file_hash and snapshot.ids_for_doc(doc_id).size:
+            logger.info(f"{file_path} is unchanged since it was indexed as {doc_id}, skipping")
+            return {"status": "unchanged", "doc_id": doc_id}
+        owner = redis_client.get(file_hash_key(file_hash))
+        if owner and owner != doc_id and snapshot.ids_for_doc(owner).size:
+            logger.info(f"{file_path} has the same content as {owner}, skipping")
+            return {"status": "duplicate", "doc_id": doc_id, "duplicate_of": owner}
+        
+        # Extract pages (in parallel for PDFs) and chunk them as they stream in
+        logger.info(f"Extracting and chunking text from {file_path}")
+        _report(progress, "extracting")
+        chunks = []
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text() or ""
-                    if page_text.strip():
-                        text += page_text + "\n"
+            with timed("ingest_extract"):
+                for page_no, offset, chunk in chunk_pages(iter_document_pages(file_path)):
+                    chunks.append((page_no, offset, chunk))
+                    _report(progress, "extracting", page_no, 0)
         except Exception as e:
-            logger.error(f"PDF text extraction failed for {file_path}: {str(e)}", exc_info=True)
+            logger.error(f"Text extraction failed for {file_path}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to extract text from {file_path}: {str(e)}")
         
-        if not text.strip():
+        if not chunks:
             logger.error(f"No text extracted from {file_path}")
-            raise ValueError(f"No text extracted from {file_path}. Ensure the PDF contains readable text.")
+            raise ValueError(f"No text extracted from {file_path}. Ensure the document contains readable text or that OCR is available.")
         
-        # Chunk text
-        logger.info(f"Chunking text for {doc_id}")
-        chunks = chunk_text(text)
-        if not chunks:
-            logger.error(f"No chunks created for {file_path}")
-            raise ValueError(f"No chunks created for {file_path}")
+        # Chunks that are byte-identical to the previous version keep their id, text and vector
+        # New chunks get fresh ids and chunk numbers so they never overwrite text a running search may still read
+        previous = {}
+        old_entries = [snapshot.lookup(idx) for idx in snapshot.ids_for_doc(doc_id)]
+        if old_entries:
+            for chunk_hash, value in redis_client.hgetall(chunk_hashes_key(doc_id)).items():
+                idx, chunk_no = value.split(",")
+                previous[chunk_hash] = (int(idx), int(chunk_no))
+        next_chunk_no = max((entry[1] for entry in old_entries if entry), default=-1) + 1
+        
+        hashes = [chunk_sha1(chunk) for _, _, chunk in chunks]
+        reuse = {}
+        for i, chunk_hash in enumerate(hashes):
+            if chunk_hash in previous:
+                # pop: a repeated chunk only reuses the previous copy once
+                reuse[i] = previous.pop(chunk_hash)
+        
+        # Reused chunks keep their stored text; any the chunk store lacks are processed as new
+        store = get_chunk_store()
+        stored_texts = dict(zip(reuse, store.get([idx for idx, _ in reuse.values()])))
+        for i, text in stored_texts.items():
+            if text is None:
+                del reuse[i]
+        
+        # Anonymize new chunks in one batched NER pass
+        fresh = [i for i in range(len(chunks)) if i not in reuse]
+        logger.info(f"Anonymizing and embedding {len(fresh)} of {len(chunks)} chunks for {doc_id}")
+        anonymized = {}
+        try:
+            with timed("ingest_anonymize"):
+                for n, (i, anon_chunk) in enumerate(zip(fresh, anonymize_texts(chunks[i][2] for i in fresh))):
+                    _report(progress, "anonymizing", n, len(fresh))
+                    anonymized[i] = anon_chunk
+        except Exception as e:
+            logger.error(f"Failed to anonymize chunks for {doc_id}: {str(e)}", exc_info=True)
+            raise
         
-        # Anonymize and create embeddings
-        logger.info(f"Anonymizing and embedding {len(chunks)} chunks for {doc_id}")
-        model = get_model()
-        embeddings = []
-        redis_keys = []
-        for i, chunk in enumerate(chunks):
-            try:
-                anon_chunk = anonymize_text(chunk)
+        reused = []      # (position, id, chunk_no)
+        reused_texts = []
+        new_chunks = []  # (position, anonymized text, chunk_no)
+        chunk_hashes = []
+        offsets = []
+        pages = []
+        for i, (page_no, offset, chunk) in enumerate(chunks):
+            if i in reuse:
+                idx, chunk_no = reuse[i]
+                reused.append((len(chunk_hashes), idx, chunk_no))
+                reused_texts.append(stored_texts[i])
+            else:
+                anon_chunk = anonymized[i]
                 if not anon_chunk.strip():
                     logger.warning(f"Chunk {i} for {doc_id} is empty after anonymization")
                     continue
-                embedding = model.encode(anon_chunk, convert_to_numpy=True)
-                embeddings.append(embedding)
-                redis_key = f"doc_{doc_id}:{i}"
-                redis_client.set(redis_key, anon_chunk)
-                redis_keys.append(redis_key)
-                logger.debug(f"Stored chunk {i} in Redis with key {redis_key}")
-            except Exception as e:
-                logger.error(f"Failed to process chunk {i} for {doc_id}: {str(e)}", exc_info=True)
-                raise
+                chunk_no = next_chunk_no
+                next_chunk_no += 1
+                new_chunks.append((len(chunk_hashes), anon_chunk, chunk_no))
+            chunk_hashes.append(hashes[i])
+            offsets.append(offset)
+            pages.append(page_no)
         
-        if not embeddings:
+        if not chunk_hashes:
             logger.error(f"No valid embeddings created for {file_path}")
             raise ValueError(f"No valid embeddings created for {file_path}")
         
-        # Store embeddings in FAISS
-        logger.info(f"Storing {len(embeddings)} embeddings in FAISS for {doc_id}")
-        dimension = embeddings[0].shape[0]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(np.array(embeddings, dtype=np.float32))
+        # Reuse stored vectors (read from the raw vectors kept beside non-flat bases); any that are missing are re-embedded
+        reused_vectors = [snapshot.reconstruct(idx) for _, idx, _ in reused]
+        lost = [r for r, vector in zip(reused, reused_vectors) if vector is None]
+        if lost:
+            lost_texts = [text for text, vector in zip(reused_texts, reused_vectors) if vector is None]
+            logger.info(f"Re-embedding {len(lost)} unchanged chunks the index cannot reconstruct exactly")
         
-        faiss_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "faiss_index"))
-        os.makedirs(faiss_dir, exist_ok=True)
-        faiss_path = os.path.join(faiss_dir, f"{doc_id}.faiss")
+        # Create embeddings in batches
+        _report(progress, "embedding", 0, len(new_chunks))
+        embed_start = time.perf_counter()
+        to_embed = [text for _, text, _ in new_chunks] + (lost_texts if lost else [])
+        embedded = embed_chunks(to_embed) if to_embed else None
+        embed_seconds = time.perf_counter() - embed_start
+        record_stage("ingest_embed", embed_seconds)
         
-        # Verify FAISS path is writable
-        if not os.access(faiss_dir, os.W_OK):
-            logger.error(f"No write permission for FAISS directory {faiss_dir}")
-            raise PermissionError(f"No write permission for FAISS directory {faiss_dir}")
+        # Store new chunk text under fresh ids before the index can return them
+        store_start = time.perf_counter()
+        new_ids = allocate_chunk_ids(snapshot, store, len(new_chunks)) if new_chunks else np.empty(0, dtype=np.int64)
+        store.put(doc_id, new_ids, [text for _, text, _ in new_chunks], [pages[pos] for pos, _, _ in new_chunks])
+        store_seconds = time.perf_counter() - store_start
+        record_stage("ingest_store", store_seconds)
+        logger.info(
+            f"Embedded {len(new_chunks)} chunks for {doc_id} at "
+            f"{len(new_chunks) / max(embed_seconds + store_seconds, 1e-9):.1f} chunks/sec "
+            f"(embed {embed_seconds:.2f}s, store {store_seconds:.2f}s); reused {len(reused)} unchanged chunks"
+        )
         
-        faiss.write_index(index, faiss_path)
-        logger.info(f"Saved FAISS index to {faiss_path}")
+        # Assemble vectors, ids and chunk numbers in document order
+        count = len(chunk_hashes)
+        ids = np.empty(count, dtype=np.int64)
+        chunk_nos = np.empty(count, dtype=np.int32)
+        dimension = embedded.shape[1] if embedded is not None else reused_vectors[0].shape[0]
+        embeddings = np.empty((count, dimension), dtype=np.float32)
+        if new_chunks:
+            positions = [pos for pos, _, _ in new_chunks]
+            ids[positions] = new_ids
+            chunk_nos[positions] = [n for _, _, n in new_chunks]
+            embeddings[positions] = embedded[:len(new_chunks)]
+        lost_rows = iter(embedded[len(new_chunks):]) if lost else iter(())
+        for (pos, idx, chunk_no), vector in zip(reused, reused_vectors):
+            ids[pos] = idx
+            chunk_nos[pos] = chunk_no
+            embeddings[pos] = vector if vector is not None else next(lost_rows)
         
-        # Store FAISS index mapping in Redis
-        redis_client.set(f"faiss_index:{doc_id}", faiss_path)
-        logger.info(f"Processed {len(chunks)} chunks and stored {len(embeddings)} embeddings for {doc_id}")
-        logger.debug(f"Redis keys created: {redis_keys}")
+        texts = [None] * count
+        for pos, anon_chunk, _ in new_chunks:
+            texts[pos] = anon_chunk
+        for (pos, _, _), text in zip(reused, reused_texts):
+            texts[pos] = text
+        return {
+            "status": "prepared", "doc_id": doc_id, "file_hash": file_hash,
+            "ids": ids, "chunk_nos": chunk_nos, "offsets": offsets, "pages": pages, "embeddings": embeddings,
+            "texts": texts, "chunk_hashes": chunk_hashes,
+            "chunks": count, "embedded": len(new_chunks), "reused": len(reused),
+        }
+    
+    except Exception as e:
+        logger.error(f"Document preparation failed for {file_path}: {str(e)}", exc_info=True)
+        raise
+
+def stage_document(file_path, doc_id, staging_dir):
+    """prepare_document for a bulk import, with the prepared document written to staging_dir.
+
+    Returns the summary without the vectors, texts and per-chunk arrays;
+    its "staged" entry names the file commit_documents reads them back from.
+    """
+    prepared = prepare_document(file_path, doc_id)
+    if prepared["status"] != "prepared":
+        return prepared
+    path = os.path.join(staging_dir, f"{doc_id}.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(prepared, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {**{key: prepared[key] for key in ("status", "doc_id", "chunks", "embedded", "reused")}, "staged": path}
+
+def _load_staged(prepared):
+    """The full prepared document behind a stage_document summary."""
+    if "staged" not in prepared:
+        return prepared
+    with open(prepared["staged"], "rb") as f:
+        return pickle.load(f)
+
+def _segment(prepared):
+    """(doc_id, index, id_map, lexical) of a prepared document, as the index manager takes them."""
+    doc_id, ids, embeddings = prepared["doc_id"], prepared["ids"], prepared["embeddings"]
+    # Unit vectors in an inner-product index: the search score is the cosine similarity
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+    index.add_with_ids(embeddings, ids)
+    id_map = ChunkIdMap()
+    id_map.add(doc_id, ids, prepared["chunk_nos"], prepared["offsets"], prepared["pages"])
+    # BM25 postings for the whole document, indexed under the same ids
+    lexical = LexicalIndex.build(ids, prepared["texts"])
+    return doc_id, index, id_map, lexical
+
+def _check_writable(faiss_dir):
+    os.makedirs(faiss_dir, exist_ok=True)
+    if not os.access(faiss_dir, os.W_OK):
+        logger.error(f"No write permission for FAISS directory {faiss_dir}")
+        raise PermissionError(f"No write permission for FAISS directory {faiss_dir}")
+
+def _record_document(prepared, faiss_path):
+    """Drop the chunks a committed document no longer has and record its hashes; returns its summary."""
+    doc_id, ids, file_hash = prepared["doc_id"], prepared["ids"], prepared["file_hash"]
+    store = get_chunk_store()
+    stale = store.delete_doc(doc_id, keep_ids=ids)
+    if stale:
+        logger.info(f"Removed {stale} stale chunks from the previous version of {doc_id}")
+        store.maybe_compact()
     
+    # Record content hashes so the next upload can skip unchanged work
+    old_file_hash = redis_client.get(doc_hash_key(doc_id))
+    pipe = redis_client.pipeline()
+    if old_file_hash and old_file_hash != file_hash and redis_client.get(file_hash_key(old_file_hash)) == doc_id:
+        pipe.delete(file_hash_key(old_file_hash))
+    pipe.delete(chunk_hashes_key(doc_id))
+    pipe.hset(chunk_hashes_key(doc_id), mapping={
+        chunk_hash: f"{idx},{chunk_no}"
+        for chunk_hash, idx, chunk_no in zip(prepared["chunk_hashes"], ids, prepared["chunk_nos"])
+    })
+    pipe.set(doc_hash_key(doc_id), file_hash)
+    pipe.set(file_hash_key(file_hash), doc_id)
+    # Store FAISS index mapping in Redis
+    pipe.set(f"faiss_index:{doc_id}", faiss_path)
+    pipe.execute()
+    logger.info(
+        f"Processed {prepared['chunks']} chunks for {doc_id}: "
+        f"{prepared['embedded']} embedded, {prepared['reused']} reused"
+    )
+    return {
+        "status": "indexed", "doc_id": doc_id,
+        "chunks": prepared["chunks"], "embedded": prepared["embedded"], "reused": prepared["reused"],
+    }
+
+def commit_document(prepared):
+    """Append a prepared document to the corpus index as a segment, replacing any earlier version."""
+    manager = get_index_manager()
+    _check_writable(manager.faiss_dir)
+    logger.info(f"Storing {prepared['chunks']} embeddings in FAISS for {prepared['doc_id']}")
+    index_start = time.perf_counter()
+    manager.add_document(*_segment(prepared))
+    record_stage("ingest_index", time.perf_counter() - index_start)
+    faiss_path = manager.segment_path(prepared["doc_id"])
+    logger.info(f"Saved FAISS segment with {prepared['chunks']} vectors to {faiss_path}")
+    return _record_document(prepared, faiss_path)
+
+def commit_documents(prepared_docs, index_type=None):
+    """Publish several prepared (or staged) documents as one index commit.
+
+    They are folded, together with any pending segments, into a rebuilt
+    base index, so searches see either none of them or all of them. Like
+    any compaction this holds the whole corpus's vectors while it runs;
+    staged documents are read back one at a time.
+    """
+    manager = get_index_manager()
+    _check_writable(manager.faiss_dir)
+    index_start = time.perf_counter()
+    manager.compact(index_type, documents=[_segment(_load_staged(prepared)) for prepared in prepared_docs])
+    record_stage("ingest_index", time.perf_counter() - index_start)
+    logger.info(f"Committed {len(prepared_docs)} documents to {manager.index_path}")
+    return [_record_document(_load_staged(prepared), manager.index_path) for prepared in prepared_docs]
+
+def process_document(file_path, doc_id, progress=None):
+    """Process a document, extract text, chunk, anonymize, and store embeddings.
+
+    progress, if given, is called as progress(stage, done, total) as the
+    document moves through extraction and chunking, anonymization, embedding
+    and indexing.
+
+    Ingestion is content-addressed: an unchanged file, or a file already
+    indexed under another doc_id, is skipped, and chunks whose text did not
+    change keep their vectors, ids and stored text. Returns a summary dict
+    with a status of "indexed", "unchanged" or "duplicate".
+    """
+    try:
+        prepared = prepare_document(file_path, doc_id, progress)
+        if prepared["status"] != "prepared":
+            return prepared
+        _report(progress, "indexing", prepared["chunks"], prepared["chunks"])
+        return commit_document(prepared)
     except Exception as e:
         logger.error(f"Document processing failed for {file_path}: {str(e)}", exc_info=True)
+        raise
+
+def delete_document(doc_id):
+    """Remove a document's vectors and chunks from the corpus."""
+    try:
+        logger.info(f"Deleting document {doc_id}")
+        entries = get_index_manager().delete_document(doc_id)
+        get_chunk_store().delete_doc(doc_id)
+        file_hash = redis_client.get(doc_hash_key(doc_id))
+        if file_hash and redis_client.get(file_hash_key(file_hash)) == doc_id:
+            redis_client.delete(file_hash_key(file_hash))
+        redis_client.delete(f"faiss_index:{doc_id}", doc_hash_key(doc_id), chunk_hashes_key(doc_id))
+        logger.info(f"Deleted {len(entries)} chunks for {doc_id}")
+        return len(entries)
+    except Exception as e:
+        logger.error(f"Document deletion failed for {doc_id}: {str(e)}", exc_info=True)
         raise
\ No newline at end of file
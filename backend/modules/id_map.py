@@ -0,0 +1,153 @@
+import numpy as np
+import os
+import logging
+from redis.exceptions import WatchError
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ID_COUNTER_KEY = "faiss:next_id"
+
+
+def chunk_key(doc_id, chunk_no):
+    """Legacy Redis key that held the text of a chunk before the chunk store (see migrate_chunks.py)."""
+    return f"doc_{doc_id}:{chunk_no}"
+
+
+def allocate_ids(redis_client, count, floor=0):
+    """Reserve `count` consecutive global FAISS ids, none below `floor`.
+
+    floor is one past the highest id already on disk. If the Redis counter
+    was lost (a flush, or a restart without persistence) it restarts there
+    instead of handing out ids the index and chunk store still use.
+    """
+    with redis_client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(ID_COUNTER_KEY)
+                counter = int(pipe.get(ID_COUNTER_KEY) or 0)
+                start = max(counter, int(floor))
+                if start > counter:
+                    logger.warning(f"FAISS id counter was at {counter}, behind ids in use; restarting it at {start}")
+                pipe.multi()
+                pipe.set(ID_COUNTER_KEY, start + count)
+                pipe.execute()
+                return np.arange(start, start + count, dtype=np.int64)
+            except WatchError:
+                # Another process allocated in between; read the counter again
+                continue
+
+
+class ChunkIdMap:
+    """Compact global FAISS id -> (doc_id, chunk_no, offset, page) table.
+
+    Ids are handed out from a single counter, so the table is a set of dense
+    arrays covering [start, start + len) and every lookup is O(1). Slots that
+    were never assigned, or were removed, have doc_idx == -1.
+    """
+
+    def __init__(self, docs=None, doc_idx=None, chunk_no=None, offset=None, page=None, start=0):
+        self.docs = list(docs) if docs is not None else []
+        self._doc_pos = {doc: i for i, doc in enumerate(self.docs)}
+        self.start = int(start)
+        self.doc_idx = doc_idx if doc_idx is not None else np.empty(0, dtype=np.int32)
+        self.chunk_no = chunk_no if chunk_no is not None else np.empty(0, dtype=np.int32)
+        self.offset = offset if offset is not None else np.empty(0, dtype=np.int64)
+        self.page = page if page is not None else np.full(self.doc_idx.shape[0], -1, dtype=np.int32)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.doc_idx >= 0))
+
+    @property
+    def end(self):
+        """One past the highest id the table covers."""
+        return self.start + int(self.doc_idx.shape[0])
+
+    def _cover(self, low, high):
+        """Extend the arrays so ids in [low, high) have a slot."""
+        size = self.doc_idx.shape[0]
+        if size == 0:
+            self.start = low
+        new_start = min(self.start, low)
+        new_end = max(self.start + size, high)
+        if new_start == self.start and new_end == self.start + size:
+            return
+        before = self.start - new_start
+        after = new_end - self.start - size
+        self.doc_idx = np.concatenate([np.full(before, -1, np.int32), self.doc_idx, np.full(after, -1, np.int32)])
+        self.chunk_no = np.concatenate([np.full(before, -1, np.int32), self.chunk_no, np.full(after, -1, np.int32)])
+        self.offset = np.concatenate([np.full(before, -1, np.int64), self.offset, np.full(after, -1, np.int64)])
+        self.page = np.concatenate([np.full(before, -1, np.int32), self.page, np.full(after, -1, np.int32)])
+        self.start = new_start
+
+    def add(self, doc_id, ids, chunk_nos, offsets=None, pages=None):
+        """Record the location of each id."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size == 0:
+            return
+        if doc_id not in self._doc_pos:
+            self._doc_pos[doc_id] = len(self.docs)
+            self.docs.append(doc_id)
+        self._cover(int(ids.min()), int(ids.max()) + 1)
+        slots = ids - self.start
+        self.doc_idx[slots] = self._doc_pos[doc_id]
+        self.chunk_no[slots] = np.asarray(chunk_nos, dtype=np.int32)
+        self.offset[slots] = -1 if offsets is None else np.asarray(offsets, dtype=np.int64)
+        self.page[slots] = -1 if pages is None else np.asarray(pages, dtype=np.int32)
+
+    def remove(self, ids):
+        """Forget the given ids; unknown ids are ignored."""
+        slots = np.asarray(ids, dtype=np.int64) - self.start
+        slots = slots[(slots >= 0) & (slots < self.doc_idx.shape[0])]
+        self.doc_idx[slots] = -1
+
+    def merge(self, other):
+        """Copy every assigned entry of another table into this one."""
+        for pos, doc_id in enumerate(other.docs):
+            slots = np.flatnonzero(other.doc_idx == pos)
+            if slots.size:
+                self.add(doc_id, slots + other.start, other.chunk_no[slots], other.offset[slots], other.page[slots])
+
+    def ids_for_doc(self, doc_id):
+        """All ids currently assigned to a document."""
+        pos = self._doc_pos.get(doc_id)
+        if pos is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.doc_idx == pos).astype(np.int64) + self.start
+
+    def lookup(self, idx):
+        """Return (doc_id, chunk_no, offset, page) for an id, or None if unknown."""
+        slot = int(idx) - self.start
+        if slot < 0 or slot >= self.doc_idx.shape[0] or self.doc_idx[slot] < 0:
+            return None
+        return self.docs[self.doc_idx[slot]], int(self.chunk_no[slot]), int(self.offset[slot]), int(self.page[slot])
+
+    def save(self, path):
+        """Write the table atomically."""
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(
+            tmp_path,
+            docs=np.array(self.docs, dtype=str),
+            start=np.int64(self.start),
+            doc_idx=self.doc_idx,
+            chunk_no=self.chunk_no,
+            offset=self.offset,
+            page=self.page,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a table written by save(); a missing file gives an empty table."""
+        if not os.path.exists(path):
+            logger.warning(f"No id map found at {path}")
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                docs=[str(d) for d in data["docs"]],
+                doc_idx=data["doc_idx"],
+                chunk_no=data["chunk_no"],
+                offset=data["offset"],
+                page=data["page"] if "page" in data.files else None,
+                start=int(data["start"]) if "start" in data.files else 0,
+            )
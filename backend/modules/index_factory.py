@@ -0,0 +1,158 @@
+import faiss
+import numpy as np
+import json
+import math
+import os
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# How flat, IVF-flat and HNSW indexes store each vector component; ivf_pq has its own codes
+VECTOR_STORAGES = ("float32", "float16", "sq8")
+STORAGE_CODES = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8"}
+
+# Points per centroid FAISS wants before it stops warning about k-means quality
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_config(index_type=None):
+    """Read build and search parameters from the environment."""
+    return {
+        "type": (index_type or os.getenv("FAISS_INDEX_TYPE", "flat")).lower(),
+        "storage": os.getenv("FAISS_VECTOR_STORAGE", "float32").lower(),
+        "nlist": int(os.getenv("FAISS_NLIST", 0)),
+        "pq_m": int(os.getenv("FAISS_PQ_M", 48)),
+        "pq_nbits": int(os.getenv("FAISS_PQ_NBITS", 8)),
+        "hnsw_m": int(os.getenv("FAISS_HNSW_M", 32)),
+        "ef_construction": int(os.getenv("FAISS_EF_CONSTRUCTION", 200)),
+        "nprobe": int(os.getenv("FAISS_NPROBE", 16)),
+        "ef_search": int(os.getenv("FAISS_EF_SEARCH", 64)),
+        "train_sample": int(os.getenv("FAISS_TRAIN_SAMPLE", 100000)),
+    }
+
+
+def _pq_m(dimension, requested):
+    """Largest sub-quantizer count <= requested that divides the dimension."""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type, dimension, ntotal, config):
+    """Pick a FAISS factory string for the corpus size, or None if it is too small to train."""
+    storage = config.get("storage", "float32")
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Unknown vector storage {storage}, expected one of {VECTOR_STORAGES}")
+    codes = STORAGE_CODES[storage]
+    if index_type == "flat":
+        return codes
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']},{codes}"
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        raise ValueError(f"Unknown FAISS index type {index_type}, expected one of {INDEX_TYPES}")
+    nlist = config["nlist"] or max(1, min(int(4 * math.sqrt(ntotal)), ntotal // MIN_POINTS_PER_CENTROID))
+    min_train = nlist * MIN_POINTS_PER_CENTROID
+    if index_type == "ivf_pq":
+        min_train = max(min_train, (1 << config["pq_nbits"]) * MIN_POINTS_PER_CENTROID)
+    if ntotal < min_train:
+        return None
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{codes}"
+    return f"IVF{nlist},PQ{_pq_m(dimension, config['pq_m'])}x{config['pq_nbits']}"
+
+
+def build_index(vectors, ids, index_type=None, config=None):
+    """Build an IDMap2 index of the configured type over L2-normalised vectors.
+
+    IVF variants are trained on a random sample of the corpus. Corpora too
+    small to train fall back to a flat index. Returns (index, params) where
+    params records what was actually built.
+    """
+    config = dict(config or index_config(index_type))
+    if index_type:
+        config["type"] = index_type
+    dimension = vectors.shape[1]
+    spec = factory_string(config["type"], dimension, vectors.shape[0], config)
+    if spec is None:
+        logger.warning(f"{vectors.shape[0]} vectors are too few to train {config['type']}, building a flat index")
+        config["type"] = "flat"
+        spec = factory_string("flat", dimension, vectors.shape[0], config)
+    index = faiss.index_factory(dimension, f"IDMap2,{spec}", faiss.METRIC_INNER_PRODUCT)
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = config["ef_construction"]
+    if not index.is_trained:
+        sample = vectors
+        if vectors.shape[0] > config["train_sample"]:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(vectors.shape[0], config["train_sample"], replace=False)]
+        logger.info(f"Training {spec} index on {sample.shape[0]} vectors")
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    if ids.size:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+    apply_search_defaults(index, config)
+    params = {
+        "type": config["type"], "storage": "float32" if config["type"] == "ivf_pq" else config["storage"],
+        "factory": spec, "nprobe": config["nprobe"], "ef_search": config["ef_search"],
+    }
+    return index, params
+
+
+def is_exact(index):
+    """True if an index returns stored vectors unchanged (float16 counts: re-encoding it loses nothing more)."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, faiss.IndexIVF):
+        return isinstance(inner, faiss.IndexIVFFlat)
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16
+    return True
+
+
+def apply_search_defaults(index, params):
+    """Set the default nprobe / efSearch on an index."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = params.get("nprobe", inner.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = params.get("ef_search", inner.hnsw.efSearch)
+
+
+def search_parameters(index, selector=None, nprobe=None, ef_search=None):
+    """Per-request search parameters for an index, or None when the defaults apply."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or inner.nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or inner.hnsw.efSearch
+    elif selector is None:
+        return None
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def save_params(params, path):
+    """Persist build parameters next to the index."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(params, f)
+    os.replace(tmp_path, path)
+
+
+def load_params(path):
+    """Read build parameters written by save_params(); a missing file gives {}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
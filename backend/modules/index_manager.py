@@ -0,0 +1,586 @@
+import faiss
+import hashlib
+import numpy as np
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from backend.modules.id_map import ChunkIdMap
+from backend.modules.index_factory import (
+    apply_search_defaults, build_index, is_exact, load_params, save_params, search_parameters,
+)
+from backend.modules.lexical_index import LexicalIndex, bm25_search
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FAISS_DIR = os.getenv("FAISS_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "faiss_index")))
+FAISS_INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")
+SEGMENTS_DIRNAME = "segments"
+TOMBSTONES_FILENAME = "tombstones.npy"
+
+
+def id_map_path(index_path):
+    """Path of the id map that belongs to an index file."""
+    return os.path.splitext(index_path)[0] + ".ids.npz"
+
+
+def params_path(index_path):
+    """Path of the build parameters that belong to an index file."""
+    return os.path.splitext(index_path)[0] + ".params.json"
+
+
+def lexical_path(index_path):
+    """Path of the BM25 postings that belong to an index file."""
+    return os.path.splitext(index_path)[0] + ".bm25.npy"
+
+
+def vectors_paths(index_path):
+    """Paths of the raw vectors and their ids kept for retraining non-flat indexes."""
+    stem = os.path.splitext(index_path)[0]
+    return stem + ".vectors.npy", stem + ".vector_ids.npy"
+
+
+def to_cosine(index, scores):
+    """Convert FAISS scores for L2-normalised vectors to cosine similarity."""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return scores
+    # Legacy L2 indexes return squared distances: |a - b|^2 = 2 - 2cos for unit vectors
+    return 1.0 - scores / 2.0
+
+
+def write_index_atomic(index, path):
+    """Write a FAISS index so readers never see a partial file."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def index_vectors(index):
+    """Return (ids, vectors) stored in an IndexIDMap2."""
+    if not isinstance(index, faiss.IndexIDMap):
+        raise ValueError(
+            f"{type(index).__name__} index has no FAISS id map; it predates chunk ids, re-upload its documents"
+        )
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    if not index.ntotal:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    return ids, index.index.reconstruct_n(0, index.ntotal)
+
+
+def corpus_version(files):
+    """Fingerprint of the index files; every process that sees the same files gets the same value."""
+    digest = hashlib.sha1()
+    for path, mtime in sorted(files.items()):
+        digest.update(f"{path}:{mtime}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class IndexSnapshot:
+    """Immutable view of the corpus index that served a search.
+
+    The corpus is a compacted base index plus one small segment per document
+    ingested since the last compaction. Base ids belonging to re-uploaded or
+    deleted documents are tombstoned until compaction drops them.
+    """
+
+    def __init__(self, base=None, base_id_map=None, segments=None, tombstones=None, generation=0, files=None,
+                 base_lexical=None, segment_lexical=None, base_vectors=None):
+        self.base = base
+        self.base_id_map = base_id_map if base_id_map is not None else ChunkIdMap()
+        self.segments = segments or {}
+        self.tombstones = tombstones if tombstones is not None else np.empty(0, dtype=np.int64)
+        self.generation = generation
+        self.files = files or {}
+        self.base_lexical = base_lexical
+        self.segment_lexical = segment_lexical or {}
+        self._lexical_mask = None
+        # (ids, vectors) kept beside non-flat and compressed bases; exact even where the index cannot reconstruct
+        self.base_vectors = base_vectors
+        self._base_vector_order = None
+        # generation counts reloads in this process; version identifies the corpus across processes
+        self.version = corpus_version(self.files)
+        self._selector = None
+        self._excluded = None
+        if self.base is not None and self.tombstones.size:
+            self._excluded = faiss.IDSelectorBatch(self.tombstones.size, faiss.swig_ptr(self.tombstones))
+            self._selector = faiss.IDSelectorNot(self._excluded)
+
+    @property
+    def index(self):
+        """The base index, or any segment when nothing has been compacted yet."""
+        if self.base is not None:
+            return self.base
+        return next((index for index, _ in self.segments.values()), None)
+
+    @property
+    def ntotal(self):
+        """Number of live vectors across base and segments."""
+        total = sum(index.ntotal for index, _ in self.segments.values())
+        if self.base is not None:
+            total += self.base.ntotal - self.tombstones.size
+        return total
+
+    @property
+    def next_id(self):
+        """One past the highest id in the base or any segment, including tombstoned ones."""
+        return max([self.base_id_map.end] + [id_map.end for _, id_map in self.segments.values()])
+
+    def lookup(self, idx):
+        """Return (doc_id, chunk_no, offset, page) for an id, or None if unknown."""
+        for _, id_map in self.segments.values():
+            entry = id_map.lookup(idx)
+            if entry:
+                return entry
+        return self.base_id_map.lookup(idx)
+
+    def ids_for_doc(self, doc_id):
+        """Ids of a document that are live in this snapshot."""
+        base_ids = self.base_id_map.ids_for_doc(doc_id)
+        if self.tombstones.size:
+            base_ids = base_ids[~np.isin(base_ids, self.tombstones)]
+        if doc_id not in self.segments:
+            return base_ids
+        return np.concatenate([base_ids, self.segments[doc_id][1].ids_for_doc(doc_id)])
+
+    def lexical_search(self, query, k):
+        """BM25 (scores, ids) over the base and segment postings, tombstoned base ids excluded."""
+        if self.base_lexical is not None and self._lexical_mask is None:
+            self._lexical_mask = np.isin(self.base_lexical.doc_ids, self.tombstones)
+        parts = [(self.base_lexical, self._lexical_mask)]
+        parts += [(lexical, None) for lexical in self.segment_lexical.values()]
+        return bm25_search(parts, query, k)
+
+    def reconstruct(self, idx):
+        """Return the exact stored vector for an id, or None if it is unknown or only lossily encoded."""
+        idx = int(idx)
+        for index, id_map in self.segments.values():
+            if id_map.lookup(idx):
+                return index.reconstruct(idx)
+        if self.base is None or self.base_id_map.lookup(idx) is None:
+            return None
+        if self.base_vectors is not None:
+            ids, vectors = self.base_vectors
+            if self._base_vector_order is None:
+                self._base_vector_order = np.argsort(ids, kind="stable")
+            pos = int(np.searchsorted(ids, idx, sorter=self._base_vector_order))
+            if pos < ids.shape[0] and ids[self._base_vector_order[pos]] == idx:
+                return np.array(vectors[self._base_vector_order[pos]], dtype=np.float32)
+            return None
+        if not is_exact(self.base):
+            return None
+        try:
+            return self.base.reconstruct(idx)
+        except RuntimeError:
+            # IVF indexes can only reconstruct once a direct map has been built
+            return None
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        """Search base and segments and return (cosine similarities, ids), best first.
+
+        Queries must be L2-normalised float32 rows. nprobe / ef_search
+        override the base index defaults for this call. Missing results are
+        padded with id -1 and similarity -inf.
+        """
+        parts = []
+        if self.base is not None and self.base.ntotal:
+            params = search_parameters(self.base, self._selector, nprobe, ef_search)
+            distances, ids = self.base.search(queries, k, params=params)
+            parts.append((to_cosine(self.base, distances), ids))
+        for index, _ in self.segments.values():
+            if index.ntotal:
+                distances, ids = index.search(queries, min(k, index.ntotal))
+                parts.append((to_cosine(index, distances), ids))
+        nq = queries.shape[0]
+        out_sims = np.full((nq, k), -np.inf, dtype=np.float32)
+        out_ids = np.full((nq, k), -1, dtype=np.int64)
+        if not parts:
+            return out_sims, out_ids
+        sims = np.concatenate([p[0] for p in parts], axis=1)
+        ids = np.concatenate([p[1] for p in parts], axis=1)
+        order = np.argsort(-sims, axis=1, kind="stable")
+        for row in range(nq):
+            seen = set()
+            filled = 0
+            for col in order[row]:
+                idx = int(ids[row, col])
+                # A vector can briefly live in both a segment and a freshly compacted base
+                if idx < 0 or idx in seen:
+                    continue
+                seen.add(idx)
+                out_sims[row, filled] = sims[row, col]
+                out_ids[row, filled] = idx
+                filled += 1
+                if filled == k:
+                    break
+        return out_sims, out_ids
+
+
+class IndexManager:
+    """Keep the corpus index resident and swap in newer versions atomically.
+
+    Searches grab the current snapshot without locking; reloads build the new
+    snapshot off to the side, reusing every file that did not change, and only
+    take the lock to replace the reference, so in-flight searches keep using
+    the version they started with. Writers (ingest, delete, compaction)
+    serialise on a file lock shared by all worker processes.
+    """
+
+    def __init__(self, index_path=FAISS_INDEX_PATH, use_mmap=None, refresh_interval=None):
+        self.index_path = index_path
+        self.faiss_dir = os.path.dirname(index_path)
+        self.segments_dir = os.path.join(self.faiss_dir, SEGMENTS_DIRNAME)
+        self.tombstones_path = os.path.join(self.faiss_dir, TOMBSTONES_FILENAME)
+        if use_mmap is None:
+            use_mmap = os.getenv("FAISS_MMAP", "false").lower() in ("1", "true", "yes")
+        self.use_mmap = use_mmap
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("FAISS_REFRESH_INTERVAL", 1.0))
+        self.refresh_interval = refresh_interval
+        self._snapshot = IndexSnapshot()
+        self._last_check = None
+        self._swap_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._snapshot.generation
+
+    @property
+    def current(self):
+        """The loaded snapshot, without checking the files on disk for changes."""
+        return self._snapshot
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the files on disk are newer."""
+        return self.refresh()
+
+    def _read_index(self, path):
+        if self.use_mmap:
+            try:
+                return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except Exception as e:
+                logger.warning(f"Memory-mapped load failed for {path}, falling back to full read: {str(e)}")
+        return faiss.read_index(path)
+
+    def segment_path(self, doc_id):
+        return os.path.join(self.segments_dir, f"{doc_id}.faiss")
+
+    def _scan(self):
+        """Return {path: mtime_ns} for every file that makes up the corpus."""
+        files = {}
+        for path in (self.index_path, self.tombstones_path):
+            try:
+                files[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        try:
+            with os.scandir(self.segments_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".faiss"):
+                        files[entry.path] = entry.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _load(self, files, current):
+        """Build a snapshot for `files`, reusing whatever `current` already holds."""
+        base, base_id_map, base_lexical = current.base, current.base_id_map, current.base_lexical
+        base_vectors = current.base_vectors
+        if files.get(self.index_path) != current.files.get(self.index_path):
+            base, base_id_map, base_lexical, base_vectors = None, ChunkIdMap(), None, None
+            if self.index_path in files:
+                logger.info(f"Loading FAISS index from {self.index_path} (mmap={self.use_mmap})")
+                base = self._read_index(self.index_path)
+                apply_search_defaults(base, load_params(params_path(self.index_path)))
+                base_id_map = ChunkIdMap.load(id_map_path(self.index_path))
+                base_lexical = LexicalIndex.load(lexical_path(self.index_path), mmap=self.use_mmap)
+                vectors_path, vector_ids_path = vectors_paths(self.index_path)
+                if os.path.exists(vectors_path) and os.path.exists(vector_ids_path):
+                    # Memory-mapped: only the rows of re-uploaded chunks are ever read
+                    base_vectors = (np.load(vector_ids_path), np.load(vectors_path, mmap_mode="r"))
+        tombstones = current.tombstones
+        if files.get(self.tombstones_path) != current.files.get(self.tombstones_path):
+            tombstones = np.empty(0, dtype=np.int64)
+            if self.tombstones_path in files:
+                tombstones = np.load(self.tombstones_path).astype(np.int64)
+        segments = {}
+        segment_lexical = {}
+        for path, mtime in files.items():
+            if os.path.dirname(path) != self.segments_dir:
+                continue
+            doc_id = os.path.splitext(os.path.basename(path))[0]
+            if doc_id in current.segments and current.files.get(path) == mtime:
+                segments[doc_id] = current.segments[doc_id]
+                if doc_id in current.segment_lexical:
+                    segment_lexical[doc_id] = current.segment_lexical[doc_id]
+                continue
+            try:
+                segments[doc_id] = (faiss.read_index(path), ChunkIdMap.load(id_map_path(path)))
+                lexical = LexicalIndex.load(lexical_path(path))
+                if lexical is not None:
+                    segment_lexical[doc_id] = lexical
+            except Exception as e:
+                logger.error(f"Failed to load segment {path}: {str(e)}", exc_info=True)
+        return IndexSnapshot(
+            base, base_id_map, segments, tombstones, current.generation + 1, files, base_lexical, segment_lexical,
+            base_vectors,
+        )
+
+    def refresh(self, force=False):
+        """Reload whatever part of the corpus changed on disk since it was loaded."""
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.refresh_interval:
+            return self._snapshot
+        self._last_check = now
+        files = self._scan()
+        if files == self._snapshot.files:
+            return self._snapshot
+        # Only one thread pays for the reload; the others keep serving the old snapshot
+        if not self._reload_lock.acquire(blocking=force):
+            return self._snapshot
+        try:
+            current = self._snapshot
+            if files == current.files:
+                return current
+            snapshot = self._load(files, current)
+            with self._swap_lock:
+                self._snapshot = snapshot
+            logger.info(
+                f"FAISS index generation {snapshot.generation} loaded: {snapshot.ntotal} live vectors, "
+                f"{len(snapshot.segments)} segments, {snapshot.tombstones.size} tombstones"
+            )
+            return snapshot
+        except Exception as e:
+            logger.error(f"Failed to reload FAISS index from {self.faiss_dir}: {str(e)}", exc_info=True)
+            return self._snapshot
+        finally:
+            self._reload_lock.release()
+
+    @contextmanager
+    def write_lock(self):
+        """Serialise index writers across threads and worker processes."""
+        os.makedirs(self.faiss_dir, exist_ok=True)
+        with self._write_lock:
+            with open(os.path.join(self.faiss_dir, ".write.lock"), "w") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_tombstones(self, tombstones):
+        tmp_path = f"{self.tombstones_path}.tmp.{os.getpid()}.npy"
+        np.save(tmp_path, np.unique(np.asarray(tombstones, dtype=np.int64)))
+        os.replace(tmp_path, self.tombstones_path)
+
+    def _remove_segment(self, doc_id):
+        path = self.segment_path(doc_id)
+        for stale in (path, id_map_path(path), lexical_path(path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    def _retire(self, snapshot, doc_id):
+        """Tombstone the document's live base ids and return its current entries."""
+        entries = [snapshot.lookup(idx) for idx in snapshot.ids_for_doc(doc_id)]
+        base_ids = snapshot.base_id_map.ids_for_doc(doc_id)
+        base_ids = base_ids[~np.isin(base_ids, snapshot.tombstones)]
+        if base_ids.size:
+            self._write_tombstones(np.concatenate([snapshot.tombstones, base_ids]))
+        return [entry for entry in entries if entry]
+
+    def add_document(self, doc_id, index, id_map, lexical=None):
+        """Add or replace a document's vectors and BM25 postings; cost is proportional to that document alone.
+
+        Returns the (doc_id, chunk_no, offset, page) entries the document had
+        before, so callers can clean up chunks that no longer exist.
+        """
+        with self.write_lock():
+            current = self.refresh(force=True)
+            os.makedirs(self.segments_dir, exist_ok=True)
+            path = self.segment_path(doc_id)
+            old_entries = self._retire(current, doc_id)
+            id_map.save(id_map_path(path))
+            if lexical is not None:
+                lexical.save(lexical_path(path))
+            elif os.path.exists(lexical_path(path)):
+                os.remove(lexical_path(path))
+            write_index_atomic(index, path)
+            snapshot = self.refresh(force=True)
+        logger.info(f"Added {index.ntotal} vectors for {doc_id} as a segment (generation {snapshot.generation})")
+        return old_entries
+
+    def delete_document(self, doc_id):
+        """Remove a document from the corpus and return its former (doc_id, chunk_no, offset, page) entries."""
+        with self.write_lock():
+            current = self.refresh(force=True)
+            entries = self._retire(current, doc_id)
+            self._remove_segment(doc_id)
+            snapshot = self.refresh(force=True)
+        logger.info(f"Deleted {doc_id} from the FAISS index (generation {snapshot.generation})")
+        return entries
+
+    def publish(self, index, id_map, params=None, vectors=None, ids=None, lexical=None):
+        """Write a new base index, its id map and build parameters atomically and reload.
+
+        Raw vectors are kept alongside non-flat and compressed indexes so
+        compaction can retrain them without reconstructing lossy codes.
+        """
+        os.makedirs(self.faiss_dir, exist_ok=True)
+        params = params or {"type": "flat"}
+        vectors_path, vector_ids_path = vectors_paths(self.index_path)
+        keep_vectors = params["type"] != "flat" or params.get("storage", "float32") != "float32"
+        if keep_vectors and vectors is not None:
+            for path, array in ((vectors_path, vectors), (vector_ids_path, ids)):
+                tmp_path = f"{path}.tmp.{os.getpid()}.npy"
+                np.save(tmp_path, array)
+                os.replace(tmp_path, path)
+        else:
+            for path in (vectors_path, vector_ids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        # Sidecars go first so a reader triggered by the new index mtime never sees stale ones
+        save_params(params, params_path(self.index_path))
+        id_map.save(id_map_path(self.index_path))
+        if lexical is not None:
+            lexical.save(lexical_path(self.index_path))
+        elif os.path.exists(lexical_path(self.index_path)):
+            os.remove(lexical_path(self.index_path))
+        write_index_atomic(index, self.index_path)
+        snapshot = self.refresh(force=True)
+        logger.info(f"Published FAISS index generation {snapshot.generation} with {index.ntotal} vectors")
+        return snapshot
+
+    def needs_compaction(self, snapshot=None):
+        """True once segments or tombstones have piled up enough to slow searches down."""
+        snapshot = snapshot or self.refresh()
+        max_segments = int(os.getenv("FAISS_COMPACT_SEGMENTS", 16))
+        max_tombstone_ratio = float(os.getenv("FAISS_COMPACT_TOMBSTONE_RATIO", 0.1))
+        base_total = snapshot.base.ntotal if snapshot.base is not None else 0
+        return len(snapshot.segments) >= max_segments or (
+            snapshot.tombstones.size > 0 and snapshot.tombstones.size >= max_tombstone_ratio * max(base_total, 1)
+        )
+
+    def _base_vectors(self, snapshot):
+        """Return (ids, vectors) of the base index, exact even for PQ bases."""
+        vectors_path, vector_ids_path = vectors_paths(self.index_path)
+        if os.path.exists(vectors_path) and os.path.exists(vector_ids_path):
+            return np.load(vector_ids_path), np.load(vectors_path, mmap_mode="r")
+        base = snapshot.base
+        if isinstance(base, faiss.IndexIDMap) and isinstance(faiss.downcast_index(base.index), faiss.IndexIVF):
+            # Searches may still be reading the published base, so build the direct map on a copy
+            base = faiss.clone_index(base)
+            faiss.downcast_index(base.index).make_direct_map()
+        return index_vectors(base)
+
+    def compact(self, index_type=None, documents=None):
+        """Fold all segments into a rebuilt base index and drop tombstoned vectors.
+
+        documents, a list of (doc_id, index, id_map, lexical) as taken by
+        add_document, are folded in as well, replacing any earlier versions,
+        so a bulk load becomes visible as one commit.
+        """
+        documents = documents or []
+        with self.write_lock():
+            current = self.refresh(force=True)
+            if not documents and not current.segments and not current.tombstones.size:
+                return current
+            start = time.perf_counter()
+            replaced = {doc_id for doc_id, _, _, _ in documents}
+            # Base vectors of replaced documents go the same way as tombstoned ones
+            dropped = current.tombstones
+            replaced_base = [current.base_id_map.ids_for_doc(doc_id) for doc_id in replaced]
+            if replaced_base:
+                dropped = np.union1d(dropped, np.concatenate(replaced_base))
+            all_ids, all_vectors = [], []
+            id_map = ChunkIdMap()
+            if current.base is not None:
+                ids, vectors = self._base_vectors(current)
+                keep = ~np.isin(ids, dropped)
+                all_ids.append(ids[keep])
+                all_vectors.append(vectors[keep])
+                id_map.merge(current.base_id_map)
+                id_map.remove(dropped)
+            segments = {doc_id: segment for doc_id, segment in current.segments.items() if doc_id not in replaced}
+            for index, seg_id_map in list(segments.values()) + [(index, doc_map) for _, index, doc_map, _ in documents]:
+                ids, vectors = index_vectors(index)
+                all_ids.append(ids)
+                all_vectors.append(vectors)
+                id_map.merge(seg_id_map)
+            ids = np.concatenate(all_ids)
+            vectors = np.ascontiguousarray(np.concatenate(all_vectors), dtype=np.float32)
+            # Older bases were L2 over raw vectors; everything is folded into one cosine index
+            faiss.normalize_L2(vectors)
+            merged, params = build_index(vectors, ids, index_type)
+            lexical_parts = [(current.base_lexical, dropped)] if current.base_lexical is not None else []
+            lexical_parts += [
+                (lexical, None) for doc_id, lexical in current.segment_lexical.items() if doc_id not in replaced
+            ]
+            lexical_parts += [(lexical, None) for _, _, _, lexical in documents if lexical is not None]
+            lexical = LexicalIndex.merge(lexical_parts) if lexical_parts else None
+            self.publish(merged, id_map, params, vectors, ids, lexical)
+            for doc_id in current.segments:
+                self._remove_segment(doc_id)
+            if os.path.exists(self.tombstones_path):
+                os.remove(self.tombstones_path)
+            snapshot = self.refresh(force=True)
+        logger.info(
+            f"Compacted {len(current.segments)} segments, {len(documents)} new documents and "
+            f"{current.tombstones.size} tombstones into {merged.ntotal} vectors ({params['factory']}) in "
+            f"{time.perf_counter() - start:.2f}s (generation {snapshot.generation})"
+        )
+        return snapshot
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_index_manager():
+    """Return the process-wide index manager."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = IndexManager()
+    return _manager
+
+
+_compactor = None
+
+def start_compactor(interval=None):
+    """Compact the corpus index in a daemon thread whenever it needs it."""
+    global _compactor
+    if _compactor is not None:
+        return _compactor
+    interval = float(os.getenv("FAISS_COMPACT_INTERVAL", 300)) if interval is None else interval
+
+    def run():
+        manager = get_index_manager()
+        while True:
+            time.sleep(interval)
+            try:
+                if manager.needs_compaction():
+                    manager.compact()
+            except Exception as e:
+                logger.error(f"Background compaction failed: {str(e)}", exc_info=True)
+
+    _compactor = threading.Thread(target=run, name="faiss-compactor", daemon=True)
+    _compactor.start()
+    logger.info(f"Started FAISS compactor with a {interval}s interval")
+    return _compactor
+
+
+if __name__ == "__main__":
+    import sys
+    get_index_manager().compact(sys.argv[1] if len(sys.argv) > 1 else None)
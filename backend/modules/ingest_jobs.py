@@ -0,0 +1,302 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from backend.utils.metrics import start_request, record_stage, install_log_context, INGEST_JOBS
+from backend.utils.workers import ingest_workers
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JOB_KEY_PREFIX = "job:"
+
+
+def job_key(job_id):
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+
+def _job_ttl():
+    return int(os.getenv("JOB_TTL", 86400))
+
+
+def _update_job(redis_client, job_id, **fields):
+    """Write job fields and refresh the key's expiry."""
+    fields["updated_at"] = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(job_key(job_id), mapping={k: str(v) for k, v in fields.items()})
+    pipe.expire(job_key(job_id), _job_ttl())
+    pipe.execute()
+
+
+class _JobProgress:
+    """Progress callback that writes stage changes and at most a few updates per second to Redis."""
+
+    def __init__(self, redis_client, job_id, interval=0.5):
+        self.redis_client = redis_client
+        self.job_id = job_id
+        self.interval = interval
+        self._stage = None
+        self._last_write = 0.0
+
+    def __call__(self, stage, done, total):
+        now = time.monotonic()
+        if stage == self._stage and now - self._last_write < self.interval:
+            return
+        self._stage = stage
+        self._last_write = now
+        _update_job(self.redis_client, self.job_id, stage=stage, done=done, total=total)
+
+
+def run_ingest_job(job_id, file_path, doc_id, request_id=None):
+    """Worker-process entry point: ingest one document and record its outcome.
+
+    Returns the processing summary with per-stage timings, which the API
+    process turns into metrics since the worker's own are never scraped.
+    """
+    # Imported here so the heavy NLP and embedding stack loads in the worker, not the API process
+    from backend.modules.doc_processor import process_document, redis_client
+    _, timings = start_request(request_id or job_id)
+    _update_job(redis_client, job_id, status="running", stage="starting", started_at=time.time())
+    started = time.perf_counter()
+    try:
+        summary = process_document(file_path, doc_id, progress=_JobProgress(redis_client, job_id))
+        timings["ingest_total"] = time.perf_counter() - started
+        _update_job(
+            redis_client, job_id, status="done", stage="done", result=summary["status"],
+            timings=json.dumps({stage: round(seconds, 4) for stage, seconds in timings.items()}), finished_at=time.time(),
+        )
+        return {**summary, "timings": timings}
+    except Exception as e:
+        logger.error(f"Ingest job {job_id} failed: {str(e)}", exc_info=True)
+        _update_job(redis_client, job_id, status="failed", error=str(e), finished_at=time.time())
+        raise
+
+
+def _init_worker():
+    """Load the models when an ingestion process starts rather than on its first job."""
+    install_log_context()
+    if os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes"):
+        from backend.utils.models import warm_up
+        warm_up()
+
+
+# Process pool so spaCy and torch get real parallelism outside the API's GIL
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ingest_pool():
+    """Return the shared ingestion process pool, sized by INGEST_WORKERS."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = ingest_workers()
+                # spawn: forking a process that already holds torch / FAISS threads is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+                )
+                logger.info(f"Started ingestion pool with {workers} processes")
+    return _pool
+
+
+def _discard_pool(pool):
+    """Forget a pool whose worker died, so the next submission starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    logger.error("An ingestion worker died; the pool will be restarted on the next job")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(function, *args):
+    """Submit to the shared pool, replacing it once if it is already broken."""
+    pool = get_ingest_pool()
+    try:
+        return pool, pool.submit(function, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = get_ingest_pool()
+        return pool, pool.submit(function, *args)
+
+
+def submit_ingest_job(redis_client, file_path, doc_id, filename, request_id=None):
+    """Queue a document for background ingestion and return its job id.
+
+    Blocks on Redis; async callers should run it through run_in_worker.
+    """
+    job_id = uuid.uuid4().hex
+    _update_job(
+        redis_client, job_id,
+        status="queued", stage="queued", done=0, total=0,
+        doc_id=doc_id, filename=filename, request_id=request_id or "", created_at=time.time(),
+    )
+    pool, future = _submit(run_ingest_job, job_id, file_path, doc_id, request_id)
+
+    def on_done(fut):
+        error = fut.exception()
+        if error is not None:
+            INGEST_JOBS.inc(result="failed")
+            # A crashed worker never gets to record its own failure, and leaves the pool unusable
+            if isinstance(error, BrokenProcessPool):
+                _discard_pool(pool)
+                _update_job(redis_client, job_id, status="failed", error=f"Worker process died: {error}")
+            return
+        summary = fut.result()
+        INGEST_JOBS.inc(result=summary["status"])
+        for stage, seconds in summary["timings"].items():
+            record_stage(stage, seconds)
+
+    future.add_done_callback(on_done)
+    logger.info(f"Queued ingest job {job_id} for {doc_id}")
+    return job_id
+
+
+def collect_files(directory, recursive=False):
+    """[(doc_id, path)] of every supported file in a directory, sorted by path.
+
+    Top-level files get the same doc_id an upload of them would; files in
+    subdirectories are prefixed with their relative path.
+    """
+    from backend.utils.extractors import supported_extensions
+    extensions = supported_extensions()
+    paths = []
+    for root, dirs, names in os.walk(directory):
+        if not recursive:
+            dirs.clear()
+        paths += [os.path.join(root, name) for name in names if os.path.splitext(name)[1].lower() in extensions]
+    return [
+        (os.path.relpath(path, directory).replace(os.sep, "_").replace(".", "_"), path) for path in sorted(paths)
+    ]
+
+
+def bulk_import(directory, recursive=False, pool=None, max_in_flight=None, progress=None):
+    """Ingest every supported file in a directory concurrently, as one index commit.
+
+    Files are prepared (extracted, chunked, anonymized and embedded) in the
+    ingestion pool with at most max_in_flight in progress at a time. Each
+    prepared document is spilled to a staging directory, so the caller
+    only keeps a short summary per file however large the directory is.
+    A single commit_documents call, also run in the pool, then publishes
+    them all. A file that fails is reported and left out; the rest still
+    go in. Returns a summary with per-status counts, the per-file results
+    and the failures.
+    """
+    from backend.modules.doc_processor import stage_document, commit_documents, file_sha256
+    shared = pool is None
+    pool = get_ingest_pool() if shared else pool
+    max_in_flight = int(os.getenv("BULK_MAX_IN_FLIGHT", 2 * ingest_workers())) if max_in_flight is None else max_in_flight
+    files = collect_files(directory, recursive)
+    logger.info(f"Bulk importing {len(files)} files from {directory} with up to {max_in_flight} in flight")
+    started = time.perf_counter()
+    documents, staged, failed = [], [], {}
+
+    # Identical files within the batch would otherwise all be indexed, since none is committed yet
+    owners = {}
+    todo = deque()
+    for doc_id, path in files:
+        file_hash = file_sha256(path)
+        if file_hash in owners:
+            documents.append({"status": "duplicate", "doc_id": doc_id, "duplicate_of": owners[file_hash]})
+        else:
+            owners[file_hash] = doc_id
+            todo.append((doc_id, path))
+
+    staging_dir = tempfile.mkdtemp(prefix="hackrx-bulk-", dir=os.getenv("BULK_STAGING_DIR") or None)
+    try:
+        # Bounded submission: only max_in_flight files' pages and vectors are in worker memory at once
+        pending = {}
+        while todo or pending:
+            while todo and len(pending) < max_in_flight:
+                doc_id, path = todo.popleft()
+                pending[pool.submit(stage_document, path, doc_id, staging_dir)] = (doc_id, path)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                doc_id, path = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    if shared:
+                        _discard_pool(pool)
+                    raise
+                except Exception as e:
+                    logger.error(f"Bulk import of {path} failed: {str(e)}")
+                    failed[path] = str(e)
+                    continue
+                if result["status"] == "prepared":
+                    staged.append(result)
+                else:
+                    documents.append(result)
+            if progress is not None:
+                progress("preparing", len(files) - len(todo) - len(pending), len(files))
+
+        if staged:
+            if progress is not None:
+                progress("committing", len(staged), len(staged))
+            documents += pool.submit(commit_documents, staged).result()
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    counts = {status: sum(1 for d in documents if d["status"] == status) for status in ("indexed", "unchanged", "duplicate")}
+    logger.info(
+        f"Bulk imported {directory} in {time.perf_counter() - started:.2f}s: "
+        + ", ".join(f"{count} {status}" for status, count in counts.items()) + f", {len(failed)} failed"
+    )
+    return {"files": len(files), **counts, "failed": failed, "documents": documents}
+
+
+def run_bulk_job(redis_client, job_id, directory, recursive=False):
+    """Run a bulk import and record its outcome in the job hash."""
+    _update_job(redis_client, job_id, status="running", stage="starting", started_at=time.time())
+    try:
+        summary = bulk_import(directory, recursive, progress=_JobProgress(redis_client, job_id))
+        for document in summary["documents"]:
+            INGEST_JOBS.inc(result=document["status"])
+        for _ in summary["failed"]:
+            INGEST_JOBS.inc(result="failed")
+        _update_job(
+            redis_client, job_id, status="done", stage="done",
+            result=json.dumps({key: summary[key] for key in ("files", "indexed", "unchanged", "duplicate", "failed")}),
+            finished_at=time.time(),
+        )
+        return summary
+    except Exception as e:
+        logger.error(f"Bulk import job {job_id} failed: {str(e)}", exc_info=True)
+        _update_job(redis_client, job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+def submit_bulk_job(redis_client, directory, recursive=False, request_id=None):
+    """Start a bulk import of a directory in the background and return its job id.
+
+    The coordinating thread only hands files to the ingestion pool and
+    waits; extraction, embedding and the final commit run in the pool.
+    """
+    job_id = uuid.uuid4().hex
+    _update_job(
+        redis_client, job_id,
+        status="queued", stage="queued", done=0, total=0,
+        directory=directory, request_id=request_id or "", created_at=time.time(),
+    )
+    threading.Thread(
+        target=run_bulk_job, args=(redis_client, job_id, directory, recursive), name=f"bulk-import-{job_id[:8]}", daemon=True
+    ).start()
+    logger.info(f"Started bulk import job {job_id} for {directory}")
+    return job_id
+
+
+def shutdown_ingest_pool():
+    """Stop accepting jobs and wait for running ones."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
@@ -0,0 +1,202 @@
+import hashlib
+import math
+import os
+import re
+import logging
+import numpy as np
+from collections import Counter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Words, numbers and dotted/hyphenated codes such as "4.2" or "pre-approval"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+HEADER_SIZE = 4
+FORMAT_VERSION = 1
+
+
+def tokenize(text):
+    """Lower-cased terms of a text, stopwords removed."""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def term_hashes(terms):
+    """Stable 64-bit hashes of terms, so postings are keyed by numbers rather than strings."""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little", signed=True) for term in terms],
+        dtype=np.int64,
+    )
+
+
+class LexicalIndex:
+    """BM25 inverted index over one segment of the corpus.
+
+    Postings are flat arrays: terms are sorted 64-bit hashes, offsets[i] to
+    offsets[i + 1] delimit term i's postings, and each posting is a row into
+    doc_ids / doc_lens plus a term frequency. Everything is saved as a single
+    int64 .npy file so it can be memory-mapped.
+    """
+
+    def __init__(self, terms, offsets, post_rows, post_tf, doc_ids, doc_lens):
+        self.terms = terms
+        self.offsets = offsets
+        self.post_rows = post_rows
+        self.post_tf = post_tf
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self._total_len = None
+
+    @property
+    def n_docs(self):
+        return int(self.doc_ids.shape[0])
+
+    @property
+    def total_len(self):
+        """Sum of document lengths, computed once since the arrays never change."""
+        if self._total_len is None:
+            self._total_len = int(np.asarray(self.doc_lens).sum())
+        return self._total_len
+
+    @classmethod
+    def _from_postings(cls, hashes, rows, tfs, doc_ids, doc_lens):
+        order = np.lexsort((rows, hashes))
+        hashes, rows, tfs = hashes[order], rows[order], tfs[order]
+        terms, starts = np.unique(hashes, return_index=True)
+        offsets = np.append(starts, hashes.shape[0]).astype(np.int64)
+        return cls(terms, offsets, rows.astype(np.int64), tfs.astype(np.int64),
+                   np.asarray(doc_ids, dtype=np.int64), np.asarray(doc_lens, dtype=np.int64))
+
+    @classmethod
+    def build(cls, ids, texts):
+        """Index chunk texts under their global FAISS ids."""
+        terms, rows, tfs = [], [], []
+        doc_lens = np.zeros(len(texts), dtype=np.int64)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text or ""))
+            doc_lens[row] = sum(counts.values())
+            for term, tf in counts.items():
+                terms.append(term)
+                rows.append(row)
+                tfs.append(tf)
+        return cls._from_postings(
+            term_hashes(terms), np.array(rows, dtype=np.int64), np.array(tfs, dtype=np.int64), ids, doc_lens
+        )
+
+    @classmethod
+    def merge(cls, parts):
+        """Combine (index, excluded_ids) parts into one index without the excluded ids."""
+        hashes, rows, tfs, doc_ids, doc_lens = [], [], [], [], []
+        row_base = 0
+        for part, excluded in parts:
+            keep = ~np.isin(part.doc_ids, excluded) if excluded is not None and len(excluded) else np.ones(part.n_docs, bool)
+            new_rows = np.cumsum(keep) - 1 + row_base
+            posting_terms = np.repeat(np.asarray(part.terms), np.diff(part.offsets))
+            live = keep[part.post_rows]
+            hashes.append(posting_terms[live])
+            rows.append(new_rows[part.post_rows[live]])
+            tfs.append(np.asarray(part.post_tf)[live])
+            doc_ids.append(np.asarray(part.doc_ids)[keep])
+            doc_lens.append(np.asarray(part.doc_lens)[keep])
+            row_base += int(keep.sum())
+        if not hashes:
+            return cls.build(np.empty(0, dtype=np.int64), [])
+        return cls._from_postings(*(np.concatenate(a) for a in (hashes, rows, tfs, doc_ids, doc_lens)))
+
+    def postings(self, term_hash):
+        """(rows, term frequencies) of one term; empty arrays if it does not occur."""
+        i = int(np.searchsorted(self.terms, term_hash))
+        if i >= self.terms.shape[0] or self.terms[i] != term_hash:
+            return self.post_rows[:0], self.post_tf[:0]
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.post_rows[start:end], self.post_tf[start:end]
+
+    def save(self, path):
+        """Write the index atomically as one int64 array."""
+        header = np.array([FORMAT_VERSION, self.terms.shape[0], self.post_rows.shape[0], self.n_docs], dtype=np.int64)
+        data = np.concatenate([header, self.terms, self.offsets, self.post_rows, self.post_tf, self.doc_ids, self.doc_lens])
+        tmp_path = f"{path}.tmp.{os.getpid()}.npy"
+        np.save(tmp_path, data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Read an index written by save(); None if the file does not exist."""
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, mmap_mode="r" if mmap else None)
+        version, n_terms, n_postings, n_docs = (int(v) for v in data[:HEADER_SIZE])
+        if version != FORMAT_VERSION:
+            logger.warning(f"Ignoring lexical index {path} with unknown format {version}")
+            return None
+        sizes = [n_terms, n_terms + 1, n_postings, n_postings, n_docs, n_docs]
+        arrays, start = [], HEADER_SIZE
+        for size in sizes:
+            arrays.append(data[start:start + size])
+            start += size
+        return cls(*arrays)
+
+
+def bm25_search(parts, query, k, k1=None, b=None):
+    """Top-k (scores, ids) for a query over (index, excluded_row_mask) parts.
+
+    Corpus statistics (document count, average length, document frequency)
+    are summed over the live rows of all parts, so scores are comparable
+    between them and excluded rows never push a term's weight below zero.
+    """
+    k1 = float(os.getenv("BM25_K1", 1.2)) if k1 is None else k1
+    b = float(os.getenv("BM25_B", 0.75)) if b is None else b
+    empty = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+    hashes = np.unique(term_hashes(tokenize(query)))
+    parts = [(part, mask) for part, mask in parts if part is not None and part.n_docs]
+    if not hashes.size or not parts:
+        return empty
+    n_docs = sum(part.n_docs - (int(mask.sum()) if mask is not None else 0) for part, mask in parts)
+    total_len = sum(
+        part.total_len - (float(np.asarray(part.doc_lens)[mask].sum()) if mask is not None else 0) for part, mask in parts
+    )
+    avgdl = max(total_len / max(n_docs, 1), 1e-9)
+    postings = [[part.postings(h) for h in hashes] for part, _ in parts]
+    # Postings of excluded rows stay in the index until compaction; they must not count towards df
+    df = [
+        sum(
+            int(np.count_nonzero(~mask[postings[p][t][0]])) if mask is not None else postings[p][t][0].shape[0]
+            for p, (_, mask) in enumerate(parts)
+        )
+        for t in range(hashes.size)
+    ]
+    idf = [math.log(1 + (n_docs - d + 0.5) / (d + 0.5)) for d in df]
+
+    all_scores, all_ids = [], []
+    for (part, mask), part_postings in zip(parts, postings):
+        rows, contributions = [], []
+        for (term_rows, tf), weight in zip(part_postings, idf):
+            if not term_rows.shape[0]:
+                continue
+            tf = np.asarray(tf, dtype=np.float32)
+            dl = np.asarray(part.doc_lens[term_rows], dtype=np.float32)
+            rows.append(np.asarray(term_rows))
+            contributions.append(weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)))
+        if not rows:
+            continue
+        unique_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        if mask is not None:
+            live = ~mask[unique_rows]
+            unique_rows, scores = unique_rows[live], scores[live]
+        if scores.shape[0] > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            unique_rows, scores = unique_rows[top], scores[top]
+        all_scores.append(scores)
+        all_ids.append(np.asarray(part.doc_ids)[unique_rows])
+    if not all_scores:
+        return empty
+    scores, ids = np.concatenate(all_scores), np.concatenate(all_ids)
+    order = np.argsort(-scores, kind="stable")
+    scores, ids = scores[order], ids[order]
+    # An id can briefly be in both a segment and a freshly compacted base; keep its best score
+    _, first = np.unique(ids, return_index=True)
+    first.sort()
+    return scores[first][:k], ids[first][:k]
@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import logging
+import numpy as np
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "qcache:"
+
+
+def normalize_query(query):
+    """Canonical form of a query for cache keys.
+
+    Unicode forms and whitespace are normalised but case is kept, because
+    spaCy NER gives different entities for "Pune" and "pune".
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip()
+
+
+def _digest(*parts):
+    return hashlib.sha1("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def parse_key(query):
+    """Cache key for a query's entities and embedding; these do not depend on the index."""
+    # Backends agree only to within rounding, so each gets its own embeddings
+    model = (os.getenv("EMBEDDING_MODEL", ""), os.getenv("EMBEDDING_BACKEND", "torch"))
+    return f"{CACHE_KEY_PREFIX}parse:{_digest(normalize_query(query), *model)}"
+
+
+def response_key(query, corpus_version, **params):
+    """Cache key for a query's decision against one version of the corpus.
+
+    Ingestion, deletion and compaction change the corpus version, so
+    they invalidate every cached response without touching the cache.
+    """
+    knobs = ",".join(f"{name}={params[name]}" for name in sorted(params))
+    return f"{CACHE_KEY_PREFIX}response:{_digest(normalize_query(query), corpus_version, knobs)}"
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def _encode(value):
+    """JSON for Redis; numpy arrays travel as base64 float32."""
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return {"__ndarray__": base64.b64encode(obj.astype(np.float32).tobytes()).decode()}
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"{type(obj).__name__} is not cacheable")
+    return json.dumps(value, default=default)
+
+
+def _decode(raw):
+    def hook(obj):
+        if "__ndarray__" in obj:
+            return np.frombuffer(base64.b64decode(obj["__ndarray__"]), dtype=np.float32).copy()
+        return obj
+    return json.loads(raw, object_hook=hook)
+
+
+class QueryCache:
+    """Two-tier query cache: an in-process LRU in front of Redis shared by all workers.
+
+    Redis failures are logged and treated as misses; the cache never fails a
+    query.
+    """
+
+    def __init__(self, redis_client=None, maxsize=None, ttl=None, redis_ttl=None):
+        maxsize = int(os.getenv("QUERY_CACHE_SIZE", 1024)) if maxsize is None else maxsize
+        ttl = float(os.getenv("QUERY_CACHE_TTL", 300)) if ttl is None else ttl
+        self.redis_ttl = int(os.getenv("QUERY_CACHE_REDIS_TTL", 3600)) if redis_ttl is None else redis_ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.redis_client = redis_client
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    async def get(self, key):
+        value = self.local.get(key)
+        if value is not None or self.redis_client is None or self.redis_ttl <= 0:
+            return value
+        try:
+            raw = await self.redis_client.get(key)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Query cache read from Redis failed: {str(e)}")
+            return None
+        if raw is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        value = _decode(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key, value):
+        self.local.set(key, value)
+        if self.redis_client is None or self.redis_ttl <= 0:
+            return
+        try:
+            await self.redis_client.set(key, _encode(value), ex=self.redis_ttl)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Query cache write to Redis failed: {str(e)}")
+
+    def stats(self):
+        return {
+            "local": self.local.stats(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses, "errors": self.redis_errors},
+        }
+
+
+# One cache per worker process, created on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_query_cache():
+    """Return the shared query cache, or None when QUERY_CACHE is off."""
+    global _cache
+    if os.getenv("QUERY_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from backend.modules.semantic_search import get_async_redis
+                _cache = QueryCache(get_async_redis())
+    return _cache
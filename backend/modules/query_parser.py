@@ -1,6 +1,6 @@
-import spacy
 import re
-from sentence_transformers import SentenceTransformer
+from backend.utils.models import parse, pipe, get_embedding_model
+from backend.utils.metrics import timed
 from dotenv import load_dotenv
 import os
 import logging
@@ -8,18 +8,41 @@ import logging
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-nlp = spacy.load("en_core_web_lg")
 
-# Lazy initialization of SentenceTransformer
-_model = None
-
-def get_model():
-    """Load SentenceTransformer lazily."""
-    global _model
-    if _model is None:
-        logger.info("Loading SentenceTransformer model...")
-        _model = SentenceTransformer(os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
-    return _model
+def extract_entities(query, doc):
+    """Entities from a spaCy parse of the query plus insurance-specific patterns."""
+    entities = {}
+    
+    # Extract SpaCy entities
+    for ent in doc.ents:
+        entities[ent.label_.lower()] = ent.text
+    
+    # Extract insurance-specific terms
+    age_match = re.search(r"(\d+)(M|F)", query, re.IGNORECASE)
+    if age_match:
+        entities["age"] = f"{age_match.group(1)}{age_match.group(2).upper()}"
+    
+    procedure_match = re.search(r"\b(\w+ectomy|surgery|operation|[\w\s]+?\s*(surgery|operation))\b", query, re.IGNORECASE)
+    if procedure_match:
+        entities["procedure"] = procedure_match.group(0).lower()
+    
+    duration_match = re.search(r"(\d+\s*(month|year)\s*(policy)?)", query, re.IGNORECASE)
+    if duration_match:
+        entities["policy_duration"] = duration_match.group(0).lower().replace(" policy", "")
+    
+    if "pre-approval" in query.lower() or "pre-approved" in query.lower():
+        entities["pre_approval"] = True
+    
+    # Extract key-value pairs
+    kv_match = re.findall(r"(\w+):\s*([^,]+?)(?:,|$)", query, re.IGNORECASE)
+    for key, value in kv_match:
+        entities[key.lower()] = value.strip()
+    
+    # Extract other relevant terms
+    for token in doc:
+        if token.pos_ in ["NOUN", "VERB"] and token.text.lower() not in entities:
+            entities[token.text.lower()] = token.text
+    return entities
 
 def parse_query(query):
     """Parse query to extract dynamic entities and generate embedding."""
@@ -27,44 +50,33 @@ def parse_query(query):
         if not query.strip():
             logger.error("Empty query provided")
             raise ValueError("Query cannot be empty")
-        doc = nlp(query)
-        entities = {}
-        
-        # Extract SpaCy entities
-        for ent in doc.ents:
-            entities[ent.label_.lower()] = ent.text
-        
-        # Extract insurance-specific terms
-        age_match = re.search(r"(\d+)(M|F)", query, re.IGNORECASE)
-        if age_match:
-            entities["age"] = f"{age_match.group(1)}{age_match.group(2).upper()}"
-        
-        procedure_match = re.search(r"\b(\w+ectomy|surgery|operation|[\w\s]+?\s*(surgery|operation))\b", query, re.IGNORECASE)
-        if procedure_match:
-            entities["procedure"] = procedure_match.group(0).lower()
-        
-        duration_match = re.search(r"(\d+\s*(month|year)\s*(policy)?)", query, re.IGNORECASE)
-        if duration_match:
-            entities["policy_duration"] = duration_match.group(0).lower().replace(" policy", "")
-        
-        if "pre-approval" in query.lower() or "pre-approved" in query.lower():
-            entities["pre_approval"] = True
-        
-        # Extract key-value pairs
-        kv_match = re.findall(r"(\w+):\s*([^,]+?)(?:,|$)", query, re.IGNORECASE)
-        for key, value in kv_match:
-            entities[key.lower()] = value.strip()
-        
-        # Extract other relevant terms
-        for token in doc:
-            if token.pos_ in ["NOUN", "VERB"] and token.text.lower() not in entities:
-                entities[token.text.lower()] = token.text
-        
-        model = get_model()
-        embedding = model.encode(query, convert_to_numpy=True)
+        with timed("parse"):
+            entities = extract_entities(query, parse(query, "query"))
+        model = get_embedding_model()
+        with timed("embed"):
+            embedding = model.encode(query, convert_to_numpy=True)
         logger.info(f"Parsed query: {query}, Entities: {entities}")
         return entities, embedding
     except Exception as e:
         logger.error(f"Query parsing error: {str(e)}", exc_info=True)
-        model = get_model()
-        return {}, model.encode(query, convert_to_numpy=True)
\ No newline at end of file
+        model = get_embedding_model()
+        return {}, model.encode(query, convert_to_numpy=True)
+
+def parse_queries(queries, batch_size=None):
+    """Batch form of parse_query: one nlp.pipe pass and one encode call for all queries.
+
+    Returns (list of entity dicts, embedding matrix with one row per query).
+    """
+    batch_size = int(os.getenv("QUERY_BATCH_SIZE", 64)) if batch_size is None else batch_size
+    with timed("embed"):
+        embeddings = get_embedding_model().encode(queries, batch_size=batch_size, convert_to_numpy=True)
+    entities = []
+    with timed("parse"):
+        for query, doc in zip(queries, pipe(queries, "query", batch_size=batch_size)):
+            try:
+                entities.append(extract_entities(query, doc))
+            except Exception as e:
+                logger.error(f"Query parsing error for {query}: {str(e)}", exc_info=True)
+                entities.append({})
+    logger.info(f"Parsed {len(queries)} queries")
+    return entities, embeddings
@@ -1,78 +1,239 @@
+import asyncio
 import faiss
 import redis
+import redis.asyncio
 import numpy as np
 import os
+import re
 import logging
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
+from backend.modules.index_manager import get_index_manager
+from backend.modules.chunk_store import get_chunk_store
+from backend.utils.workers import run_in_worker
+from backend.utils.metrics import timed
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Redis
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=int(os.getenv("REDIS_DB", 0)),
-        decode_responses=True
-    )
-    redis_client.ping()
-    logger.info("Connected to Redis")
-except Exception as e:
-    logger.error(f"Failed to connect to Redis: {str(e)}", exc_info=True)
-    raise
-
-# Initialize SentenceTransformer lazily
-_model = None
-def get_model():
-    """Load SentenceTransformer lazily."""
-    global _model
-    if _model is None:
-        logger.info("Loading SentenceTransformer model...")
-        _model = SentenceTransformer(os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
-    return _model
-
-def search_clauses(query_embedding, top_k):
-    """Search for relevant clauses using FAISS with similarity threshold."""
+# Redis connects on first command, so importing this module does not need a live server
+redis_client = redis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=int(os.getenv("REDIS_DB", 0)),
+    decode_responses=True
+)
+
+# Async Redis client for the event loop, created on first use
+_async_redis = None
+def get_async_redis():
+    """Return a shared asyncio Redis client backed by a bounded connection pool."""
+    global _async_redis
+    if _async_redis is None:
+        pool = redis.asyncio.ConnectionPool(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=int(os.getenv("REDIS_DB", 0)),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+            decode_responses=True
+        )
+        _async_redis = redis.asyncio.Redis(connection_pool=pool)
+    return _async_redis
+
+CLAUSE_TERMS = ["hospitalization", "treatment", "surgery", "insured", "waiting period"]
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+def vector_hits_batch(snapshot, query_embeddings, k, nprobe=None, ef_search=None):
+    """One multi-row FAISS search; returns a [(id, cosine similarity)] list per query, best first."""
+    query_embeddings = np.array(query_embeddings, dtype=np.float32, ndmin=2)
+    faiss.normalize_L2(query_embeddings)
+    with timed("faiss_search"):
+        similarities, indices = snapshot.search(query_embeddings, k, nprobe=nprobe, ef_search=ef_search)
+    return [
+        [(int(idx), float(sim)) for idx, sim in zip(row_ids, row_sims) if idx >= 0]
+        for row_ids, row_sims in zip(indices, similarities)
+    ]
+
+def vector_hits(snapshot, query_embedding, k, nprobe=None, ef_search=None):
+    """FAISS search over a snapshot; returns [(id, cosine similarity)], best first."""
+    return vector_hits_batch(snapshot, query_embedding.reshape(1, -1), k, nprobe, ef_search)[0]
+
+def lexical_hits(snapshot, query, k):
+    """BM25 search over a snapshot; returns [(id, score)], best first."""
+    if not query:
+        return []
+    with timed("bm25_search"):
+        scores, ids = snapshot.lexical_search(query, k)
+    return [(int(idx), float(score)) for idx, score in zip(ids, scores)]
+
+def lexical_hits_batch(snapshot, queries, k):
+    return [lexical_hits(snapshot, query, k) for query in queries]
+
+def retrieval_mode():
+    mode = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode}, expected one of {RETRIEVAL_MODES}")
+    return mode
+
+def fuse_hits(vectors, lexical, top_k, similarity_threshold, rrf_k=None, lexical_ratio=None):
+    """Reciprocal rank fusion of vector and BM25 hits.
+
+    A hit is returned if its cosine reaches the threshold, or if its BM25
+    score is at least lexical_ratio of the query's best BM25 score. The
+    ratio stops a chunk sharing only a common word such as "policy" with
+    the query from getting in on the BM25 side alone.
+    """
+    rrf_k = int(os.getenv("RRF_K", 60)) if rrf_k is None else rrf_k
+    lexical_ratio = float(os.getenv("BM25_MIN_SCORE_RATIO", 0.5)) if lexical_ratio is None else lexical_ratio
+    scores = {}
+    for hits in (vectors, lexical):
+        for rank, (idx, _) in enumerate(hits):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best_lexical = max((score for _, score in lexical), default=0.0)
+    lexical_ids = {idx for idx, score in lexical if score > 0 and score >= lexical_ratio * best_lexical}
+    passing = {idx for idx, sim in vectors if sim >= similarity_threshold} | lexical_ids
+    fused = sorted((idx for idx in scores if idx in passing), key=lambda idx: -scores[idx])
+    return fused[:top_k]
+
+def select_ids(vectors, lexical, top_k):
+    """Ids to return for a query, in rank order; without BM25 hits this is the thresholded vector ranking."""
+    # Stored chunk vectors are normalised, so the FAISS score already is the cosine
+    return fuse_hits(vectors, lexical, top_k, float(os.getenv("SIMILARITY_THRESHOLD", 0.6)))
+
+def candidate_count(top_k):
+    """How many hits each retriever fetches before fusion."""
+    if retrieval_mode() == "vector":
+        return top_k
+    return max(top_k, int(os.getenv("HYBRID_CANDIDATES", 3 * top_k)))
+
+def fetch_texts(ids, texts):
+    """Warn about ids the chunk store has no text for; returns the texts unchanged."""
+    missing = [idx for idx, text in zip(ids, texts) if text is None]
+    if missing:
+        logger.warning(f"FAISS ids {missing} are not in the chunk store")
+    return texts
+
+def find_clause_ids(query_embedding, top_k, nprobe=None, ef_search=None, query=None):
+    """Run the FAISS (and, with query text, BM25) search and return (chunk ids, generation)."""
+    snapshot = get_index_manager().snapshot()
+    generation = snapshot.generation
+    if snapshot.index is None:
+        logger.error(f"FAISS index not found in {get_index_manager().faiss_dir}")
+        return [], generation
+    
+    # Search the resident base index and per-document segments
+    k = candidate_count(top_k)
+    vectors = vector_hits(snapshot, query_embedding, k, nprobe, ef_search)
+    lexical = lexical_hits(snapshot, query, k) if retrieval_mode() == "hybrid" else []
+    return select_ids(vectors, lexical, top_k), generation
+
+def _shingles(text, size=3):
+    """Word trigrams of a text; texts shorter than that are one shingle."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def dedupe_clauses(clauses, threshold=None):
+    """Drop clauses that nearly repeat a better-ranked one.
+
+    Overlapping uploads and chunk overlap leave the same passage in several
+    chunks; a clause whose word-trigram Jaccard similarity to one already
+    kept reaches CLAUSE_DEDUP_THRESHOLD is dropped (0 disables this).
+    """
+    threshold = float(os.getenv("CLAUSE_DEDUP_THRESHOLD", 0.8)) if threshold is None else threshold
+    if threshold <= 0:
+        return list(clauses)
+    kept, kept_shingles = [], []
+    for clause in clauses:
+        shingles = _shingles(clause)
+        if any(len(shingles & other) >= threshold * len(shingles | other) for other in kept_shingles):
+            continue
+        kept.append(clause)
+        kept_shingles.append(shingles)
+    if len(kept) < len(clauses):
+        logger.info(f"Dropped {len(clauses) - len(kept)} near-duplicate clauses")
+    return kept
+
+def filter_clauses(texts, top_k):
+    """Keep fetched chunk texts that mention a coverage term, without near-duplicates, best first."""
+    clauses = [
+        clause for clause in texts
+        if clause and any(term in clause.lower() for term in CLAUSE_TERMS)
+    ]
+    return dedupe_clauses(clauses)[:top_k]
+
+def search_clauses(query_embedding, top_k, nprobe=None, ef_search=None, query=None):
+    """Search for relevant clauses using FAISS with similarity threshold, fused with BM25 when query text is given."""
+    clauses, _ = search_clauses_with_generation(query_embedding, top_k, nprobe, ef_search, query)
+    return clauses
+
+def search_clauses_with_generation(query_embedding, top_k, nprobe=None, ef_search=None, query=None):
+    """Search for relevant clauses and return them with the index generation that served them."""
+    generation = 0
+    try:
+        logger.info(f"Searching for top {top_k} clauses")
+        ids, generation = find_clause_ids(query_embedding, top_k, nprobe, ef_search, query)
+        with timed("chunk_fetch"):
+            texts = fetch_texts(ids, get_chunk_store().get(ids))
+        clauses = filter_clauses(texts, top_k)
+        logger.info(f"Retrieved {len(clauses)} relevant clauses from index generation {generation}")
+        return clauses, generation
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}", exc_info=True)
+        return [], generation
+
+async def search_clauses_async(query_embedding, top_k, nprobe=None, ef_search=None, query=None):
+    """Async variant: FAISS and BM25 run side by side on the worker pool, then texts come from the chunk store."""
+    generation = 0
     try:
         logger.info(f"Searching for top {top_k} clauses")
-        clauses = []
-        faiss_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "faiss_index"))
-        faiss_path = os.path.join(faiss_dir, "index.faiss")
-        
-        if not os.path.exists(faiss_path):
-            logger.error(f"FAISS index not found at {faiss_path}")
-            return clauses
-        
-        # Load FAISS index
-        index = faiss.read_index(faiss_path)
-        query_embedding = query_embedding.reshape(1, -1).astype(np.float32)
-        distances, indices = index.search(query_embedding, top_k)
-        
-        # Initialize model for clause embeddings
-        model = get_model()
-        similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", 0.6))
-        
-        # Retrieve and filter clauses
-        for idx, distance in zip(indices[0], distances[0]):
-            for key in redis_client.keys("doc_*:*"):
-                if f":{idx}" in key:
-                    clause = redis_client.get(key)
-                    if clause:
-                        # Compute cosine similarity
-                        clause_embedding = model.encode(clause, convert_to_numpy=True)
-                        cosine_sim = np.dot(query_embedding, clause_embedding.T) / (
-                            np.linalg.norm(query_embedding) * np.linalg.norm(clause_embedding)
-                        )
-                        if cosine_sim >= similarity_threshold and any(
-                            term in clause.lower() for term in ["hospitalization", "treatment", "surgery", "insured", "waiting period"]
-                        ):
-                            clauses.append(clause)
-        
-        logger.info(f"Retrieved {len(clauses)} relevant clauses")
-        return clauses[:top_k]
+        # snapshot() may reload index files, so it stays off the event loop too
+        snapshot = await run_in_worker(get_index_manager().snapshot)
+        generation = snapshot.generation
+        if snapshot.index is None:
+            logger.error(f"FAISS index not found in {get_index_manager().faiss_dir}")
+            return [], generation
+        k = candidate_count(top_k)
+        searches = [run_in_worker(vector_hits, snapshot, query_embedding, k, nprobe, ef_search)]
+        if query and retrieval_mode() == "hybrid":
+            searches.append(run_in_worker(lexical_hits, snapshot, query, k))
+        vectors, *lexical = await asyncio.gather(*searches)
+        ids = select_ids(vectors, lexical[0] if lexical else [], top_k)
+        with timed("chunk_fetch"):
+            texts = fetch_texts(ids, await get_chunk_store().get_async(ids))
+        clauses = filter_clauses(texts, top_k)
+        logger.info(f"Retrieved {len(clauses)} relevant clauses from index generation {generation}")
+        return clauses, generation
     except Exception as e:
         logger.error(f"Search error: {str(e)}", exc_info=True)
-        return []
\ No newline at end of file
+        return [], generation
+
+async def search_clauses_batch_async(query_embeddings, queries, top_k, nprobe=None, ef_search=None):
+    """Batch search: one multi-row FAISS search, BM25 alongside it, and one chunk store lookup for every query's chunks.
+
+    Returns (list of clause lists in query order, index generation).
+    """
+    generation = 0
+    try:
+        snapshot = await run_in_worker(get_index_manager().snapshot)
+        generation = snapshot.generation
+        if snapshot.index is None:
+            logger.error(f"FAISS index not found in {get_index_manager().faiss_dir}")
+            return [[] for _ in queries], generation
+        k = candidate_count(top_k)
+        searches = [run_in_worker(vector_hits_batch, snapshot, query_embeddings, k, nprobe, ef_search)]
+        if retrieval_mode() == "hybrid":
+            searches.append(run_in_worker(lexical_hits_batch, snapshot, queries, k))
+        vectors, *lexical = await asyncio.gather(*searches)
+        lexical = lexical[0] if lexical else [[] for _ in queries]
+        ids = [select_ids(v, l, top_k) for v, l in zip(vectors, lexical)]
+        unique_ids = list(dict.fromkeys(idx for row in ids for idx in row))
+        with timed("chunk_fetch"):
+            texts = dict(zip(unique_ids, fetch_texts(unique_ids, await get_chunk_store().get_async(unique_ids))))
+        results = [filter_clauses([texts[idx] for idx in row], top_k) for row in ids]
+        logger.info(f"Retrieved clauses for {len(queries)} queries from index generation {generation}")
+        return results, generation
+    except Exception as e:
+        logger.error(f"Batch search error: {str(e)}", exc_info=True)
+        return [[] for _ in queries], generation
@@ -0,0 +1,29 @@
+import fakeredis
+from backend.modules.chunk_store import CachedChunkStore, MmapChunkStore
+
+
+def test_cache_reads_through_and_drops_rewritten_chunks(tmp_path):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    store = CachedChunkStore(MmapChunkStore(str(tmp_path), refresh_interval=0), redis_client, ttl=60)
+    store.put("a_pdf", [1, 2], ["first", "second"])
+
+    assert store.get([1, 2, 3]) == ["first", "second", None]
+    assert redis_client.get("chunk:1") == "first"
+    assert 0 < redis_client.ttl("chunk:1") <= 60
+
+    store.put("a_pdf", [1], ["rewritten"])
+    assert redis_client.get("chunk:1") is None
+    assert store.get([1]) == ["rewritten"]
+
+    assert store.delete_doc("a_pdf", keep_ids=[2]) == 1
+    assert store.get([1, 2]) == [None, "second"]
+
+
+def test_cache_falls_back_to_the_store_when_redis_is_down(tmp_path):
+    server = fakeredis.FakeServer()
+    redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    store = CachedChunkStore(MmapChunkStore(str(tmp_path), refresh_interval=0), redis_client)
+    store.put("a_pdf", [5], ["clause"])
+    server.connected = False
+
+    assert store.get([5]) == ["clause"]
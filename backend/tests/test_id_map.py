@@ -0,0 +1,62 @@
+import faiss
+import fakeredis
+import numpy as np
+import pytest
+from backend.modules import doc_processor
+from backend.modules.chunk_store import MmapChunkStore
+from backend.modules.id_map import ChunkIdMap, allocate_ids
+from backend.modules.index_manager import IndexManager
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(doc_processor, "redis_client", client)
+    return client
+
+
+def ingest(manager, store, doc_id, texts):
+    """The id allocation, store and index steps of process_document, without the models."""
+    snapshot = manager.refresh(force=True)
+    ids = doc_processor.allocate_chunk_ids(snapshot, store, len(texts))
+    store.put(doc_id, ids, texts)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    vectors = np.random.default_rng(len(texts)).random((len(texts), 4)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    index.add_with_ids(vectors, ids)
+    id_map = ChunkIdMap()
+    id_map.add(doc_id, ids, np.arange(len(texts)), np.zeros(len(texts)), np.ones(len(texts)))
+    manager.add_document(doc_id, index, id_map)
+    return ids
+
+
+def test_ids_do_not_collide_after_redis_flush(tmp_path, redis_client):
+    manager = IndexManager(str(tmp_path / "faiss" / "index.faiss"), refresh_interval=0)
+    store = MmapChunkStore(str(tmp_path / "chunks"), refresh_interval=0)
+    first = ingest(manager, store, "a_pdf", [f"clause a{i}" for i in range(5)])
+    redis_client.flushall()
+    second = ingest(manager, store, "b_pdf", [f"clause b{i}" for i in range(5)])
+
+    assert not np.intersect1d(first, second).size
+    assert store.get(first) == [f"clause a{i}" for i in range(5)]
+    snapshot = manager.refresh(force=True)
+    assert {snapshot.lookup(idx)[0] for idx in first} == {"a_pdf"}
+    assert {snapshot.lookup(idx)[0] for idx in second} == {"b_pdf"}
+
+
+def test_ids_clear_chunk_store_after_redis_flush(tmp_path, redis_client):
+    # Texts stored for a document whose segment is not published yet must not be overwritten either
+    manager = IndexManager(str(tmp_path / "faiss" / "index.faiss"), refresh_interval=0)
+    store = MmapChunkStore(str(tmp_path / "chunks"), refresh_interval=0)
+    pending = allocate_ids(redis_client, 3)
+    store.put("pending_pdf", pending, ["x", "y", "z"])
+    redis_client.flushall()
+    fresh = doc_processor.allocate_chunk_ids(manager.snapshot(), store, 3)
+    assert fresh.min() >= pending.max() + 1
+
+
+def test_allocate_ids_is_consecutive_and_monotonic():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    assert allocate_ids(client, 3).tolist() == [0, 1, 2]
+    assert allocate_ids(client, 2, floor=1).tolist() == [3, 4]
+    assert allocate_ids(client, 2, floor=10).tolist() == [10, 11]
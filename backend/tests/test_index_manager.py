@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+import pytest
+from backend.modules.id_map import ChunkIdMap
+from backend.modules.index_manager import IndexManager
+
+
+def vectors(count, seed=0):
+    rows = np.random.default_rng(seed).random((count, 8)).astype(np.float32)
+    faiss.normalize_L2(rows)
+    return rows
+
+
+def doc_map(doc_id, ids):
+    id_map = ChunkIdMap()
+    id_map.add(doc_id, ids, np.arange(ids.size), np.zeros(ids.size), np.ones(ids.size))
+    return id_map
+
+
+def add_segment(manager, doc_id, ids):
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(8))
+    index.add_with_ids(vectors(ids.size, seed=1), ids)
+    manager.add_document(doc_id, index, doc_map(doc_id, ids))
+
+
+def test_compaction_leaves_the_published_ivf_base_untouched(tmp_path):
+    manager = IndexManager(str(tmp_path / "index.faiss"), refresh_interval=0)
+    ids = np.arange(200, dtype=np.int64)
+    base = faiss.index_factory(8, "IDMap2,IVF4,Flat", faiss.METRIC_INNER_PRODUCT)
+    base.train(vectors(200))
+    base.add_with_ids(vectors(200), ids)
+    # No vectors passed, so no sidecar: compaction has to read the vectors out of the index
+    published = manager.publish(base, doc_map("a_pdf", ids), {"type": "ivf_flat"}).base
+    add_segment(manager, "b_pdf", np.arange(200, 205, dtype=np.int64))
+
+    snapshot = manager.compact(index_type="flat")
+
+    assert faiss.downcast_index(published.index).direct_map.type == faiss.DirectMap.NoMap
+    assert snapshot.ntotal == 205
+
+
+def test_compaction_rejects_a_base_without_an_id_map(tmp_path):
+    manager = IndexManager(str(tmp_path / "index.faiss"), refresh_interval=0)
+    base = faiss.IndexFlatIP(8)
+    base.add(vectors(10))
+    manager.publish(base, doc_map("a_pdf", np.arange(10, dtype=np.int64)))
+    add_segment(manager, "b_pdf", np.arange(10, 15, dtype=np.int64))
+
+    with pytest.raises(ValueError, match="re-upload"):
+        manager.compact()
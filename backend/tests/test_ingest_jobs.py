@@ -0,0 +1,44 @@
+import os
+import time
+import fakeredis
+import pytest
+from backend.modules import ingest_jobs
+
+
+def _die(*args):
+    os._exit(1)
+
+
+@pytest.fixture
+def ingest_pool(monkeypatch):
+    monkeypatch.setenv("INGEST_WORKERS", "1")
+    monkeypatch.setenv("MODEL_WARMUP", "false")
+    ingest_jobs.shutdown_ingest_pool()
+    yield
+    ingest_jobs.shutdown_ingest_pool()
+
+
+def wait_for_job(redis_client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = redis_client.hgetall(ingest_jobs.job_key(job_id))
+        if job.get("status") in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_pool_is_replaced_after_a_worker_dies(ingest_pool, monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(ingest_jobs, "run_ingest_job", _die)
+    broken = ingest_jobs.get_ingest_pool()
+    job_id = ingest_jobs.submit_ingest_job(redis_client, "policy.pdf", "policy_pdf", "policy.pdf")
+
+    job = wait_for_job(redis_client, job_id)
+    assert job["status"] == "failed"
+    assert job["error"].startswith("Worker process died")
+
+    pool = ingest_jobs.get_ingest_pool()
+    assert pool is not broken
+    _, future = ingest_jobs._submit(abs, -3)
+    assert future.result(timeout=60) == 3
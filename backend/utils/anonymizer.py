@@ -1,10 +1,79 @@
-import spacy
 import re
+import os
+from backend.utils.models import pipe
+from dotenv import load_dotenv
 import logging
 
+load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-nlp = spacy.load("en_core_web_lg")
+
+# Insurance terms that must never be redacted, even inside an entity NER flags
+PROTECTED_TERMS = [
+    "hospitalization", "treatment", "surgery", "insured", "sum insured",
+    "waiting period", "policy", "claim", "pre-approval", "procedure"
+]
+REDACTED_LABELS = {"PERSON", "ORG", "GPE", "DATE", "NORP"}
+
+PROTECTED_PATTERN = re.compile("|".join(re.escape(term) for term in PROTECTED_TERMS))
+PLACEHOLDER_PATTERN = re.compile(r"__PROTECTED_(\d+)__")
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+PHONE_PATTERN = re.compile(r'\b(\+\d{1,3}[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b')
+
+_TERM_INDEX = {term: i for i, term in enumerate(PROTECTED_TERMS)}
+
+
+def _protect(text):
+    """Swap protected terms for placeholders so NER cannot tag them."""
+    return PROTECTED_PATTERN.sub(lambda m: f"__PROTECTED_{_TERM_INDEX[m.group(0)]}__", text)
+
+
+def _restore(text):
+    return PLACEHOLDER_PATTERN.sub(lambda m: PROTECTED_TERMS[int(m.group(1))], text)
+
+
+def _redact(text, ents):
+    """Rewrite a protected text in one pass over its entity, email and phone spans."""
+    spans = [(ent.start_char, ent.end_char, "[REDACTED]") for ent in ents if ent.label_ in REDACTED_LABELS]
+    spans += [(m.start(), m.end(), "[REDACTED_EMAIL]") for m in EMAIL_PATTERN.finditer(text)]
+    spans += [(m.start(), m.end(), "[REDACTED_PHONE]") for m in PHONE_PATTERN.finditer(text)]
+    if not spans:
+        return _restore(text)
+    # Earliest span wins; on ties the longer one, and anything overlapping it is dropped
+    spans.sort(key=lambda span: (span[0], -span[1]))
+    parts = []
+    cursor = 0
+    for start, end, replacement in spans:
+        if start < cursor:
+            continue
+        parts.append(text[cursor:start])
+        parts.append(replacement)
+        cursor = end
+    parts.append(text[cursor:])
+    return _restore("".join(parts))
+
+
+def anonymize_texts(texts, batch_size=None, n_process=None):
+    """Anonymize many texts with one batched NER pass; yields results in input order.
+
+    Only the NER component runs, over nlp.pipe batches of ANONYMIZE_BATCH_SIZE
+    texts spread across ANONYMIZE_PROCESSES processes. Each detected entity,
+    email address and phone number is replaced where it occurs; other
+    occurrences of the same string are left alone.
+    """
+    batch_size = int(os.getenv("ANONYMIZE_BATCH_SIZE", 64)) if batch_size is None else batch_size
+    n_process = int(os.getenv("ANONYMIZE_PROCESSES", 1)) if n_process is None else n_process
+    texts = list(texts)
+    try:
+        protected = [_protect(text) if text and text.strip() else "" for text in texts]
+        docs = pipe(protected, "entities", batch_size=batch_size, n_process=n_process)
+        for text, masked, doc in zip(texts, protected, docs):
+            yield _redact(masked, doc.ents) if masked else text
+        logger.info(f"Anonymized {len(texts)} texts")
+    except Exception as e:
+        logger.error(f"Anonymization error: {str(e)}", exc_info=True)
+        raise
+
 
 def anonymize_text(text):
     """Anonymize sensitive information in text while preserving key insurance terms."""
@@ -12,40 +81,7 @@ def anonymize_text(text):
         if not text or not text.strip():
             logger.error("Empty text provided for anonymization")
             return text
-        
-        # Protect insurance-specific terms
-        protected_terms = [
-            "hospitalization", "treatment", "surgery", "insured", "sum insured",
-            "waiting period", "policy", "claim", "pre-approval", "procedure"
-        ]
-        placeholders = {}
-        for i, term in enumerate(protected_terms):
-            placeholder = f"__PROTECTED_{i}__"
-            placeholders[placeholder] = term
-            text = text.replace(term, placeholder, -1)
-        
-        doc = nlp(text)
-        anonymized_text = text
-        
-        # Replace sensitive entities
-        for ent in doc.ents:
-            if ent.label_ in ["PERSON", "ORG", "GPE", "DATE", "NORP"]:
-                anonymized_text = anonymized_text.replace(ent.text, "[REDACTED]")
-        
-        # Replace email addresses
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        anonymized_text = re.sub(email_pattern, "[REDACTED_EMAIL]", anonymized_text)
-        
-        # Replace phone numbers
-        phone_pattern = r'\b(\+\d{1,3}[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b'
-        anonymized_text = re.sub(phone_pattern, "[REDACTED_PHONE]", anonymized_text)
-        
-        # Restore protected terms
-        for placeholder, term in placeholders.items():
-            anonymized_text = anonymized_text.replace(placeholder, term)
-        
-        logger.info("Text anonymized successfully")
-        return anonymized_text
+        return next(anonymize_texts([text], batch_size=1, n_process=1))
     except Exception as e:
         logger.error(f"Anonymization error: {str(e)}", exc_info=True)
-        return text
\ No newline at end of file
+        return text
@@ -1,4 +1,6 @@
-import spacy
+import re
+from collections import deque
+from backend.utils.models import get_sentencizer, pipe
 from dotenv import load_dotenv
 import os
 import logging
@@ -6,7 +8,142 @@ import logging
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-nlp = spacy.load("en_core_web_lg")
+
+SEGMENTERS = ("sentencizer", "regex", "parser")
+UNITS = ("chars", "words")
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) before whitespace, or a blank line
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n\s*\n')
+WORD = re.compile(r'\S+')
+
+
+def chunk_config(chunk_size=None, overlap=None, unit=None, segmenter=None):
+    """Resolve chunking options, falling back to the environment."""
+    unit = (unit or os.getenv("CHUNK_UNIT", "chars")).lower()
+    segmenter = (segmenter or os.getenv("CHUNK_SEGMENTER", "sentencizer")).lower()
+    if unit not in UNITS:
+        raise ValueError(f"Unknown chunk unit {unit}, expected one of {UNITS}")
+    if segmenter not in SEGMENTERS:
+        raise ValueError(f"Unknown sentence segmenter {segmenter}, expected one of {SEGMENTERS}")
+    return {
+        "size": int(os.getenv("CHUNK_SIZE", 100)) if chunk_size is None else chunk_size,
+        "overlap": int(os.getenv("CHUNK_OVERLAP", 0)) if overlap is None else overlap,
+        "unit": unit,
+        "segmenter": segmenter,
+    }
+
+
+def _regex_sentences(text):
+    """(start, end) of each sentence found by punctuation and blank lines."""
+    spans = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return spans
+
+
+def iter_sentence_spans(texts, segmenter="sentencizer", batch_size=None):
+    """Yield a list of (start, end) sentence spans for each text, in order.
+
+    spaCy segmenters stream the texts through nlp.pipe so batches are
+    tokenized together; the regex segmenter needs no model at all.
+    """
+    if segmenter == "regex":
+        for text in texts:
+            yield _regex_sentences(text)
+        return
+    batch_size = int(os.getenv("CHUNK_PIPE_BATCH", 32)) if batch_size is None else batch_size
+    docs = (get_sentencizer().pipe(texts, batch_size=batch_size) if segmenter == "sentencizer"
+            else pipe(texts, "sentences", batch_size=batch_size))
+    for doc in docs:
+        yield [(sent.start_char, sent.end_char) for sent in doc.sents]
+
+
+def _units(text, sentences, size, unit):
+    """Trim sentences to (start, end, size) units, splitting any larger than `size` at word boundaries."""
+    units = []
+    for start, end in sentences:
+        words = [m.span() for m in WORD.finditer(text, start, end)]
+        if not words:
+            continue
+        start, end = words[0][0], words[-1][1]
+        length = end - start if unit == "chars" else len(words)
+        if length <= size:
+            units.append((start, end, length))
+            continue
+        # Split long sentences
+        piece_start, piece_end, piece_size = None, None, 0
+        for word_start, word_end in words:
+            word_size = word_end - word_start if unit == "chars" else 1
+            gap = 1 if unit == "chars" and piece_start is not None else 0
+            if piece_start is not None and piece_size + gap + word_size > size:
+                units.append((piece_start, piece_end, piece_size))
+                piece_start, piece_size, gap = None, 0, 0
+            if piece_start is None:
+                piece_start = word_start
+            piece_end = word_end
+            piece_size += gap + word_size
+        units.append((piece_start, piece_end, piece_size))
+    return units
+
+
+def _pack(units, size, overlap, unit):
+    """Greedily group units into (start, end) chunks of at most `size`.
+
+    Each chunk after the first starts with the trailing units of the previous
+    one, up to `overlap` in size.
+    """
+    sep = 1 if unit == "chars" else 0
+    spans = []
+    window = []
+    total = 0
+    for start, end, length in units:
+        if window and total + sep + length > size:
+            spans.append((window[0][0], window[-1][1]))
+            # Carry over trailing units, but never the whole previous chunk
+            kept = 0
+            keep = 0
+            while keep < len(window) - 1:
+                candidate = window[-1 - keep][2] + (sep if keep else 0)
+                if kept + candidate > overlap:
+                    break
+                kept += candidate
+                keep += 1
+            window = window[len(window) - keep:] if keep else []
+            total = kept
+            # The carried-over context must leave room for the new unit
+            while window and total + sep + length > size:
+                total -= window.pop(0)[2] + (sep if window else 0)
+        total += length + (sep if window else 0)
+        window.append((start, end, length))
+    if window:
+        spans.append((window[0][0], window[-1][1]))
+    return spans
+
+
+def _chunks(text, sentences, config):
+    """(start, end, chunk) for one text; chunks are whitespace-normalised text[start:end]."""
+    units = _units(text, sentences, config["size"], config["unit"])
+    return [
+        (start, end, " ".join(text[start:end].split()))
+        for start, end in _pack(units, config["size"], config["overlap"], config["unit"])
+    ]
+
+
+def chunk_spans(text, chunk_size=None, overlap=None, unit=None, segmenter=None):
+    """Chunk text into sentence-aligned pieces and return [(start, end, chunk)].
+
+    Sizes and overlap are measured in characters or words (CHUNK_UNIT);
+    start/end are character offsets into `text`.
+    """
+    if not text or not text.strip():
+        return []
+    config = chunk_config(chunk_size, overlap, unit, segmenter)
+    sentences = next(iter_sentence_spans([text], config["segmenter"]))
+    return _chunks(text, sentences, config)
+
 
 def chunk_text(text, chunk_size=None):
     """Chunk text into sentences or fixed-size chunks."""
@@ -14,40 +151,34 @@ def chunk_text(text, chunk_size=None):
         if not text or not text.strip():
             logger.error("Empty text provided for chunking")
             return []
-        doc = nlp(text)
-        chunks = []
-        current_chunk = ""
-        chunk_size = int(os.getenv("CHUNK_SIZE", 100)) if chunk_size is None else chunk_size
-        
-        for sent in doc.sents:
-            sent_text = sent.text.strip()
-            if not sent_text:
-                continue
-            if len(sent_text) > chunk_size:
-                # Split long sentences
-                words = sent_text.split()
-                temp_chunk = ""
-                for word in words:
-                    if len(temp_chunk) + len(word) + 1 <= chunk_size:
-                        temp_chunk += word + " "
-                    else:
-                        if temp_chunk:
-                            chunks.append(temp_chunk.strip())
-                        temp_chunk = word + " "
-                if temp_chunk:
-                    chunks.append(temp_chunk.strip())
-            elif len(current_chunk) + len(sent_text) + 1 <= chunk_size:
-                current_chunk += sent_text + " "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sent_text + " "
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
+        chunks = [chunk for _, _, chunk in chunk_spans(text, chunk_size)]
         logger.info(f"Created {len(chunks)} chunks")
         return chunks
     except Exception as e:
         logger.error(f"Chunking error: {str(e)}", exc_info=True)
-        return []
\ No newline at end of file
+        return []
+
+
+def chunk_pages(pages, chunk_size=None, overlap=None, unit=None, segmenter=None):
+    """Chunk a stream of (page_no, text) pages.
+
+    Yields (page_no, offset, chunk) where offset is the character position of
+    the chunk in the document formed by joining the pages with newlines.
+    Pages are segmented in nlp.pipe batches as they arrive, so only a batch
+    of pages is held at a time.
+    """
+    config = chunk_config(chunk_size, overlap, unit, segmenter)
+    # Pages handed to the segmenter but not yet chunked, in order
+    in_flight = deque()
+
+    def texts():
+        for page_no, page_text in pages:
+            in_flight.append((page_no, page_text))
+            yield page_text
+
+    page_start = 0
+    for sentences in iter_sentence_spans(texts(), config["segmenter"]):
+        page_no, page_text = in_flight.popleft()
+        for start, _, chunk in _chunks(page_text, sentences, config):
+            yield page_no, page_start + start, chunk
+        page_start += len(page_text) + 1
@@ -0,0 +1,163 @@
+import os
+import re
+import tempfile
+import logging
+from html import unescape
+from html.parser import HTMLParser
+from dotenv import load_dotenv
+from backend.utils.ocr import ocr_enabled, ocr_image
+from backend.utils.pdf_extractor import iter_pdf_pages
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Extension -> extractor(file_path, workers) yielding (page_no, text) in page order
+_extractors = {}
+
+
+def register_extractor(extensions, extractor):
+    """Route files with any of these extensions to extractor(file_path, workers)."""
+    for extension in extensions:
+        _extractors[extension.lower()] = extractor
+
+
+def supported_extensions():
+    """File extensions that can be ingested, e.g. (".docx", ".eml", ".pdf", ...)."""
+    return tuple(sorted(_extractors))
+
+
+def iter_document_pages(file_path, workers=None):
+    """Yield (page_no, text) for every page of a supported document, in order."""
+    extension = os.path.splitext(file_path)[1].lower()
+    extractor = _extractors.get(extension)
+    if extractor is None:
+        raise ValueError(f"Unsupported file type {extension or file_path}, expected one of {supported_extensions()}")
+    return extractor(file_path, workers)
+
+
+def extract_text(file_path):
+    """Whole-document text, pages separated by blank lines."""
+    return "\n\n".join(text for _, text in iter_document_pages(file_path) if text.strip())
+
+
+def iter_docx_pages(file_path, workers=None):
+    """Pages of a Word document, split where Word broke pages; tables are read row by row in place."""
+    import docx
+    body = docx.Document(file_path).element.body
+    page_no, paragraphs, line = 1, [], []
+
+    def flush_line():
+        text = "".join(line).strip()
+        line.clear()
+        if text:
+            paragraphs.append(text)
+
+    for block in body.iterchildren():
+        if block.tag == DOCX_NS + "tbl":
+            for row in block.iter(DOCX_NS + "tr"):
+                cells = ["".join(t.text or "" for t in cell.iter(DOCX_NS + "t")).strip() for cell in row.iter(DOCX_NS + "tc")]
+                if any(cells):
+                    paragraphs.append(" | ".join(cell for cell in cells if cell))
+            continue
+        for element in block.iter():
+            if element.tag == DOCX_NS + "t":
+                line.append(element.text or "")
+            elif element.tag == DOCX_NS + "tab":
+                line.append(" ")
+            elif (element.tag == DOCX_NS + "br" and element.get(DOCX_NS + "type") == "page") \
+                    or element.tag == DOCX_NS + "lastRenderedPageBreak":
+                flush_line()
+                if paragraphs:
+                    yield page_no, "\n\n".join(paragraphs)
+                    paragraphs.clear()
+                    page_no += 1
+        flush_line()
+    if paragraphs:
+        yield page_no, "\n\n".join(paragraphs)
+
+
+class _HTMLText(HTMLParser):
+    """Collect the visible text of an HTML email body."""
+
+    SKIP = ("script", "style", "head")
+    BLOCKS = ("p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    text = unescape("".join(parser.parts))
+    return re.sub(r"\n\s*\n+", "\n\n", re.sub(r"[ \t]+", " ", text)).strip()
+
+
+def iter_eml_pages(file_path, workers=None):
+    """The message's subject and body as page 1, then the pages of each supported attachment."""
+    from email import message_from_binary_file, policy
+    with open(file_path, "rb") as f:
+        message = message_from_binary_file(f, policy=policy.default)
+    body = message.get_body(preferencelist=("plain", "html"))
+    text = body.get_content() if body is not None else ""
+    if body is not None and body.get_content_type() == "text/html":
+        text = html_to_text(text)
+    # Sender and recipients are left out: they are personal data, not policy content
+    subject = str(message["Subject"] or "").strip()
+    page_no = 1
+    yield page_no, "\n\n".join(part for part in (subject, text.strip()) if part)
+
+    for attachment in message.iter_attachments():
+        filename = os.path.basename(attachment.get_filename() or "")
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in _extractors:
+            logger.info(f"Skipping attachment {filename or attachment.get_content_type()} of {file_path}")
+            continue
+        with tempfile.TemporaryDirectory(prefix="hackrx-eml-") as workdir:
+            path = os.path.join(workdir, filename)
+            with open(path, "wb") as f:
+                f.write(attachment.get_payload(decode=True) or b"")
+            try:
+                for _, text in iter_document_pages(path, workers):
+                    page_no += 1
+                    yield page_no, text
+            except Exception as e:
+                logger.warning(f"Could not extract attachment {filename} of {file_path}: {str(e)}")
+
+
+def iter_image_pages(file_path, workers=None):
+    """OCR each frame of an image file (multi-page TIFFs have several)."""
+    if not ocr_enabled():
+        logger.warning(f"OCR is disabled, {file_path} has no text to extract")
+        return
+    from PIL import Image, ImageSequence
+    with Image.open(file_path) as image:
+        for page_no, frame in enumerate(ImageSequence.Iterator(image), start=1):
+            yield page_no, ocr_image(frame.convert("RGB"))
+
+
+register_extractor((".pdf",), iter_pdf_pages)
+register_extractor((".docx",), iter_docx_pages)
+register_extractor((".eml",), iter_eml_pages)
+register_extractor(IMAGE_EXTENSIONS, iter_image_pages)
@@ -0,0 +1,216 @@
+import contextvars
+import math
+import re
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "hackrx_"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+# Spans sub-millisecond cache hits up to multi-minute ingestion stages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Client-supplied ids end up in log lines and profile file names, so only short, plain ones are kept
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Set per request by the API middleware (or per ingestion job) and read by logs, timers and the profiler
+request_id_var = contextvars.ContextVar("request_id", default="-")
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """A named metric with optional labels, registered for /metrics on creation."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples for the exposition format."""
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from a function at scrape time.
+
+    The function returns a number, or a {label values tuple: number} dict
+    for labelled gauges.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning(f"Could not read gauge {self.name}: {str(e)}")
+            return []
+        if isinstance(value, dict):
+            return [("", tuple(str(v) for v in key), (), v) for key, v in value.items()]
+        return [("", (), (), value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                samples.append(("_bucket", key, (("le", le),), cumulative))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), cumulative))
+        return samples
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def _register(metric):
+    with _registry_lock:
+        if metric.name in _registry:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        _registry[metric.name] = metric
+
+def render_metrics():
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each query and ingestion stage", ["stage"])
+REQUEST_SECONDS = Histogram("request_seconds", "HTTP request latency by endpoint", ["endpoint"])
+REQUESTS = Counter("requests_total", "HTTP requests by endpoint and status code", ["endpoint", "status"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Query cache and LLM memo lookups", ["cache", "result"])
+LLM_CALLS = Counter(
+    "llm_calls_total",
+    "LLM consultations by outcome; timeout, error, no_budget and unusable fell back to the rule-based decision",
+    ["outcome"],
+)
+INGEST_JOBS = Counter("ingest_jobs_total", "Finished ingestion jobs by result", ["result"])
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+def start_request(request_id=None):
+    """Bind a request id and a fresh stage-timing dict to the current context; returns (id, timings).
+
+    A missing or unsafe request id is replaced by a new one.
+    """
+    if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = new_request_id()
+    request_id_var.set(request_id)
+    timings = {}
+    _stage_timings.set(timings)
+    return request_id, timings
+
+def record_stage(stage, seconds):
+    """Observe a stage duration and add it to the current request's timings, if any."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Time a block as one stage; the duration is recorded even if the block raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+class RequestIdFilter(logging.Filter):
+    """Give every log record the request id of the context it was logged from."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+def install_log_context():
+    """Prefix log lines with the request id; call once per process after logging is configured."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, RequestIdFilter) for f in handler.filters):
+            handler.addFilter(RequestIdFilter())
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Pipeline components each caller actually reads from a Doc
+SPACY_PIPES = {
+    "sentences": ("parser",),                       # chunker: doc.sents
+    "entities": ("ner",),                           # anonymizer: doc.ents
+    "query": ("tagger", "attribute_ruler", "ner"),  # query parser: ents and token.pos_
+}
+# Components no caller uses are never loaded
+SPACY_EXCLUDE = ("lemmatizer",)
+# CPU inference paths for the SentenceTransformer: PyTorch as-is, ONNX Runtime,
+# or PyTorch with Linear layers dynamically quantised to int8
+EMBEDDING_BACKENDS = ("torch", "onnx", "int8")
+
+# One copy of each model per process, shared by every module
+_nlp = None
+_sentencizer = None
+_disabled = {}
+_embedding_model = None
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+def rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Peak rather than current RSS, but the best available off Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def get_nlp():
+    """Load the spaCy pipeline (SPACY_MODEL) once per process."""
+    global _nlp
+    if _nlp is None:
+        with _lock:
+            if _nlp is None:
+                import spacy
+                name = os.getenv("SPACY_MODEL", "en_core_web_lg")
+                logger.info(f"Loading spaCy model {name}...")
+                started = time.perf_counter()
+                _nlp = spacy.load(name, exclude=list(SPACY_EXCLUDE))
+                _load_seconds["spacy"] = time.perf_counter() - started
+                logger.info(f"Loaded spaCy model {name} in {_load_seconds['spacy']:.1f}s with pipes {_nlp.pipe_names}")
+    return _nlp
+
+
+def disabled_pipes(purpose):
+    """Pipeline components a caller can skip for the given purpose."""
+    if purpose not in _disabled:
+        nlp = get_nlp()
+        needed = set(SPACY_PIPES[purpose])
+        # Keep the shared tok2vec only if one of the needed components listens to it
+        if "tok2vec" in nlp.pipe_names:
+            listeners = getattr(nlp.get_pipe("tok2vec"), "listening_components", nlp.pipe_names)
+            if needed & set(listeners):
+                needed.add("tok2vec")
+        _disabled[purpose] = [name for name in nlp.pipe_names if name not in needed]
+    return _disabled[purpose]
+
+
+def parse(text, purpose):
+    """Run the shared pipeline over one text with only the components `purpose` needs."""
+    return get_nlp()(text, disable=disabled_pipes(purpose))
+
+
+def pipe(texts, purpose, **kwargs):
+    """Stream texts through the shared pipeline with only the components `purpose` needs."""
+    return get_nlp().pipe(texts, disable=disabled_pipes(purpose), **kwargs)
+
+
+def get_sentencizer():
+    """Blank tokenizer plus rule-based sentence splitter; no statistical components."""
+    global _sentencizer
+    if _sentencizer is None:
+        with _lock:
+            if _sentencizer is None:
+                import spacy
+                started = time.perf_counter()
+                _sentencizer = spacy.blank("en")
+                _sentencizer.add_pipe("sentencizer")
+                _load_seconds["sentencizer"] = time.perf_counter() - started
+    return _sentencizer
+
+
+def embedding_backend():
+    """The configured EMBEDDING_BACKEND, validated."""
+    backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend}, expected one of {EMBEDDING_BACKENDS}")
+    return backend
+
+
+def load_embedding_model(name, backend="torch", threads=0):
+    """Build a SentenceTransformer on the given CPU backend; threads=0 keeps the library default.
+
+    Falls back to plain PyTorch if ONNX Runtime (sentence-transformers[onnx]) is not installed.
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        try:
+            import onnxruntime
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            # A pre-quantised export shipped with the model, e.g. onnx/model_qint8_avx2.onnx
+            if os.getenv("EMBEDDING_ONNX_FILE"):
+                model_kwargs["file_name"] = os.getenv("EMBEDDING_ONNX_FILE")
+            if threads:
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = threads
+                options.inter_op_num_threads = 1
+                model_kwargs["session_options"] = options
+            return SentenceTransformer(name, backend="onnx", model_kwargs=model_kwargs)
+        except ImportError as e:
+            logger.warning(f"ONNX backend unavailable ({str(e)}), using PyTorch")
+            backend = "torch"
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    if backend != "int8":
+        return SentenceTransformer(name)
+    import torch
+    model = SentenceTransformer(name, device="cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def get_embedding_model():
+    """Load the SentenceTransformer (EMBEDDING_MODEL) once per process on EMBEDDING_BACKEND."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _lock:
+            if _embedding_model is None:
+                name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+                backend = embedding_backend()
+                threads = int(os.getenv("EMBEDDING_THREADS", 0))
+                logger.info(f"Loading SentenceTransformer model {name} ({backend} backend)...")
+                started = time.perf_counter()
+                _embedding_model = load_embedding_model(name, backend, threads)
+                _load_seconds["embedding"] = time.perf_counter() - started
+                logger.info(f"Loaded SentenceTransformer model {name} in {_load_seconds['embedding']:.1f}s")
+    return _embedding_model
+
+
+def model_stats():
+    """Model load times and current RSS for this process."""
+    return {
+        "pid": os.getpid(),
+        "rss_mb": round(rss_mb(), 1),
+        "load_seconds": {name: round(seconds, 2) for name, seconds in _load_seconds.items()},
+    }
+
+
+def loaded_models():
+    """Which shared models this process has loaded so far."""
+    return {"spacy": _nlp is not None, "sentencizer": _sentencizer is not None, "embedding": _embedding_model is not None}
+
+
+def warm_up(purposes=None):
+    """Load the models and run one input through each so the first request pays no setup cost.
+
+    `purposes` limits the spaCy warm-up to some SPACY_PIPES keys; the
+    sentencizer is only loaded when "sentences" is among them.
+    """
+    purposes = tuple(SPACY_PIPES) if purposes is None else tuple(purposes)
+    started = time.perf_counter()
+    rss_before = rss_mb()
+    for purpose in purposes:
+        parse("Warm-up sentence for the policy parser.", purpose)
+    if "sentences" in purposes:
+        get_sentencizer()("Warm-up sentence for the chunker.")
+    get_embedding_model().encode("warm-up", convert_to_numpy=True)
+    stats = model_stats()
+    stats["warm_up_seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(
+        f"Models warm in process {stats['pid']} after {stats['warm_up_seconds']}s, "
+        f"RSS {rss_before:.0f} MB -> {stats['rss_mb']:.0f} MB"
+    )
+    return stats
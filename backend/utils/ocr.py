@@ -0,0 +1,35 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_tesseract_missing = False
+
+
+def ocr_enabled():
+    """Whether image-only pages and image files are run through Tesseract."""
+    return os.getenv("OCR_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def ocr_dpi():
+    """Resolution scanned PDF pages are rendered at before OCR."""
+    return int(os.getenv("OCR_DPI", 300))
+
+
+def ocr_image(image):
+    """Text Tesseract reads from a PIL image; "" if Tesseract is not installed."""
+    global _tesseract_missing
+    if _tesseract_missing:
+        return ""
+    try:
+        # Imported here so only processes that actually OCR load it
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=os.getenv("OCR_LANG", "eng")) or ""
+    except (ImportError, OSError) as e:
+        # OSError covers pytesseract.TesseractNotFoundError: the package is there but the binary is not
+        _tesseract_missing = True
+        logger.warning(f"OCR unavailable, image-only pages will be skipped: {str(e)}")
+        return ""
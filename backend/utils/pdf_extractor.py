@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from backend.utils.ocr import ocr_dpi, ocr_enabled, ocr_image
+from backend.utils.workers import ingest_workers
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def count_pages(file_path):
+    """Number of pages in a PDF."""
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(file_path, start, end):
+    """Extract [(page_no, text)] for pages start..end-1; page numbers are 1-based.
+
+    Pages with (almost) no text layer are scanned images and are OCR'd
+    instead, when OCR is enabled.
+    """
+    import pdfplumber
+    min_chars = int(os.getenv("PDF_OCR_MIN_CHARS", 20))
+    ocr = ocr_enabled()
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_no in range(start, end):
+            page = pdf.pages[page_no]
+            text = page.extract_text() or ""
+            if ocr and len(text.strip()) < min_chars:
+                text = ocr_image(page.to_image(resolution=ocr_dpi()).original) or text
+            pages.append((page_no + 1, text))
+            # pdfplumber caches parsed layout objects per page; drop them as we go
+            page.flush_cache()
+    return pages
+
+
+def iter_pdf_pages(file_path, workers=None, pages_per_task=None):
+    """Yield (page_no, text) for every page of a PDF, in page order.
+
+    Page ranges are extracted in parallel worker processes. At most
+    2 * workers ranges are in flight at a time, so memory stays bounded no
+    matter how long the document is. By default every ingestion process
+    gets an equal share of the CPUs, so INGEST_WORKERS documents extracted
+    at once do not start INGEST_WORKERS x cpu_count processes.
+    """
+    if workers is None:
+        workers = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 1) // ingest_workers())))
+    pages_per_task = int(os.getenv("PDF_PAGES_PER_TASK", 16)) if pages_per_task is None else pages_per_task
+    page_count = count_pages(file_path)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from extract_page_range(file_path, start, end)
+        return
+
+    logger.info(f"Extracting {page_count} pages from {file_path} with {workers} processes")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        next_range = iter(ranges)
+        for start, end in next_range:
+            pending.append(pool.submit(extract_page_range, file_path, start, end))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            for start, end in next_range:
+                pending.append(pool.submit(extract_page_range, file_path, start, end))
+                break
+            yield from pages
@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "profiles"))
+)
+
+
+class SamplingProfiler:
+    """Background thread that samples every thread's Python stack at a fixed interval.
+
+    Samples are kept in a bounded ring buffer, so a slow request can be
+    explained after the fact by dumping the samples taken while it ran.
+    Requests share the process, so a dump shows everything the process did
+    in that window, not just the one request.
+    """
+
+    def __init__(self, interval=None, max_samples=None):
+        self.interval = float(os.getenv("PROFILE_INTERVAL", 0.005)) if interval is None else interval
+        max_samples = int(os.getenv("PROFILE_MAX_SAMPLES", 50000)) if max_samples is None else max_samples
+        self._samples = deque(maxlen=max_samples)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            logger.info(f"Sampling profiler started at {self.interval * 1000:.1f}ms intervals")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.monotonic()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._samples.append((now, ";".join(reversed(stack))))
+
+    def collapsed(self, start, end):
+        """Samples taken between two time.monotonic() readings, as collapsed stacks for flame graphs."""
+        counts = Counter(stack for at, stack in list(self._samples) if start <= at <= end)
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    def dump(self, name, start, end, directory=PROFILE_DIR):
+        """Write the window's collapsed stacks to <directory>/<name>.folded; returns the path or None."""
+        collapsed = self.collapsed(start, end)
+        if not collapsed:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.folded")
+        with open(path, "w") as f:
+            f.write(collapsed)
+        return path
+
+
+# Started on demand; PROFILE_SLOW_REQUESTS opts in
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_profiler():
+    """Return the running sampling profiler, or None unless PROFILE_SLOW_REQUESTS is on."""
+    global _profiler
+    if os.getenv("PROFILE_SLOW_REQUESTS", "false").lower() not in ("1", "true", "yes"):
+        return None
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler()
+                _profiler.start()
+    return _profiler
+
+def stop_profiler():
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bounded pool for CPU-bound query stages (spaCy, SentenceTransformer, FAISS).
+# These release the GIL for most of their work, so threads scale with cores.
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the shared worker pool, sized by QUERY_WORKERS (default: CPU count)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.getenv("QUERY_WORKERS", os.cpu_count() or 4))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-worker")
+                logger.info(f"Started query worker pool with {workers} threads")
+    return _executor
+
+def ingest_workers():
+    """Processes in the ingestion pool, from INGEST_WORKERS (default: half the CPU count)."""
+    return int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+async def run_in_worker(func, *args, **kwargs):
+    """Run a blocking function on the worker pool without stalling the event loop.
+
+    The caller's context (request id, stage timings) goes with it.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), partial(context.run, func, *args, **kwargs))
+
+def shutdown_executor():
+    """Stop the worker pool, waiting for running stages to finish."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None